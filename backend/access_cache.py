@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Кэш прав доступа пользователей (коллекция user_access)
+- Проверка доступа синхронная, O(1), без обращения к БД
+- Инкрементальное обновление по updated_at, периодическая полная перезагрузка
+  (ловит удаленные записи)
+- Версия кэша увеличивается при каждом изменении
+- Негативный кэш отклоненных user_id с ограниченным логированием, чтобы
+  поток апдейтов от посторонних стоил микросекунды, а не строку лога каждый
+"""
+
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERSONAL_PROMPT = "Ты полезный AI-ассистент."
+
+class AccessCache:
+    """Версионированный кэш user_access с негативным кэшем"""
+
+    def __init__(
+        self,
+        admin_ids: Iterable[int] = (),
+        refresh_interval: int = 30,
+        full_reload_interval: int = 600,
+        negative_cache_size: int = 50000,
+        log_interval: int = 300
+    ):
+        self.admin_ids = frozenset(admin_ids)
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.negative_cache_size = negative_cache_size
+        self.log_interval = log_interval
+
+        self.collection = None
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.version = 0
+        self.last_updated_at: Optional[datetime] = None
+        self.last_full_reload = 0.0
+
+        # user_id -> [last logged monotonic time, suppressed rejections since]
+        self.rejected: "OrderedDict[int, list]" = OrderedDict()
+
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.suppressed_logs = 0
+        self.refreshes = 0
+        self.full_reloads = 0
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def is_allowed(self, user_id: int) -> bool:
+        """Проверить доступ (без await и без БД)"""
+        if user_id in self.users or user_id in self.admin_ids:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self._record_rejection(user_id)
+        return False
+
+    def get_role(self, user_id: int) -> Optional[str]:
+        """Роль пользователя (admin/user) или None"""
+        if user_id in self.admin_ids:
+            return "admin"
+        user = self.users.get(user_id)
+        return user["role"] if user else None
+
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.users.get(user_id)
+
+    def _record_rejection(self, user_id: int) -> None:
+        """Log the first rejection of a user per log_interval, count the rest"""
+        now = time.monotonic()
+        entry = self.rejected.get(user_id)
+
+        if entry is not None:
+            self.negative_hits += 1
+            self.rejected.move_to_end(user_id)
+            if now - entry[0] < self.log_interval:
+                entry[1] += 1
+                self.suppressed_logs += 1
+                return
+            logger.warning(
+                f"Unauthorized access attempt from user {user_id} "
+                f"({entry[1]} more since last report)"
+            )
+            entry[0] = now
+            entry[1] = 0
+            return
+
+        logger.warning(f"Unauthorized access attempt from user {user_id}")
+        self.rejected[user_id] = [now, 0]
+        if len(self.rejected) > self.negative_cache_size:
+            self.rejected.popitem(last=False)
+
+    @staticmethod
+    def _entry(user: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "username": user.get("username"),
+            "role": user.get("role", "user"),
+            "personal_prompt": user.get("personal_prompt", DEFAULT_PERSONAL_PROMPT)
+        }
+
+    def _track_updated_at(self, user: Dict[str, Any]) -> None:
+        updated_at = user.get("updated_at") or user.get("created_at")
+        if updated_at and (self.last_updated_at is None or updated_at > self.last_updated_at):
+            self.last_updated_at = updated_at
+
+    async def load(self, collection=None) -> None:
+        """Полная загрузка коллекции"""
+        if collection is not None:
+            self.collection = collection
+
+        users = {}
+        self.last_updated_at = None
+        async for user in self.collection.find({}):
+            if user.get("revoked"):
+                continue
+            users[user["user_id"]] = self._entry(user)
+            self._track_updated_at(user)
+
+        if users != self.users:
+            self.version += 1
+        self.users = users
+        # Newly added users must not stay in the negative cache
+        for user_id in users:
+            self.rejected.pop(user_id, None)
+
+        self.last_full_reload = time.monotonic()
+        self.full_reloads += 1
+
+    async def refresh(self) -> int:
+        """
+        Подтянуть записи, измененные после последней загрузки
+
+        Writers set updated_at. $gte re-reads the newest record so writes that
+        share its timestamp are not missed. Revoked users are either deleted
+        (picked up by the periodic full reload) or marked revoked=True.
+
+        Returns:
+            int: количество измененных записей
+        """
+        if time.monotonic() - self.last_full_reload >= self.full_reload_interval:
+            before = self.version
+            await self.load()
+            return int(self.version != before)
+
+        query = {}
+        if self.last_updated_at is not None:
+            query = {"$or": [
+                {"updated_at": {"$gte": self.last_updated_at}},
+                {"updated_at": {"$exists": False}, "created_at": {"$gte": self.last_updated_at}}
+            ]}
+
+        changed = 0
+        async for user in self.collection.find(query):
+            user_id = user["user_id"]
+            self._track_updated_at(user)
+            if user.get("revoked"):
+                if self.users.pop(user_id, None) is not None:
+                    changed += 1
+                continue
+
+            entry = self._entry(user)
+            if self.users.get(user_id) != entry:
+                self.users[user_id] = entry
+                self.rejected.pop(user_id, None)
+                changed += 1
+
+        self.refreshes += 1
+        if changed:
+            self.version += 1
+            logger.info(f"Access cache updated: {changed} changes, version {self.version}")
+        return changed
+
+    def start(self) -> None:
+        """Запустить фоновое обновление"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error refreshing access cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша доступа"""
+        return {
+            "version": self.version,
+            "users": len(self.users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_cache_size": len(self.rejected),
+            "negative_hits": self.negative_hits,
+            "suppressed_logs": self.suppressed_logs,
+            "refreshes": self.refreshes,
+            "full_reloads": self.full_reloads
+        }
+
+def create_access_cache(admin_ids: Iterable[int]) -> AccessCache:
+    """Создать кэш по переменным окружения"""
+    return AccessCache(
+        admin_ids=admin_ids,
+        refresh_interval=int(os.getenv("USER_ACCESS_REFRESH_INTERVAL", "30")),
+        full_reload_interval=int(os.getenv("USER_ACCESS_FULL_RELOAD_INTERVAL", "600")),
+        negative_cache_size=int(os.getenv("USER_ACCESS_NEGATIVE_CACHE_SIZE", "50000")),
+        log_interval=int(os.getenv("USER_ACCESS_LOG_INTERVAL", "300"))
+    )
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Горизонтальное масштабирование: несколько воркеров uvicorn и несколько нод
+- Состав кластера хранится в MongoDB (heartbeat), живые воркеры образуют
+  кольцо консистентного хеширования по chat_id
+- Апдейт принимает любой воркер, а обрабатывает только владелец чата
+- Апдейты передаются через коллекцию update_inbox; владелец забирает свои
+  диапазоны хешей в порядке update_id, поэтому порядок внутри чата сохраняется
+- Апдейты забираются пачкой под аренду (claimed_by/claimed_until) и удаляются
+  из inbox только после обработки; аренда продлевается heartbeat'ом, а апдейты
+  упавшего воркера после ее истечения забирает новый владелец
+- При изменении состава кластера переезжает только ~1/N чатов
+"""
+
+import asyncio
+import bisect
+import hashlib
+import os
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from update_prerouter import PreroutedUpdate
+
+logger = logging.getLogger(__name__)
+
+# Hashes are 63-bit so they fit MongoDB int64
+HASH_BITS = 63
+HASH_MAX = (1 << HASH_BITS) - 1
+
+def hash_key(key: Any) -> int:
+    """Стабильный хеш (одинаковый во всех процессах, в отличие от hash())"""
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> (64 - HASH_BITS)
+
+class ConsistentHashRing:
+    """Кольцо консистентного хеширования с виртуальными узлами"""
+
+    def __init__(self, nodes: Optional[List[str]] = None, vnodes: int = 64):
+        self.vnodes = vnodes
+        self.nodes: Tuple[str, ...] = ()
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.set_nodes(nodes or [])
+
+    def set_nodes(self, nodes: List[str]) -> bool:
+        """Перестроить кольцо; возвращает True если состав изменился"""
+        nodes = tuple(sorted(set(nodes)))
+        if nodes == self.nodes:
+            return False
+
+        points = sorted(
+            (hash_key(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(self.vnodes)
+        )
+        self.nodes = nodes
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+        return True
+
+    def owner(self, key: Any) -> Optional[str]:
+        """Владелец ключа: первая точка кольца по часовой стрелке"""
+        if not self._points:
+            return None
+        index = bisect.bisect_left(self._points, hash_key(key))
+        return self._owners[index % len(self._points)]
+
+    def ranges(self, node: str) -> List[Tuple[int, int]]:
+        """
+        Диапазоны хешей (start, end] узла
+
+        Первая точка кольца владеет и хвостом после последней точки
+        """
+        result = []
+        for index, point in enumerate(self._points):
+            if self._owners[index] != node:
+                continue
+            if index == 0:
+                result.append((-1, point))
+                if self._points[-1] < HASH_MAX:
+                    result.append((self._points[-1], HASH_MAX))
+            else:
+                result.append((self._points[index - 1], point))
+        return result
+
+class ClusterCoordinator:
+    """Членство в кластере, маршрутизация апдейтов владельцу и разбор inbox"""
+
+    def __init__(
+        self,
+        worker_id: str,
+        heartbeat_interval: float = 5.0,
+        member_ttl: float = 15.0,
+        claim_timeout: float = 60.0,
+        inbox_batch: int = 100,
+        poll_interval: float = 0.2,
+        vnodes: int = 64
+    ):
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+        self.member_ttl = member_ttl
+        self.claim_timeout = claim_timeout
+        self.inbox_batch = inbox_batch
+        self.poll_interval = poll_interval
+
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+        self.members = None
+        self.inbox = None
+        self.submit: Optional[Callable[..., bool]] = None
+
+        # Claimed by this worker and not yet handled / handled, not yet deleted
+        self._held: Set[int] = set()
+        self._acked: List[int] = []
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+        # Metrics
+        self.routed_local = 0
+        self.routed_remote = 0
+        self.consumed_total = 0
+        self.acked_total = 0
+        self.rebalances = 0
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def is_leader(self) -> bool:
+        """Лидер (для одиночных задач вроде getUpdates): наименьший живой worker_id"""
+        return bool(self.ring.nodes) and self.ring.nodes[0] == self.worker_id
+
+    def owner_of(self, chat_key: Any) -> Optional[str]:
+        return self.ring.owner(chat_key)
+
+    async def start(self, db, submit: Callable[..., bool]):
+        """
+        Зарегистрировать воркер и запустить heartbeat и разбор inbox
+
+        Args:
+            submit: постановка апдейта в локальный диспетчер
+                (chat_key, update, on_done) -> bool, как UpdateDispatcher.submit
+        """
+        if self.is_running:
+            return
+
+        self.members = db.cluster_members
+        self.inbox = db.update_inbox
+        self.submit = submit
+
+        await self.inbox.create_index([("hash", ASCENDING), ("update_id", ASCENDING)])
+        await self.inbox.create_index("claim_id", sparse=True)
+        await self._heartbeat_once()
+
+        self._tasks = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._consume_loop())
+        ]
+        logger.info(f"Cluster worker {self.worker_id} started, members: {list(self.ring.nodes)}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Остановить циклы, дождаться взятых апдейтов и выйти из кластера"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # The local dispatcher is still running: let it finish what we hold
+        deadline = asyncio.get_running_loop().time() + drain_timeout
+        while self._held and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self.inbox is not None:
+            try:
+                await self._flush_acks()
+                if self._held:
+                    # Not handled in time: hand them to the next owner right away
+                    await self.inbox.update_many(
+                        {"_id": {"$in": list(self._held)}, "claimed_by": self.worker_id},
+                        {"$set": {"claimed_by": None, "claimed_until": None}}
+                    )
+                    self._held.clear()
+            except Exception as e:
+                logger.warning(f"Could not settle claimed updates: {e}")
+
+        if self.members is not None:
+            try:
+                await self.members.delete_one({"_id": self.worker_id})
+            except Exception as e:
+                logger.warning(f"Could not leave cluster: {e}")
+        logger.info(f"Cluster worker {self.worker_id} stopped")
+
+    async def route(self, prerouted: PreroutedUpdate) -> bool:
+        """
+        Передать апдейт владельцу чата через update_inbox
+
+        Returns:
+            bool: False если апдейт не удалось сохранить
+        """
+        chat_key = prerouted.chat_id or prerouted.user_id
+        try:
+            await self.inbox.insert_one({
+                "_id": prerouted.update_id,
+                "update_id": prerouted.update_id,
+                "hash": hash_key(chat_key),
+                "kind": prerouted.kind,
+                "user_id": prerouted.user_id,
+                "chat_id": prerouted.chat_id,
+                "data": prerouted.data,
+                "claimed_by": None,
+                "claimed_until": None,
+                "created_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            # Already in the inbox, e.g. a retried webhook delivery
+            return True
+        except Exception as e:
+            logger.error(f"Error routing update {prerouted.update_id} to inbox: {e}")
+            return False
+
+        if self.owner_of(chat_key) == self.worker_id:
+            self.routed_local += 1
+            self._wakeup.set()
+        else:
+            self.routed_remote += 1
+        return True
+
+    async def _heartbeat_once(self):
+        now = datetime.utcnow()
+        await self.members.update_one(
+            {"_id": self.worker_id},
+            {"$set": {"heartbeat_at": now, "host": socket.gethostname(), "pid": os.getpid()}},
+            upsert=True
+        )
+
+        alive_since = now - timedelta(seconds=self.member_ttl)
+        members = [
+            member["_id"]
+            async for member in self.members.find({"heartbeat_at": {"$gte": alive_since}}, {"_id": 1})
+        ]
+        if self.worker_id not in members:
+            members.append(self.worker_id)
+
+        if self.ring.set_nodes(members):
+            self.rebalances += 1
+            logger.info(f"Cluster membership changed: {list(self.ring.nodes)}")
+            self._wakeup.set()
+
+    async def _renew_leases(self):
+        """Продлить аренду апдейтов, которые еще в локальном диспетчере"""
+        if not self._held:
+            return
+        await self.inbox.update_many(
+            {"_id": {"$in": list(self._held)}, "claimed_by": self.worker_id},
+            {"$set": {"claimed_until": datetime.utcnow() + timedelta(seconds=self.claim_timeout)}}
+        )
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._heartbeat_once()
+                await self._renew_leases()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cluster heartbeat failed: {e}")
+
+    def _ack(self, update_id: int) -> None:
+        """Апдейт обработан: удалить из inbox при следующем разборе"""
+        self._held.discard(update_id)
+        self._acked.append(update_id)
+        self._wakeup.set()
+
+    async def _flush_acks(self) -> None:
+        if not self._acked:
+            return
+        acked, self._acked = self._acked, []
+        try:
+            await self.inbox.delete_many({"_id": {"$in": acked}, "claimed_by": self.worker_id})
+        except Exception:
+            self._acked.extend(acked)
+            raise
+        self.acked_total += len(acked)
+
+    async def consume_once(self) -> int:
+        """
+        Забрать апдейты своих диапазонов хешей и передать в локальный диспетчер
+
+        Апдейты забираются пачкой под аренду и удаляются из inbox только после
+        обработки (on_done диспетчера), поэтому падение воркера ничего не теряет.
+
+        Returns:
+            int: количество переданных апдейтов
+        """
+        await self._flush_acks()
+
+        ranges = self.ring.ranges(self.worker_id)
+        if not ranges:
+            return 0
+
+        now = datetime.utcnow()
+        # claimed_until is null when free (or missing on documents of older versions)
+        claimable = {"$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}]}
+        query = {
+            "$and": [
+                {"$or": [{"hash": {"$gt": start, "$lte": end}} for start, end in ranges]},
+                claimable
+            ]
+        }
+
+        docs = await self.inbox.find(query, {"_id": 1}).sort("update_id", ASCENDING).limit(self.inbox_batch).to_list(self.inbox_batch)
+        if not docs:
+            return 0
+
+        # One atomic claim for the batch; another worker may hold the same range
+        # during a rebalance, so read back what this claim actually got
+        claim_id = uuid.uuid4().hex
+        await self.inbox.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}, **claimable},
+            {"$set": {
+                "claimed_by": self.worker_id,
+                "claim_id": claim_id,
+                "claimed_until": now + timedelta(seconds=self.claim_timeout)
+            }}
+        )
+        claimed = await self.inbox.find({"claim_id": claim_id}).sort("update_id", ASCENDING).to_list(None)
+
+        consumed = 0
+        for index, doc in enumerate(claimed):
+            prerouted = PreroutedUpdate(
+                update_id=doc["update_id"],
+                kind=doc["kind"],
+                user_id=doc.get("user_id"),
+                chat_id=doc.get("chat_id"),
+                data=doc["data"]
+            )
+            chat_key = prerouted.chat_id or prerouted.user_id
+
+            self._held.add(doc["_id"])
+            if not self.submit(chat_key, prerouted, lambda update_id=doc["_id"]: self._ack(update_id)):
+                # Local queue is full, give the rest back for the next round in order
+                rest = [item["_id"] for item in claimed[index:]]
+                self._held.difference_update(rest)
+                await self.inbox.update_many(
+                    {"_id": {"$in": rest}, "claim_id": claim_id},
+                    {"$set": {"claimed_by": None, "claimed_until": None}}
+                )
+                break
+
+            consumed += 1
+
+        self.consumed_total += consumed
+        return consumed
+
+    async def _consume_loop(self):
+        while True:
+            try:
+                consumed = await self.consume_once()
+                if consumed >= self.inbox_batch:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error consuming update inbox: {e}")
+
+            # Local routes wake us up right away, remote ones are picked up by polling
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кластера"""
+        return {
+            "worker_id": self.worker_id,
+            "members": list(self.ring.nodes),
+            "is_leader": self.is_leader,
+            "routed_local": self.routed_local,
+            "routed_remote": self.routed_remote,
+            "consumed_total": self.consumed_total,
+            "acked_total": self.acked_total,
+            "held": len(self._held),
+            "rebalances": self.rebalances
+        }
+
+CLUSTER_ENABLED = os.getenv("CLUSTER_ENABLED", "false").lower() == "true"
+
+# Global coordinator; WORKER_ID must be unique per process (host-pid by default)
+cluster_coordinator = ClusterCoordinator(
+    worker_id=os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}",
+    heartbeat_interval=float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", "5")),
+    member_ttl=float(os.getenv("CLUSTER_MEMBER_TTL", "15")),
+    poll_interval=float(os.getenv("CLUSTER_INBOX_POLL_INTERVAL", "0.2"))
+)
@@ -2,14 +2,17 @@
 """
 Надежная система интеграции с OpenAI API
 Реализует лучшие практики для продакшн-среды:
-- Exponential backoff retry
-- Circuit breaker pattern
-- Rate limiting
+- Exponential backoff retry (с учетом retry-after)
+- Circuit breaker отдельно для каждой модели
+- Rate limiting по заголовкам x-ratelimit-* (запросы и токены, по моделям)
+- Адаптивная конкурентность (AIMD) по моделям
 - Timeout management
 - Comprehensive error handling
 """
 
 import asyncio
+import os
+import re
 import time
 import logging
 from typing import Optional, Dict, Any, List
@@ -20,84 +23,112 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# Адаптивная конкурентность: стартовый и предельный лимит одновременных запросов к модели
+AIMD_INITIAL_LIMIT = float(os.getenv("OPENAI_AIMD_INITIAL_LIMIT", "4"))
+AIMD_MAX_LIMIT = float(os.getenv("OPENAI_AIMD_MAX_LIMIT", "32"))
+# Не чаще одного уменьшения за этот интервал: 429 от одной пачки запросов считаются одним сигналом
+AIMD_DECREASE_INTERVAL = 1.0
+# Доля остатка лимита, при которой рост конкурентности останавливается
+HEADROOM_FRACTION = 0.1
+# Дольше этого ожидание окна лимита не длится за один раз
+MAX_RATE_WAIT = 60.0
+
+# Оценка токенов, когда точное число неизвестно
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 800
+DEFAULT_COMPLETION_TOKENS = 1000
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Секунды из заголовка x-ratelimit-reset-* ("1s", "6m0s", "20ms")"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Секунды из retry-after-ms / retry-after"""
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        value = headers.get(name)
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> int:
+    """Грубая оценка токенов запроса: текст / 4 + изображения + ответ"""
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // CHARS_PER_TOKEN
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += len(part.get("text", "")) // CHARS_PER_TOKEN
+                else:
+                    tokens += IMAGE_TOKENS
+    return tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
 class CircuitBreakerState(Enum):
     CLOSED = "closed"    # Normal operation
     OPEN = "open"        # Failing, all requests rejected
     HALF_OPEN = "half_open"  # Testing if service recovered
 
-class OpenAIReliabilityManager:
-    """Менеджер надежности для OpenAI API с circuit breaker и retry логикой"""
-    
-    def __init__(self):
-        # Circuit breaker settings
-        self.failure_threshold = 5  # Failures before opening circuit
-        self.recovery_timeout = 60  # Seconds before trying to recover
-        self.success_threshold = 3  # Successes needed to close circuit
-        
-        # Current state
+class CircuitBreaker:
+    """Circuit breaker одной модели"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60, success_threshold: int = 3):
+        self.failure_threshold = failure_threshold  # Failures before opening circuit
+        self.recovery_timeout = recovery_timeout  # Seconds before trying to recover
+        self.success_threshold = success_threshold  # Successes needed to close circuit
+
         self.state = CircuitBreakerState.CLOSED
         self.failure_count = 0
         self.success_count = 0
         self.last_failure_time = 0
-        
-        # Rate limiting
-        self.request_count = 0
-        self.request_window_start = time.time()
-        self.max_requests_per_minute = 50  # Conservative limit
-        
-        # Retry settings
-        self.max_retries = 3
-        self.base_delay = 1  # Base delay in seconds
-        self.max_delay = 16  # Maximum delay in seconds
-        
-        # Timeout settings
-        self.default_timeout = 30  # seconds
-        
-    def _should_allow_request(self) -> bool:
-        """Проверить, можно ли выполнить запрос (circuit breaker logic)"""
-        current_time = time.time()
-        
-        if self.state == CircuitBreakerState.CLOSED:
-            return True
-        elif self.state == CircuitBreakerState.OPEN:
-            if current_time - self.last_failure_time > self.recovery_timeout:
+
+    def allow_request(self) -> bool:
+        """Проверить, можно ли выполнить запрос"""
+        if self.state == CircuitBreakerState.OPEN:
+            if time.time() - self.last_failure_time > self.recovery_timeout:
                 self.state = CircuitBreakerState.HALF_OPEN
                 self.success_count = 0
                 logger.info("Circuit breaker moving to HALF_OPEN state")
                 return True
             return False
-        elif self.state == CircuitBreakerState.HALF_OPEN:
-            return True
-        
-        return False
-    
-    def _is_rate_limited(self) -> bool:
-        """Проверить rate limiting"""
-        current_time = time.time()
-        
-        # Reset window if needed
-        if current_time - self.request_window_start > 60:
-            self.request_count = 0
-            self.request_window_start = current_time
-        
-        return self.request_count >= self.max_requests_per_minute
-    
-    def _record_success(self):
-        """Записать успешный запрос"""
+        return True
+
+    def record_success(self):
         self.failure_count = 0
-        self.request_count += 1
-        
         if self.state == CircuitBreakerState.HALF_OPEN:
             self.success_count += 1
             if self.success_count >= self.success_threshold:
                 self.state = CircuitBreakerState.CLOSED
                 logger.info("Circuit breaker CLOSED - service recovered")
-    
-    def _record_failure(self):
-        """Записать неудачный запрос"""
+
+    def record_failure(self):
         self.failure_count += 1
         self.last_failure_time = time.time()
-        
+
         if self.state == CircuitBreakerState.CLOSED:
             if self.failure_count >= self.failure_threshold:
                 self.state = CircuitBreakerState.OPEN
@@ -105,65 +136,323 @@ class OpenAIReliabilityManager:
         elif self.state == CircuitBreakerState.HALF_OPEN:
             self.state = CircuitBreakerState.OPEN
             logger.warning("Circuit breaker back to OPEN - test request failed")
-    
-    async def _retry_with_backoff(self, func, *args, **kwargs):
-        """Выполнить функцию с exponential backoff retry"""
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failure_count": self.failure_count,
+            "success_count": self.success_count,
+            "last_failure_time": self.last_failure_time
+        }
+
+class ModelRateLimiter:
+    """
+    Лимиты запросов и токенов одной модели по заголовкам ответов
+
+    Заголовки x-ratelimit-remaining-* / reset-* приходят с каждым ответом и
+    задают остаток окна; между ответами остаток уменьшается локально на
+    отправленные запросы. retry-after блокирует модель целиком.
+    """
+
+    def __init__(self):
+        self.requests_limit: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_limit: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+        self.updated_at = 0.0
+
+    def update_from_headers(self, headers) -> None:
+        if headers is None:
+            return
+        now = time.monotonic()
+
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        if remaining_requests is not None:
+            self.requests_limit = _header_int(headers, "x-ratelimit-limit-requests") or self.requests_limit
+            self.remaining_requests = remaining_requests
+            self.requests_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 0)
+            self.updated_at = now
+
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            self.tokens_limit = _header_int(headers, "x-ratelimit-limit-tokens") or self.tokens_limit
+            self.remaining_tokens = remaining_tokens
+            self.tokens_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+            self.updated_at = now
+
+        retry_after = parse_retry_after(headers)
+        if retry_after:
+            self.block_for(retry_after)
+
+    def block_for(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        """Сколько ждать до отправки запроса (0 - можно сейчас)"""
+        now = time.monotonic()
+        wait = max(self.blocked_until - now, 0.0)
+
+        if now >= self.requests_reset_at:
+            self.remaining_requests = None  # Окно сбросилось, остаток неизвестен до следующего ответа
+        elif self.remaining_requests is not None and self.remaining_requests <= 0:
+            wait = max(wait, self.requests_reset_at - now)
+
+        if now >= self.tokens_reset_at:
+            self.remaining_tokens = None
+        elif self.remaining_tokens is not None and self.remaining_tokens < estimated_tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+
+        return wait
+
+    def consume(self, estimated_tokens: int) -> None:
+        """Учесть отправленный запрос до прихода заголовков его ответа"""
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= estimated_tokens
+
+    def has_headroom(self) -> bool:
+        """Остаток лимитов не близок к нулю (или неизвестен)"""
+        for remaining, limit in ((self.remaining_requests, self.requests_limit),
+                                 (self.remaining_tokens, self.tokens_limit)):
+            if remaining is not None and limit and remaining < limit * HEADROOM_FRACTION:
+                return False
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "requests_limit": self.requests_limit,
+            "remaining_requests": self.remaining_requests,
+            "requests_reset_in": round(max(self.requests_reset_at - now, 0.0), 2),
+            "tokens_limit": self.tokens_limit,
+            "remaining_tokens": self.remaining_tokens,
+            "tokens_reset_in": round(max(self.tokens_reset_at - now, 0.0), 2),
+            "blocked_for": round(max(self.blocked_until - now, 0.0), 2)
+        }
+
+class AdaptiveConcurrency:
+    """
+    AIMD-лимит одновременных запросов одной модели
+
+    Успешный ответ при запасе по лимитам увеличивает лимит на 1/limit
+    (примерно +1 за каждый "раунд" из limit запросов), 429 уменьшает его вдвое.
+    """
+
+    def __init__(self, initial: float = AIMD_INITIAL_LIMIT, maximum: float = AIMD_MAX_LIMIT, minimum: float = 1.0):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+        # Metrics
+        self.increases = 0
+        self.decreases = 0
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Создается в работающем event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self, headroom: bool) -> None:
+        if headroom and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.increases += 1
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self.last_decrease < AIMD_DECREASE_INTERVAL:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        self.decreases += 1
+        logger.warning(f"OpenAI concurrency limit decreased to {int(self.limit)}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
+
+class PermitStream:
+    """
+    Потоковый ответ, который держит слот AdaptiveConcurrency до закрытия
+
+    Тело потока читается уже после возврата из _retry_with_backoff; пока оно
+    идет, запрос нагружает модель и должен считаться в in_flight. Слот
+    освобождается, когда поток дочитан, оборвался или закрыт (close()).
+    """
+
+    def __init__(self, stream, concurrency: AdaptiveConcurrency):
+        self._stream = stream
+        self._concurrency = concurrency
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            await self._release()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            await self._release()
+
+    async def _release(self) -> None:
+        if not self._released:
+            self._released = True
+            await self._concurrency.release()
+
+class ModelState:
+    """Circuit breaker, лимиты и конкурентность одной модели"""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.limiter = ModelRateLimiter()
+        self.concurrency = AdaptiveConcurrency()
+
+        # Metrics
+        self.requests = 0
+        self.rate_limited = 0
+        self.rate_wait_total = 0.0
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "circuit_breaker": self.breaker.get_status(),
+            "rate_limits": self.limiter.get_status(),
+            "concurrency": self.concurrency.get_status(),
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "rate_wait_total_s": round(self.rate_wait_total, 2)
+        }
+
+class OpenAIReliabilityManager:
+    """Менеджер надежности для OpenAI API: состояние по моделям и retry логика"""
+
+    def __init__(self):
+        self.models: Dict[str, ModelState] = {}
+
+        # Retry settings
+        self.max_retries = 3
+        self.base_delay = 1  # Base delay in seconds
+        self.max_delay = 16  # Maximum delay in seconds
+
+        # Timeout settings
+        self.default_timeout = 30  # seconds
+
+    def model_state(self, model: str) -> ModelState:
+        state = self.models.get(model)
+        if state is None:
+            state = self.models[model] = ModelState()
+        return state
+
+    async def _wait_for_rate_limit(self, state: ModelState, model: str, estimated_tokens: int) -> None:
+        """Дождаться окна лимита модели"""
+        while True:
+            wait = state.limiter.wait_time(estimated_tokens)
+            if wait <= 0:
+                return
+            wait = min(wait, MAX_RATE_WAIT)
+            logger.warning(f"Rate limited on {model}, waiting {wait:.1f}s")
+            state.rate_wait_total += wait
+            await asyncio.sleep(wait)
+
+    async def _retry_with_backoff(self, func, model: str, estimated_tokens: int, /, **kwargs):
+        """
+        Выполнить запрос с exponential backoff retry
+
+        func возвращает raw response (with_raw_response): заголовки лимитов
+        читаются из него, результат - response.parse(). При stream=True
+        результат - PermitStream, слот конкурентности держится до его закрытия.
+        """
+        state = self.model_state(model)
         last_exception = None
-        
+
         for attempt in range(self.max_retries + 1):
+            # Circuit breaker check
+            if not state.breaker.allow_request():
+                raise Exception(f"Circuit breaker is OPEN for {model} - service unavailable")
+
+            await self._wait_for_rate_limit(state, model, estimated_tokens)
+
+            await state.concurrency.acquire()
+            handed_over = False
             try:
-                # Rate limiting check
-                if self._is_rate_limited():
-                    wait_time = 60 - (time.time() - self.request_window_start)
-                    logger.warning(f"Rate limited, waiting {wait_time:.1f}s")
-                    await asyncio.sleep(wait_time)
-                    self.request_count = 0
-                    self.request_window_start = time.time()
-                
-                # Circuit breaker check
-                if not self._should_allow_request():
-                    raise Exception("Circuit breaker is OPEN - service unavailable")
-                
-                # Execute the function
-                result = await func(*args, **kwargs)
-                self._record_success()
+                state.limiter.consume(estimated_tokens)
+                state.requests += 1
+                raw_response = await func(**kwargs)
+                state.limiter.update_from_headers(raw_response.headers)
+                result = raw_response.parse()
+
+                state.breaker.record_success()
+                state.concurrency.on_success(state.limiter.has_headroom())
+                if kwargs.get("stream"):
+                    result = PermitStream(result, state.concurrency)
+                    handed_over = True
                 return result
-                
+
             except openai.RateLimitError as e:
                 last_exception = e
-                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                logger.warning(f"Rate limit hit, attempt {attempt + 1}, waiting {delay}s")
-                if attempt < self.max_retries:
-                    await asyncio.sleep(delay)
-                    
-            except openai.APITimeoutError as e:
-                last_exception = e
-                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                logger.warning(f"Timeout error, attempt {attempt + 1}, waiting {delay}s")
-                if attempt < self.max_retries:
-                    await asyncio.sleep(delay)
-                    
-            except openai.APIConnectionError as e:
-                last_exception = e
-                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                logger.warning(f"Connection error, attempt {attempt + 1}, waiting {delay}s")
-                if attempt < self.max_retries:
-                    await asyncio.sleep(delay)
-                    
-            except openai.InternalServerError as e:
+                state.rate_limited += 1
+                headers = getattr(e.response, "headers", None)
+                state.limiter.update_from_headers(headers)
+                state.concurrency.on_overload()
+
+                retry_after = parse_retry_after(headers)
+                delay = retry_after if retry_after is not None else min(self.base_delay * (2 ** attempt), self.max_delay)
+                state.limiter.block_for(delay)
+                logger.warning(f"Rate limit hit on {model}, attempt {attempt + 1}, waiting {delay}s")
+                # Ожидание - в _wait_for_rate_limit следующей попытки, чтобы его видели и другие запросы
+                continue
+
+            except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as e:
                 last_exception = e
                 delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                logger.warning(f"Server error, attempt {attempt + 1}, waiting {delay}s")
+                logger.warning(f"{type(e).__name__} on {model}, attempt {attempt + 1}, waiting {delay}s")
                 if attempt < self.max_retries:
                     await asyncio.sleep(delay)
-                    
+
             except Exception as e:
                 last_exception = e
                 # Don't retry for unknown errors
                 break
-        
-        # All retries failed
-        self._record_failure()
+
+            finally:
+                if not handed_over:
+                    await state.concurrency.release()
+
+        # All retries failed; 429 is overload handled by AIMD, not an outage of the model
+        if not isinstance(last_exception, openai.RateLimitError):
+            state.breaker.record_failure()
         raise last_exception
 
 class ReliableOpenAIClient:
@@ -178,8 +467,8 @@ class ReliableOpenAIClient:
         self.reliability_manager = OpenAIReliabilityManager()
         
     async def _create_completion(self, **kwargs):
-        """Внутренний метод для создания completion"""
-        return await self.client.chat.completions.create(**kwargs)
+        """Внутренний метод для создания completion (raw response с заголовками)"""
+        return await self.client.chat.completions.with_raw_response.create(**kwargs)
         
     async def safe_chat_completion(
         self,
@@ -221,6 +510,8 @@ class ReliableOpenAIClient:
             # Execute with retry logic
             response = await self.reliability_manager._retry_with_backoff(
                 self._create_completion,
+                model,
+                estimate_tokens(messages, max_tokens),
                 **completion_params
             )
             
@@ -286,14 +577,10 @@ class ReliableOpenAIClient:
             }
     
     def get_status(self) -> Dict[str, Any]:
-        """Получить текущий статус системы надежности"""
+        """Получить текущий статус системы надежности по моделям"""
         return {
-            "circuit_breaker_state": self.reliability_manager.state.value,
-            "failure_count": self.reliability_manager.failure_count,
-            "success_count": self.reliability_manager.success_count,
-            "requests_this_minute": self.reliability_manager.request_count,
-            "rate_limit_window_start": self.reliability_manager.request_window_start,
-            "last_failure_time": self.reliability_manager.last_failure_time
+            model: state.get_status()
+            for model, state in self.reliability_manager.models.items()
         }
 
 # Глобальный экземпляр надежного клиента
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Long polling (getUpdates) как альтернатива webhook
+Для инстансов за NAT или PHP-прокси:
+- До 100 апдейтов за запрос, пачка обрабатывается пулом воркеров конкурентно
+- Апдейты идут в тот же конвейер, что и /api/webhook
+- Offset сохраняется в MongoDB, рестарт продолжает с того же места
+- Базовый URL API настраивается (можно направить на локальный фейковый API)
+"""
+
+import asyncio
+import os
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Result of the ingest callback that means "not accepted, fetch it again"
+INGEST_BUSY = "busy"
+
+class PollingRunner:
+    """Получение апдейтов через getUpdates"""
+
+    def __init__(
+        self,
+        token: str,
+        ingest: Callable[[Dict[str, Any]], Awaitable[str]],
+        api_base_url: str = "https://api.telegram.org",
+        poll_timeout: int = 30,
+        batch_limit: int = 100,
+        allowed_updates: Optional[List[str]] = None,
+        is_active: Optional[Callable[[], bool]] = None
+    ):
+        self.token = token
+        self.ingest = ingest
+        self.api_base_url = api_base_url.rstrip("/")
+        self.poll_timeout = poll_timeout
+        self.batch_limit = min(max(batch_limit, 1), 100)
+        self.allowed_updates = allowed_updates or ["message", "callback_query"]
+        # Only one process may call getUpdates; the others stand by
+        self.is_active = is_active or (lambda: True)
+
+        self.offset: Optional[int] = None
+        self.state_collection = None
+        self.state_key = f"bot_{token.split(':')[0]}" if token else "bot"
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Retry settings
+        self.base_delay = 1
+        self.max_delay = 30
+
+        # Metrics
+        self.batches_total = 0
+        self.updates_total = 0
+        self.errors_total = 0
+        self.last_batch_size = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _method_url(self, method: str) -> str:
+        return f"{self.api_base_url}/bot{self.token}/{method}"
+
+    async def _call(self, method: str, **params) -> Any:
+        """Вызвать метод Bot API и вернуть поле result"""
+        response = await self._client.post(self._method_url(method), json=params)
+        payload = response.json()
+        if not payload.get("ok"):
+            raise RuntimeError(
+                f"{method} failed ({payload.get('error_code')}): {payload.get('description')}"
+            )
+        return payload["result"]
+
+    async def _load_offset(self):
+        """Загрузить сохраненный offset"""
+        if self.state_collection is None:
+            return
+        try:
+            state = await self.state_collection.find_one({"_id": self.state_key})
+            if state:
+                self.offset = state.get("offset")
+                logger.info(f"Polling resumes from offset {self.offset}")
+        except Exception as e:
+            logger.warning(f"Could not load polling offset: {e}")
+
+    async def _save_offset(self):
+        """Сохранить offset после обработки пачки"""
+        if self.state_collection is None:
+            return
+        try:
+            await self.state_collection.update_one(
+                {"_id": self.state_key},
+                {"$set": {"offset": self.offset, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not save polling offset: {e}")
+
+    async def start(self, db=None):
+        """Запустить цикл long polling"""
+        if self.is_running:
+            return
+
+        if db is not None:
+            self.state_collection = db.polling_state
+
+        self._client = httpx.AsyncClient(timeout=self.poll_timeout + 10)
+        await self._load_offset()
+
+        # getUpdates is refused while a webhook is set
+        try:
+            await self._call("deleteWebhook", drop_pending_updates=False)
+        except Exception as e:
+            logger.warning(f"Could not delete webhook before polling: {e}")
+
+        self._task = asyncio.create_task(self._run())
+        logger.info("Long polling started")
+
+    async def stop(self):
+        """Остановить цикл и сохранить offset"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        await self._save_offset()
+        logger.info("Long polling stopped")
+
+    async def poll_once(self) -> int:
+        """
+        Получить и обработать одну пачку апдейтов
+
+        Returns:
+            int: количество принятых апдейтов
+        """
+        params = {
+            "timeout": self.poll_timeout,
+            "limit": self.batch_limit,
+            "allowed_updates": self.allowed_updates
+        }
+        if self.offset is not None:
+            params["offset"] = self.offset
+
+        updates = await self._call("getUpdates", **params)
+        self.last_batch_size = len(updates)
+        if not updates:
+            return 0
+
+        self.batches_total += 1
+
+        # Ingest is only pre-routing and enqueueing, done in order so per-chat
+        # ordering holds; the dispatcher workers process the batch concurrently.
+        # The offset advances past accepted updates only, so an update rejected
+        # by a full queue is fetched again on the next call
+        accepted = 0
+        for update_data in updates:
+            try:
+                result = await self.ingest(update_data)
+            except Exception as e:
+                logger.error(f"Error ingesting polled update: {e}")
+                result = None
+            if result == INGEST_BUSY:
+                break
+            self.offset = update_data["update_id"] + 1
+            accepted += 1
+
+        self.updates_total += accepted
+        await self._save_offset()
+        return accepted
+
+    async def _run(self):
+        """Основной цикл с exponential backoff при ошибках"""
+        attempt = 0
+        was_active = True
+        while True:
+            if not self.is_active():
+                was_active = False
+                await asyncio.sleep(self.base_delay)
+                continue
+            if not was_active:
+                # Took over from another process, continue from its offset
+                await self._load_offset()
+                was_active = True
+            
+            try:
+                fetched = await self.poll_once()
+                attempt = 0
+                if self.last_batch_size and fetched < self.last_batch_size:
+                    # Pipeline is saturated, give the workers time to drain
+                    await asyncio.sleep(self.base_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors_total += 1
+                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+                attempt += 1
+                logger.warning(f"Polling error, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить метрики polling"""
+        return {
+            "running": self.is_running,
+            "offset": self.offset,
+            "batches_total": self.batches_total,
+            "updates_total": self.updates_total,
+            "errors_total": self.errors_total,
+            "last_batch_size": self.last_batch_size
+        }
+
+def create_polling_runner(ingest: Callable[[Dict[str, Any]], Awaitable[str]],
+                          is_active: Optional[Callable[[], bool]] = None) -> PollingRunner:
+    """Создать runner по переменным окружения"""
+    return PollingRunner(
+        token=os.getenv("TELEGRAM_TOKEN", ""),
+        ingest=ingest,
+        is_active=is_active,
+        api_base_url=os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org"),
+        poll_timeout=int(os.getenv("TELEGRAM_POLL_TIMEOUT", "30")),
+        batch_limit=int(os.getenv("TELEGRAM_POLL_LIMIT", "100"))
+    )
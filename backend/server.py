@@ -32,11 +32,21 @@ sys.path.append('/app/backend')
 # Telegram Bot imports
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
 
 # Legacy imports for compatibility
 from openai_reliability import init_reliable_openai_client, get_reliable_openai_client
 from user_experience import ux_manager, feedback_collector
 from debug_system import init_debug_mode, get_debug_logger, is_debug_mode
+from update_dispatcher import update_dispatcher
+from update_dedup import update_deduplicator
+from update_prerouter import (
+    PreroutedUpdate, parse_update_body, preroute_update,
+    KIND_TEXT, KIND_PHOTO, KIND_CALLBACK_QUERY
+)
+from polling_runner import create_polling_runner, INGEST_BUSY
+from cluster import cluster_coordinator, CLUSTER_ENABLED
+from access_cache import create_access_cache
 
 # Try to import modular architecture (optional for backward compatibility)
 try:
@@ -44,6 +54,20 @@ try:
     from config.database import db_manager
     from config.constants import ADMIN_IDS
     from core.bot import bot_core
+    from core.routing import message_router
+    from core.callbacks import callback_registry
+    from core.admission import admission_controller
+    from core.write_buffer import write_buffer
+    from core.cache import cache
+    from core.llm_gateway import llm_gateway
+    from core.streaming import get_stream_stats
+    from features.message_management.snapshots import chat_snapshots
+    from config.constants import (
+        CB_CLOSE_MENU, CB_FOOD_STATS, CB_HEALTH_ADVICE, CB_HEALTH_PROFILE_MENU,
+        CB_MOVIE_MENU, CB_MOVIE_RECOMMENDATIONS, CB_MOVIE_LIST, CB_MOVIE_STATS,
+        CB_MOVIE_SEARCH, CB_TOPIC_SETTINGS_MENU, CB_TOPIC_AUTO_DELETE,
+        CB_TOPIC_AI_SETTINGS, CB_TOPIC_TAGS, CB_TOGGLE_AUTO_DELETE
+    )
     from features.food_health.handlers import FoodHealthHandlers
     from features.movie_expert.handlers import MovieExpertHandlers
     from features.message_management.handlers import MessageManagementHandlers
@@ -69,9 +93,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global variables for legacy compatibility
-group_topic_settings = {}
-user_access_list = {}
+# Versioned cache of the user_access collection, refreshed incrementally so
+# that every worker sees access changes
+access_cache = create_access_cache(ADMIN_IDS)
 
 # Initialize modular components only if available
 if MODULAR_ARCHITECTURE_AVAILABLE:
@@ -84,20 +108,79 @@ else:
     movie_expert_handlers = None
     message_management_handlers = None
 
+# Update ingress: "webhook" (default) or "polling" for instances behind NAT
+UPDATE_MODE = os.getenv("TELEGRAM_UPDATE_MODE", "webhook")
+polling_runner = None
+
+# Shared Telegram Bot (legacy mode only, modular mode uses bot_core.get_bot())
+legacy_bot = None
+
+def get_shared_bot() -> Bot:
+    """Return the single long-lived Bot of this process"""
+    global legacy_bot
+    if MODULAR_ARCHITECTURE_AVAILABLE and bot_core.get_bot():
+        return bot_core.get_bot()
+    
+    if legacy_bot is None:
+        pool_size = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", "32"))
+        legacy_bot = Bot(
+            token=os.getenv("TELEGRAM_TOKEN"),
+            base_url=f"{os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')}/bot",
+            request=HTTPXRequest(
+                connection_pool_size=pool_size,
+                pool_timeout=float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5.0")),
+                http_version=os.getenv("TELEGRAM_HTTP_VERSION", "1.1")
+            )
+        )
+    return legacy_bot
+
+class UpdateContext:
+    """Per-update context passed to handlers; carries the shared bot, the message envelope and decoded callback args"""
+    __slots__ = ("bot", "envelope", "callback_args")
+    
+    def __init__(self, bot: Bot, envelope=None):
+        self.bot = bot
+        self.envelope = envelope
+        self.callback_args = ()
+
 # MongoDB connection for legacy compatibility
 class MongoDBManager:
+    """Server-side database handle
+    
+    In modular mode this is the shared db_manager client, so the process keeps
+    a single connection pool. Legacy mode opens its own client.
+    """
     def __init__(self):
         self.client = None
         self.db = None
     
     async def connect(self):
-        if not self.client:
-            self.client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
-            self.db = self.client[os.getenv("DB_NAME", "telegram_bot_db")]
+        if self.db is None:
+            if MODULAR_ARCHITECTURE_AVAILABLE:
+                self.db = await db_manager.connect_async()
+            else:
+                self.client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+                self.db = self.client[os.getenv("DB_NAME", "telegram_bot_db")]
         return self.db
     
+    async def ping(self):
+        if MODULAR_ARCHITECTURE_AVAILABLE:
+            # Health probes share the process pool (and its metrics)
+            await db_manager.ping()
+            return
+        db = await self.connect()
+        await db.command("ping")
+    
+    def close(self):
+        if MODULAR_ARCHITECTURE_AVAILABLE:
+            db_manager.close()
+        elif self.client:
+            self.client.close()
+        self.client = None
+        self.db = None
+    
     def __getattr__(self, name):
-        if self.db:
+        if self.db is not None:
             return self.db[name]
         raise AttributeError(f"Database not connected")
 
@@ -125,30 +208,19 @@ async def init_user_access():
             logger.info("Default admin created: @Dimidiy")
         
         # Load all users into memory
-        users = db.user_access.find({})
-        async for user in users:
-            user_access_list[user["user_id"]] = {
-                "username": user["username"],
-                "role": user["role"], 
-                "personal_prompt": user.get("personal_prompt", "Ты полезный AI-ассистент.")
-            }
-            
-        logger.info(f"Loaded {len(user_access_list)} users into access system")
+        await access_cache.load(db.user_access)
+        logger.info(f"Loaded {len(access_cache)} users into access system")
         
     except Exception as e:
         logger.error(f"Error initializing user access: {str(e)}")
 
 async def is_user_allowed(user_id: int) -> bool:
     """Check if user is allowed to interact with bot"""
-    return user_id in user_access_list or user_id in ADMIN_IDS
+    return access_cache.is_allowed(user_id)
 
 async def get_user_role(user_id: int) -> str:
     """Get user role (admin/user) or None if not allowed"""
-    if user_id in ADMIN_IDS:
-        return "admin"
-    if user_id in user_access_list:
-        return user_access_list[user_id]["role"]
-    return None
+    return access_cache.get_role(user_id)
 
 async def handle_callback_query_routing(update: Update, context):
     """Route callback queries to appropriate handlers"""
@@ -158,54 +230,11 @@ async def handle_callback_query_routing(update: Update, context):
         return
         
     query = update.callback_query
-    data = query.data
     
     try:
-        # Food/Health related callbacks
-        if any(keyword in data for keyword in ["food_", "health_", "close_menu"]):
-            if "food_stats" in data:
-                await food_health_handlers.handle_food_statistics(update, context)
-            elif "health_advice" in data:
-                await food_health_handlers.handle_health_advice(update, context)
-            elif "health_profile_menu" in data or data == "health_profile_menu":
-                await food_health_handlers.handle_health_profile_menu(update, context)
-            elif "close_menu" in data:
-                await food_health_handlers.handle_close_menu(update, context)
-            else:
-                await query.answer("⚠️ Food/Health функция в разработке")
-        
-        # Movie related callbacks
-        elif any(keyword in data for keyword in ["movie_"]):
-            if "movie_menu" in data or data == "movie_menu":
-                await movie_expert_handlers.handle_movie_menu(update, context)
-            elif "movie_recommendations" in data:
-                await movie_expert_handlers.handle_movie_recommendations(update, context)
-            elif "movie_list" in data:
-                await movie_expert_handlers.handle_movie_list(update, context)
-            elif "movie_stats" in data:
-                await movie_expert_handlers.handle_movie_stats(update, context)
-            elif "movie_search" in data:
-                await movie_expert_handlers.handle_movie_search(update, context)
-            else:
-                await query.answer("⚠️ Movie функция в разработке")
-        
-        # Message management callbacks
-        elif any(keyword in data for keyword in ["topic_", "tag_", "auto_delete"]):
-            if "topic_settings_menu" in data:
-                await message_management_handlers.handle_topic_settings_menu(update, context)
-            elif "topic_auto_delete" in data:
-                await message_management_handlers.handle_auto_delete_settings(update, context)
-            elif "topic_ai_settings" in data:
-                await message_management_handlers.handle_ai_settings(update, context)
-            elif "topic_tags" in data:
-                await message_management_handlers.handle_message_tags_menu(update, context)
-            elif "toggle_auto_delete" in data:
-                await message_management_handlers.handle_toggle_auto_delete(update, context)
-            else:
-                await query.answer("⚠️ Message Management функция в разработке")
-        
-        # Legacy callbacks (for backward compatibility)
-        else:
+        # Single registry lookup by callback prefix (see core.callbacks)
+        if not await callback_registry.dispatch(update, context):
+            # Legacy callbacks (for backward compatibility)
             await handle_legacy_callback_query(update, context)
             
     except Exception as e:
@@ -228,35 +257,73 @@ if MODULAR_ARCHITECTURE_AVAILABLE:
         "message_mention": message_management_handlers.handle_message_with_bot_mention,
         "message_processing": message_management_handlers.handle_automatic_message_processing
     }
+    
+    # Callback prefixes without a handler answer "in development"
+    callback_registry.register_handlers({
+        CB_CLOSE_MENU: food_health_handlers.handle_close_menu,
+        CB_FOOD_STATS: food_health_handlers.handle_food_statistics,
+        CB_HEALTH_ADVICE: food_health_handlers.handle_health_advice,
+        CB_HEALTH_PROFILE_MENU: food_health_handlers.handle_health_profile_menu,
+        CB_MOVIE_MENU: movie_expert_handlers.handle_movie_menu,
+        CB_MOVIE_RECOMMENDATIONS: movie_expert_handlers.handle_movie_recommendations,
+        CB_MOVIE_LIST: movie_expert_handlers.handle_movie_list,
+        CB_MOVIE_STATS: movie_expert_handlers.handle_movie_stats,
+        CB_MOVIE_SEARCH: movie_expert_handlers.handle_movie_search,
+        CB_TOPIC_SETTINGS_MENU: message_management_handlers.handle_topic_settings_menu,
+        CB_TOPIC_AUTO_DELETE: message_management_handlers.handle_auto_delete_settings,
+        CB_TOPIC_AI_SETTINGS: message_management_handlers.handle_ai_settings,
+        CB_TOPIC_TAGS: message_management_handlers.handle_message_tags_menu,
+        CB_TOGGLE_AUTO_DELETE: message_management_handlers.handle_toggle_auto_delete
+    })
 else:
     bot_handlers = {
         "callback_query": handle_callback_query_routing
     }
 
+# Update kinds route_update acts on; everything else is dropped in the webhook
+if MODULAR_ARCHITECTURE_AVAILABLE:
+    ROUTED_UPDATE_KINDS = frozenset({KIND_TEXT, KIND_PHOTO, KIND_CALLBACK_QUERY})
+else:
+    ROUTED_UPDATE_KINDS = frozenset({KIND_TEXT, KIND_CALLBACK_QUERY})
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application"""
+    global polling_runner
     try:
         # Initialize legacy systems
         await mongodb_manager.connect()
         app.mongodb = mongodb_manager.db
         
+        # Shared update_id registry for redelivered updates
+        await update_deduplicator.init_storage(mongodb_manager.db)
+        
         # Initialize user access
         await init_user_access()
+        access_cache.start()
         
         # Initialize debug mode
         init_debug_mode()
         
         # Initialize reliability systems
-        init_reliable_openai_client()
+        init_reliable_openai_client(os.getenv("OPENAI_API_KEY", ""))
+        
+        # Start update processing workers
+        update_dispatcher.start(process_update)
+        
+        # Multi-worker mode: each chat is processed by its owner on the hash ring
+        if CLUSTER_ENABLED:
+            await cluster_coordinator.start(mongodb_manager.db, update_dispatcher.submit)
         
         # Validate modular settings (only if available)
         if MODULAR_ARCHITECTURE_AVAILABLE:
             if not settings.validate():
                 logger.warning("Some modular settings are invalid, using legacy configuration")
             
-            # Initialize modular database
-            db_manager.connect()
+            # Initialize modular database (Motor, nothing blocks the event loop)
+            await db_manager.connect_async()
+            # Index builds run in the background, the manifest is idempotent
+            app.index_migration = asyncio.create_task(db_manager.create_indexes())
             
             # Initialize bot core
             try:
@@ -266,11 +333,35 @@ async def startup_event():
                 for handler_name, handler_func in bot_handlers.items():
                     bot_core.register_handler(handler_name, handler_func)
                 
+                # Open pooled connections to the Bot API before traffic arrives
+                try:
+                    await bot_core.warm_up()
+                except Exception as e:
+                    logger.warning(f"Telegram connection warm-up failed: {e}")
+                
+                # Auto-deletion runs from the scheduled_messages collection
+                message_management_handlers.message_service.start_deletion_sweeper()
+                write_buffer.start()
+                chat_snapshots.start()
+                
                 logger.info("✅ Modular architecture initialized successfully")
             except Exception as e:
                 logger.warning(f"Modular bot initialization failed, using legacy mode: {e}")
         else:
             logger.info("📱 Running in legacy mode - modular features disabled")
+            try:
+                await get_shared_bot().initialize()
+            except Exception as e:
+                logger.warning(f"Telegram connection warm-up failed: {e}")
+        
+        # Long polling feeds the same pipeline as /api/webhook
+        if UPDATE_MODE == "polling":
+            # In cluster mode only the leader calls getUpdates
+            polling_runner = create_polling_runner(
+                ingest_update,
+                is_active=(lambda: cluster_coordinator.is_leader) if CLUSTER_ENABLED else None
+            )
+            await polling_runner.start(mongodb_manager.db)
         
         logger.info("🚀 Telegram Bot Server started successfully")
         if MODULAR_ARCHITECTURE_AVAILABLE:
@@ -282,83 +373,143 @@ async def startup_event():
         logger.error(f"❌ Startup error: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain pending updates and close connections before exit"""
+    if polling_runner:
+        await polling_runner.stop()
+    
+    await access_cache.stop()
+    
+    if MODULAR_ARCHITECTURE_AVAILABLE:
+        await message_management_handlers.message_service.stop_deletion_sweeper()
+        await chat_snapshots.stop()
+    
+    # Leave the ring first so other workers take over our chats
+    if cluster_coordinator.is_running:
+        await cluster_coordinator.stop()
+    
+    await update_dispatcher.stop()
+    
+    try:
+        await get_shared_bot().shutdown()
+    except Exception as e:
+        logger.warning(f"Error closing Telegram connections: {e}")
+    
+    # Last, everything above may still write to the database
+    if MODULAR_ARCHITECTURE_AVAILABLE:
+        await write_buffer.stop()
+    mongodb_manager.close()
+
+async def ingest_update(update_data: dict) -> str:
+    """Common ingress for webhook and long polling: pre-route, dedup and enqueue
+    
+    Returns the ingest status: ok, ignored, unauthorized, duplicate or busy
+    """
+    # Drop update kinds we never route before paying for anything else
+    prerouted = preroute_update(update_data, ROUTED_UPDATE_KINDS)
+    if not prerouted:
+        return "ignored"
+    
+    # Check user access (the cache rate-limits the warning per user)
+    user_id = prerouted.user_id
+    if user_id and not access_cache.is_allowed(user_id):
+        return "unauthorized"
+    
+    # Drop redeliveries of updates that are already processed or in flight
+    if not await update_deduplicator.claim(prerouted.update_id):
+        logger.info(f"Duplicate update {prerouted.update_id} ignored")
+        return "duplicate"
+    
+    # Cluster mode: hand the update to the chat owner through the inbox
+    if CLUSTER_ENABLED:
+        if not await cluster_coordinator.route(prerouted):
+            await update_deduplicator.release(prerouted.update_id)
+            return INGEST_BUSY
+        return "ok"
+    
+    # Queue the update, workers do the routing
+    chat_id = prerouted.chat_id or user_id
+    if not update_dispatcher.submit(chat_id, prerouted):
+        logger.warning(f"Update queue is full, rejecting update {prerouted.update_id}")
+        await update_deduplicator.release(prerouted.update_id)
+        return INGEST_BUSY
+    
+    return "ok"
+
 @app.post("/api/webhook")
 async def webhook_handler(request: Request):
     """Handle Telegram webhook"""
     try:
-        body = await request.body()
-        update_data = await request.json()
-        
-        # Create Update object
-        from telegram import Update
-        if MODULAR_ARCHITECTURE_AVAILABLE:
-            try:
-                update = Update.de_json(update_data, bot_core.get_bot())
-            except:
-                # Fallback to legacy handling if modular bot not available
-                logger.warning("Using legacy webhook handling")
-                return await legacy_webhook_handler(update_data)
-        else:
-            # Legacy mode - create basic bot
-            bot = Bot(token=os.getenv("TELEGRAM_TOKEN"))
-            update = Update.de_json(update_data, bot)
-        
-        if not update:
-            return {"status": "error", "message": "Invalid update"}
-        
-        # Check user access
-        user_id = None
-        if update.message:
-            user_id = update.effective_user.id
-        elif update.callback_query:
-            user_id = update.callback_query.from_user.id
-        
-        if user_id and not await is_user_allowed(user_id):
-            logger.warning(f"Unauthorized access attempt from user {user_id}")
-            return {"status": "unauthorized"}
+        # Single parse of the raw body, no Update object is built here
+        try:
+            update_data = parse_update_body(await request.body())
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
         
-        # Route the update
-        await route_update(update)
+        # Acknowledge immediately once the update is queued
+        status = await ingest_update(update_data)
+        if status == INGEST_BUSY:
+            # Non-2xx makes Telegram redeliver the update later
+            raise HTTPException(status_code=503, detail="Update queue is full")
         
-        return {"status": "ok"}
+        return {"status": status}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return {"status": "error", "message": str(e)}
 
+async def process_update(prerouted: PreroutedUpdate):
+    """Dispatcher entry point: build the Update, route it and record it as processed"""
+    try:
+        try:
+            update = Update.de_json(prerouted.data, get_shared_bot())
+        except:
+            # Fallback to legacy handling if the update can't be built
+            logger.warning("Using legacy webhook handling")
+            await legacy_webhook_handler(prerouted.data)
+            await update_deduplicator.complete(prerouted.update_id)
+            return
+        
+        if update:
+            await route_update(update)
+        await update_deduplicator.complete(prerouted.update_id)
+    except Exception:
+        await update_deduplicator.complete(prerouted.update_id, success=False)
+        raise
+
 async def route_update(update: Update):
     """Route update to appropriate handler"""
     try:
-        # Create context object
-        class Context:
-            def __init__(self):
-                if MODULAR_ARCHITECTURE_AVAILABLE:
-                    try:
-                        self.bot = bot_core.get_bot()
-                    except:
-                        # Fallback to creating bot directly
-                        self.bot = Bot(token=os.getenv("TELEGRAM_TOKEN"))
-                else:
-                    # Legacy mode
-                    self.bot = Bot(token=os.getenv("TELEGRAM_TOKEN"))
-                
-        context = Context()
+        context = UpdateContext(get_shared_bot())
         
         # Route based on update type
         if update.message:
+            # Legacy mode has no keyword routing, every text gets the basic reply
+            if not MODULAR_ARCHITECTURE_AVAILABLE:
+                if update.message.text:
+                    await handle_text_message(update, context)
+                return
+            
+            # Normalize the text once; every stage below reads the envelope
+            if update.message.text:
+                context.envelope = message_router.envelope_from_message(update.message)
+            
             # Handle automatic message processing first (for filters, auto-deletion, etc.)
-            if MODULAR_ARCHITECTURE_AVAILABLE and update.message.text and not update.message.text.startswith('/'):
+            if context.envelope and context.envelope.command is None:
                 await bot_handlers["message_processing"](update, context)
             
-            if update.message.photo and MODULAR_ARCHITECTURE_AVAILABLE:
+            if update.message.photo:
                 # Photo message - route to food analysis
                 await bot_handlers["photo"](update, context)
                 
-            elif update.message.text:
-                text = update.message.text.lower()
+            elif context.envelope:
+                envelope = context.envelope
+                route = message_router.resolve("message", envelope)
                 
-                # Check for bot mentions (only if modular architecture is available)
-                if MODULAR_ARCHITECTURE_AVAILABLE and any(mention in text for mention in ["@dmplove_bot", "@DMPlove_bot"]):
+                if route == "bot_mention":
                     response_type = await bot_handlers["message_mention"](update, context)
                     
                     # Route based on response type
@@ -369,26 +520,26 @@ async def route_update(update: Update):
                     elif response_type == "message_tags":
                         await bot_handlers["topic_settings"](update, context)
                     else:
-                        await handle_general_ai_response(update, context, text)
+                        await handle_general_ai_response(update, context, envelope.text_lower)
                 
-                # Direct commands (only if modular architecture is available)
-                elif MODULAR_ARCHITECTURE_AVAILABLE and (text.startswith('/health') or any(keyword in text for keyword in ["здоровье", "профиль"])):
+                # Direct commands
+                elif route == "health_menu":
                     await bot_handlers["health_menu"](update, context)
                     
-                elif MODULAR_ARCHITECTURE_AVAILABLE and (text.startswith('/movie') or text.startswith('/movies')):
+                elif route == "movie_menu":
                     await bot_handlers["movie_menu"](update, context)
                     
-                elif MODULAR_ARCHITECTURE_AVAILABLE and (text.startswith('/topic') or "настройки топика" in text):
+                elif route == "topic_settings":
                     await bot_handlers["topic_settings"](update, context)
                 
-                # Movie conversations (only if modular architecture is available)
-                elif MODULAR_ARCHITECTURE_AVAILABLE and any(indicator in text for indicator in ["посмотрел", "посмотрела", "оценка", "/10"]):
+                # Movie conversations
+                elif route == "movie_report":
                     await movie_expert_handlers.handle_movie_message(update, context)
                     
-                elif MODULAR_ARCHITECTURE_AVAILABLE and any(keyword in text for keyword in ["фильм", "кино", "сериал", "рекомендации"]):
-                    if any(keyword in text for keyword in ["поиск", "найди"]):
+                elif route == "movie_talk":
+                    if message_router.resolve("movie_search", envelope) == "search":
                         # Movie search
-                        search_query = text.replace("поиск", "").replace("найди", "").replace("фильм", "").strip()
+                        search_query = envelope.text_lower.replace("поиск", "").replace("найди", "").replace("фильм", "").strip()
                         if search_query:
                             await movie_expert_handlers.handle_search_query(update, context, search_query)
                     else:
@@ -407,18 +558,19 @@ async def route_update(update: Update):
 
 async def handle_text_message(update, context):
     """Handle general text messages"""
-    text = update.message.text.lower()
-    
     if MODULAR_ARCHITECTURE_AVAILABLE:
+        envelope = context.envelope or message_router.envelope_from_message(update.message)
+        hint = message_router.resolve("text_hint", envelope)
+        
         # Feature suggestions based on keywords
-        if any(keyword in text for keyword in ["еда", "калории", "питание"]):
+        if hint == "food":
             response = ("🍽️ Отправьте фото еды для анализа или используйте команду /health для профиля здоровья.\n\n"
                        "💡 Я умею:\n"
                        "• Анализировать калории и БЖУ с фото\n"
                        "• Вести профиль здоровья\n"
                        "• Давать персональные рекомендации")
                        
-        elif any(keyword in text for keyword in ["фильм", "кино", "сериал"]):
+        elif hint == "movie":
             response = ("🎬 Используйте команду /movie для работы с фильмами.\n\n"
                        "💡 Я умею:\n"
                        "• Сохранять просмотренные фильмы\n"
@@ -426,7 +578,7 @@ async def handle_text_message(update, context):
                        "• Вести статистику просмотров\n\n"
                        "Попробуйте: 'Посмотрел Интерстеллар оценка 9/10'")
                        
-        elif any(keyword in text for keyword in ["настройки", "топик", "автоудаление"]):
+        elif hint == "settings":
             response = ("⚙️ Используйте команду /topic для настроек топика.\n\n"
                        "💡 Я умею:\n"
                        "• Автоматически удалять сообщения\n"
@@ -524,24 +676,15 @@ async def health_check():
         # Check database connection
         db_status = "ok"
         try:
-            if MODULAR_ARCHITECTURE_AVAILABLE:
-                db_manager.connect()
-            else:
-                # Legacy database check
-                await mongodb_manager.connect()
+            await mongodb_manager.ping()
         except:
             db_status = "error"
         
         # Check bot status
         bot_status = "ok"
         try:
-            if MODULAR_ARCHITECTURE_AVAILABLE:
-                bot = bot_core.get_bot()
-                if not bot:
-                    bot_status = "error"
-            else:
-                # Legacy bot check
-                bot = Bot(token=os.getenv("TELEGRAM_TOKEN"))
+            if not get_shared_bot():
+                bot_status = "error"
         except:
             bot_status = "error"
         
@@ -558,6 +701,27 @@ async def health_check():
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/api/metrics")
+async def metrics_endpoint():
+    """Runtime metrics of the update pipeline"""
+    return {
+        "dispatcher": update_dispatcher.get_stats(),
+        "deduplication": update_deduplicator.get_stats(),
+        "polling": polling_runner.get_stats() if polling_runner else None,
+        "cluster": cluster_coordinator.get_stats() if CLUSTER_ENABLED else None,
+        "access": access_cache.get_stats(),
+        "database": db_manager.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "routing": message_router.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "callbacks": callback_registry.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "admission": admission_controller.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "write_buffer": write_buffer.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "cache": cache.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "chat_snapshots": chat_snapshots.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "llm": llm_gateway.get_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "streaming": get_stream_stats() if MODULAR_ARCHITECTURE_AVAILABLE else None,
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -570,7 +734,8 @@ async def root():
             "webhook": "/api/webhook",
             "test": "/api/test",
             "features": "/api/features",
-            "health": "/api/health"
+            "health": "/api/health",
+            "metrics": "/api/metrics"
         }
     }
 
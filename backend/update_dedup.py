@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Идемпотентная обработка апдейтов Telegram по update_id
+Telegram повторно доставляет апдейт, если обработчик отвечает медленно.
+Дедупликация в два уровня:
+- Ограниченный LRU в памяти процесса
+- Коллекция MongoDB с TTL индексом (переживает рестарт, общая для воркеров)
+"""
+
+import os
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATUS_IN_FLIGHT = "in_flight"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+class UpdateDeduplicator:
+    """Отсекает уже обработанные и обрабатываемые апдейты"""
+
+    def __init__(self, max_local_entries: int = 10000, ttl_seconds: int = 86400):
+        self.max_local_entries = max_local_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = None
+        self._local: "OrderedDict[int, str]" = OrderedDict()
+
+        # Metrics
+        self.claimed_total = 0
+        self.duplicates_local = 0
+        self.duplicates_shared = 0
+        self.storage_errors = 0
+
+    async def init_storage(self, db, collection_name: str = "processed_updates"):
+        """Подключить общую коллекцию и создать TTL индекс"""
+        try:
+            self.collection = db[collection_name]
+            await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+            logger.info(f"Update deduplication storage ready: {collection_name}")
+        except Exception as e:
+            self.collection = None
+            logger.error(f"Update deduplication storage unavailable, using memory only: {e}")
+
+    def _remember(self, update_id: int, status: str):
+        self._local[update_id] = status
+        self._local.move_to_end(update_id)
+        while len(self._local) > self.max_local_entries:
+            self._local.popitem(last=False)
+
+    async def claim(self, update_id: int) -> bool:
+        """
+        Захватить апдейт для обработки
+
+        Returns:
+            bool: False если апдейт уже обработан или обрабатывается
+        """
+        if update_id in self._local:
+            self._local.move_to_end(update_id)
+            self.duplicates_local += 1
+            return False
+
+        self._remember(update_id, STATUS_IN_FLIGHT)
+
+        if self.collection is not None:
+            try:
+                await self.collection.insert_one({
+                    "_id": update_id,
+                    "status": STATUS_IN_FLIGHT,
+                    "created_at": datetime.utcnow()
+                })
+            except DuplicateKeyError:
+                self.duplicates_shared += 1
+                return False
+            except Exception as e:
+                # Fail open: losing dedup is better than losing the update
+                self.storage_errors += 1
+                logger.warning(f"Update deduplication storage error: {e}")
+
+        self.claimed_total += 1
+        return True
+
+    async def complete(self, update_id: int, success: bool = True):
+        """Отметить апдейт как обработанный"""
+        status = STATUS_DONE if success else STATUS_FAILED
+        self._remember(update_id, status)
+
+        if self.collection is not None:
+            try:
+                await self.collection.update_one(
+                    {"_id": update_id},
+                    {"$set": {"status": status, "finished_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                self.storage_errors += 1
+                logger.warning(f"Update deduplication storage error: {e}")
+
+    async def release(self, update_id: int):
+        """Снять захват, чтобы повторная доставка была обработана"""
+        self._local.pop(update_id, None)
+
+        if self.collection is not None:
+            try:
+                await self.collection.delete_one({"_id": update_id, "status": STATUS_IN_FLIGHT})
+            except Exception as e:
+                self.storage_errors += 1
+                logger.warning(f"Update deduplication storage error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить метрики дедупликации"""
+        return {
+            "shared_storage": self.collection is not None,
+            "local_entries": len(self._local),
+            "claimed_total": self.claimed_total,
+            "duplicates_local": self.duplicates_local,
+            "duplicates_shared": self.duplicates_shared,
+            "storage_errors": self.storage_errors
+        }
+
+# Глобальный экземпляр дедупликатора
+update_deduplicator = UpdateDeduplicator(
+    max_local_entries=int(os.getenv("UPDATE_DEDUP_LOCAL_SIZE", "10000")),
+    ttl_seconds=int(os.getenv("UPDATE_DEDUP_TTL", "86400"))
+)
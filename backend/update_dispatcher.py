@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Очередь обработки входящих апдейтов Telegram
+Webhook только ставит апдейт в очередь и сразу отвечает 200:
+- Ограниченный пул воркеров
+- Порядок сообщений внутри одного чата сохраняется
+- Ограничение глубины очереди (backpressure)
+- Метрики глубины очереди и задержек
+"""
+
+import asyncio
+import os
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, Hashable
+
+logger = logging.getLogger(__name__)
+
+class UpdateDispatcher:
+    """Диспетчер апдейтов с пулом воркеров и очередями по чатам"""
+
+    def __init__(self, worker_count: int = 8, max_queue_size: int = 1000):
+        self.worker_count = worker_count
+        self.max_queue_size = max_queue_size
+        self.handler: Optional[Callable[[Any], Awaitable[None]]] = None
+
+        # Pending updates per chat; a chat is "scheduled" while it sits in the
+        # ready queue or is being processed, so one chat never runs in parallel
+        self._chat_queues: Dict[Hashable, deque] = {}
+        self._scheduled = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._pending = 0
+        self._in_flight = 0
+
+        # Metrics
+        self.enqueued_total = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.processing_time_total = 0.0
+        self.processing_time_max = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, handler: Callable[[Any], Awaitable[None]]):
+        """Запустить воркеры"""
+        if self.is_running:
+            return
+
+        self.handler = handler
+        self._ready = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.worker_count)
+        ]
+        logger.info(f"Update dispatcher started with {self.worker_count} workers")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Дождаться обработки очереди и остановить воркеры"""
+        if not self.is_running:
+            return
+
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._pending or self._in_flight:
+            logger.warning(f"Update dispatcher stopped with {self._pending} pending updates")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Update dispatcher stopped")
+
+    def submit(self, chat_key: Optional[Hashable], payload: Any,
+               on_done: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Поставить апдейт в очередь без ожидания
+
+        Args:
+            on_done: вызывается после обработки апдейта (и при ошибке обработчика)
+
+        Returns:
+            bool: False если очередь переполнена
+        """
+        if not self.is_running:
+            raise RuntimeError("Update dispatcher is not running")
+
+        if self._pending >= self.max_queue_size:
+            self.rejected_total += 1
+            return False
+
+        # Updates without a chat have no ordering constraints
+        if chat_key is None:
+            chat_key = object()
+
+        queue = self._chat_queues.get(chat_key)
+        if queue is None:
+            queue = self._chat_queues[chat_key] = deque()
+        queue.append((time.monotonic(), payload, on_done))
+
+        self._pending += 1
+        self.enqueued_total += 1
+
+        if chat_key not in self._scheduled:
+            self._scheduled.add(chat_key)
+            self._ready.put_nowait(chat_key)
+
+        return True
+
+    async def _worker(self, worker_id: int):
+        """Воркер: берет следующий чат и обрабатывает один апдейт из него"""
+        while True:
+            chat_key = await self._ready.get()
+            queue = self._chat_queues[chat_key]
+            enqueued_at, payload, on_done = queue.popleft()
+            self._pending -= 1
+            self._in_flight += 1
+
+            started_at = time.monotonic()
+            wait_time = started_at - enqueued_at
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+            try:
+                await self.handler(payload)
+                self.processed_total += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_total += 1
+                logger.error(f"Update dispatcher worker {worker_id} error: {e}")
+            finally:
+                processing_time = time.monotonic() - started_at
+                self.processing_time_total += processing_time
+                self.processing_time_max = max(self.processing_time_max, processing_time)
+                self._in_flight -= 1
+
+                # Re-schedule the chat at the back of the ready queue so a busy
+                # chat can't starve the others
+                if queue:
+                    self._ready.put_nowait(chat_key)
+                else:
+                    del self._chat_queues[chat_key]
+                    self._scheduled.discard(chat_key)
+
+            # Handled (or failed for good): the sender may forget the update
+            if on_done is not None:
+                try:
+                    on_done()
+                except Exception as e:
+                    logger.error(f"Update completion callback failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить метрики очереди"""
+        started = self.processed_total + self.failed_total + self._in_flight
+        return {
+            "running": self.is_running,
+            "workers": self.worker_count,
+            "queue_depth": self._pending,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self._in_flight,
+            "active_chats": len(self._chat_queues),
+            "enqueued_total": self.enqueued_total,
+            "processed_total": self.processed_total,
+            "failed_total": self.failed_total,
+            "rejected_total": self.rejected_total,
+            "avg_wait_time": round(self.wait_time_total / started, 4) if started else 0.0,
+            "max_wait_time": round(self.wait_time_max, 4),
+            "avg_processing_time": round(
+                self.processing_time_total / (self.processed_total + self.failed_total), 4
+            ) if (self.processed_total + self.failed_total) else 0.0,
+            "max_processing_time": round(self.processing_time_max, 4)
+        }
+
+# Глобальный экземпляр диспетчера
+update_dispatcher = UpdateDispatcher(
+    worker_count=int(os.getenv("UPDATE_WORKERS", "8")),
+    max_queue_size=int(os.getenv("UPDATE_QUEUE_MAX_SIZE", "1000"))
+)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Предварительная маршрутизация апдейтов по сырому JSON
+Тело webhook разбирается один раз, из словаря извлекаются user_id, chat_id
+и тип апдейта. Неподдерживаемые апдейты отбрасываются до построения
+объекта telegram.Update
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, FrozenSet
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+KIND_TEXT = "text"
+KIND_PHOTO = "photo"
+KIND_CALLBACK_QUERY = "callback_query"
+
+ALL_KINDS = frozenset({KIND_TEXT, KIND_PHOTO, KIND_CALLBACK_QUERY})
+
+@dataclass
+class PreroutedUpdate:
+    """Минимальные сведения об апдейте, извлеченные из сырого JSON"""
+    update_id: int
+    kind: str
+    user_id: Optional[int]
+    chat_id: Optional[int]
+    data: Dict[str, Any]
+
+def parse_update_body(body: bytes) -> Dict[str, Any]:
+    """Разобрать тело запроса (orjson, если установлен)"""
+    try:
+        data = _loads(body)
+    except ValueError as e:
+        raise ValueError(f"Invalid update JSON: {e}")
+
+    if not isinstance(data, dict) or "update_id" not in data:
+        raise ValueError("Invalid update payload")
+    return data
+
+def preroute_update(data: Dict[str, Any], allowed_kinds: FrozenSet[str] = ALL_KINDS) -> Optional[PreroutedUpdate]:
+    """
+    Определить тип апдейта и участников без построения Update
+
+    Returns:
+        PreroutedUpdate | None: None если апдейт не будет обрабатываться
+        (служебные сообщения, стикеры, edited_message, channel_post и т.д.)
+    """
+    message = data.get("message")
+    if message is not None:
+        if "text" in message:
+            kind = KIND_TEXT
+        elif "photo" in message:
+            kind = KIND_PHOTO
+        else:
+            return None
+
+        sender = message.get("from") or {}
+        chat = message.get("chat") or {}
+
+    elif "callback_query" in data:
+        kind = KIND_CALLBACK_QUERY
+        callback_query = data["callback_query"]
+        sender = callback_query.get("from") or {}
+        chat = (callback_query.get("message") or {}).get("chat") or {}
+
+    else:
+        return None
+
+    if kind not in allowed_kinds:
+        return None
+
+    return PreroutedUpdate(
+        update_id=data["update_id"],
+        kind=kind,
+        user_id=sender.get("id"),
+        chat_id=chat.get("id"),
+        data=data
+    )
@@ -7,7 +7,7 @@
 import asyncio
 import time
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Any
 from datetime import datetime, timedelta
 import json
 
@@ -32,11 +32,6 @@ class UserExperienceManager:
         self.user_error_counts = {}
         self.error_reset_interval = 3600  # 1 hour
         
-        # Queue management for busy periods
-        self.request_queue = asyncio.Queue()
-        self.max_queue_size = 100
-        self.processing_requests = set()
-        
     async def start_typing_indicator(self, bot, chat_id: int, user_id: int):
         """Запустить индикатор печати для длительных операций"""
         typing_key = f"{chat_id}_{user_id}"
@@ -167,20 +162,6 @@ class UserExperienceManager:
         # Show help after 3 errors of the same type
         return error_count >= 3
     
-    async def add_to_queue(self, request_data: Dict[str, Any]) -> bool:
-        """Добавить запрос в очередь обработки"""
-        if self.request_queue.qsize() >= self.max_queue_size:
-            logger.warning("Request queue is full")
-            return False
-        
-        await self.request_queue.put(request_data)
-        return True
-    
-    async def get_queue_position(self, user_id: int) -> Optional[int]:
-        """Получить позицию в очереди"""
-        # This is simplified - in real implementation you'd track user positions
-        return self.request_queue.qsize() if self.request_queue.qsize() > 0 else None
-    
     def get_user_session(self, user_id: int) -> Dict[str, Any]:
         """Получить сессию пользователя"""
         current_time = time.time()
@@ -231,15 +212,9 @@ class UserExperienceManager:
             if current_time - session["start_time"] < 3600
         )
         
-        # Queue stats
-        queue_size = self.request_queue.qsize()
-        processing_count = len(self.processing_requests)
-        
         return {
             "active_sessions": active_sessions,
             "total_requests_last_hour": total_requests,
-            "queue_size": queue_size,
-            "processing_requests": processing_count,
             "typing_indicators": len(self.typing_tasks)
         }
 
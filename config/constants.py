@@ -1,5 +1,8 @@
 """Application constants"""
 
+# Bot username (without @)
+BOT_USERNAME = "DMPlove_bot"
+
 # Admin user IDs
 ADMIN_IDS = [139373848]  # Dimidiy
 
@@ -13,6 +16,7 @@ MESSAGE_TYPE_TEXT = "text"
 MESSAGE_TYPE_PHOTO = "photo"
 MESSAGE_TYPE_DOCUMENT = "document"
 MESSAGE_TYPE_VOICE = "voice"
+MAX_MESSAGE_LENGTH = 4096  # Telegram limit for message text
 
 # Food analysis constants
 FOOD_ANALYSIS_TIMEOUT = 30  # seconds
@@ -42,6 +46,14 @@ AUTO_DELETE_TIMEOUT_DEFAULT = 300  # seconds (5 minutes)
 CACHE_KEY_USER_PROFILE = "user_profile_{user_id}"
 CACHE_KEY_FOOD_STATS = "food_stats_{user_id}_{period}"
 CACHE_KEY_MOVIE_RECOMMENDATIONS = "movie_recs_{user_id}"
+CACHE_KEY_LLM_COMPLETION = "llm_completion_{digest}"
+FOOD_STATS_PERIODS = ("today", "yesterday", "week", "month")  # cached food_stats periods
+
+# OpenAI prices, USD per 1M (input, output) tokens; used for the cost saved by the completion cache
+OPENAI_PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
 
 # Collection names
 COLLECTION_USERS = "users"
@@ -50,8 +62,52 @@ COLLECTION_MOVIES = "movies"
 COLLECTION_HEALTH_PROFILES = "health_profiles"
 COLLECTION_WORKOUTS = "workouts"
 COLLECTION_STEPS = "steps"
+COLLECTION_FITNESS_MONTHS = "fitness_months"  # per (user_id, month) steps and workouts buckets
 COLLECTION_TOPIC_SETTINGS = "topic_settings"
 COLLECTION_USER_STATES = "user_states"
+COLLECTION_MOVIE_STATS = "movie_stats"  # materialized per-user MovieStats
+COLLECTION_DAILY_NUTRITION = "daily_nutrition"  # per (user_id, day) rollup of food_analysis
+DAILY_NUTRITION_FIELDS = ("calories", "protein", "carbs", "fat")  # summed per day
+
+# Callback data prefixes (see core.callbacks for payload types)
+CB_CLOSE_MENU = "x"
+CB_FOOD_STATS = "fs"
+CB_FOOD_SEARCH = "fq"
+CB_HEALTH_PROFILE_MENU = "hp"
+CB_HEALTH_ADVICE = "ha"
+CB_HEALTH_GOALS = "hg"
+CB_HEALTH_EDIT = "he"
+CB_HEALTH_ADD = "hn"
+CB_HEALTH_STATS = "hs"
+CB_MOVIE_MENU = "mm"
+CB_MOVIE_ADD = "ma"
+CB_MOVIE_SEARCH = "mq"
+CB_MOVIE_RECOMMENDATIONS = "mr"
+CB_MOVIE_STATS = "ms"
+CB_MOVIE_LIST = "ml"
+CB_MOVIE_TOP = "mt"
+CB_MOVIE_EXPORT = "mx"
+CB_MOVIE_TRENDS = "mw"
+CB_TOPIC_SETTINGS_MENU = "tm"
+CB_TOPIC_AUTO_DELETE = "td"
+CB_TOPIC_AI_SETTINGS = "ti"
+CB_TOPIC_TAGS = "tg"
+CB_TOPIC_MODERATION = "to"
+CB_TOPIC_STATS = "ts"
+CB_TOPIC_EXPORT = "tx"
+CB_TOGGLE_AUTO_DELETE = "d1"
+CB_SET_DELETE_TIMEOUT = "d2"
+CB_TOGGLE_DELETE_BOTS = "d3"
+CB_TOGGLE_DELETE_USERS = "d4"
+CB_TOGGLE_FOOD_ANALYSIS = "a1"
+CB_TOGGLE_AI_ASSISTANT = "a2"
+CB_TOGGLE_FOOD_AUTO = "a3"
+CB_TOGGLE_AI_AUTO = "a4"
+CB_SET_CUSTOM_PROMPT = "a5"
+CB_TAG_CREATE = "g1"
+CB_TAG_SEARCH = "g2"
+CB_TAG_STATS = "g3"
+CB_TAG_MANAGE = "g4"
 
 # Bot states
 STATE_WAITING_FOOD_INPUT = "waiting_food_input"
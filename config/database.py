@@ -1,27 +1,178 @@
 import asyncio
+import threading
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 from pymongo.collection import Collection
 from pymongo.database import Database
 from typing import Optional, Dict, Any
 import logging
 from .settings import settings
+from .indexes import apply_indexes
 
 logger = logging.getLogger(__name__)
 
+def _on_event_loop_thread() -> bool:
+    """True if called from a thread that is running an asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+class LoopThreadCommandGuard(monitoring.CommandListener):
+    """Reports sync driver commands issued from the event loop thread
+
+    Motor runs pymongo in a thread pool, so its commands never trigger this;
+    a hit means a blocking round trip stalled every chat.
+    """
+    
+    def __init__(self):
+        self.violations = 0
+        self.last_violation: Optional[str] = None
+    
+    def started(self, event):
+        if _on_event_loop_thread():
+            self.violations += 1
+            self.last_violation = f"{event.database_name}.{event.command_name}"
+            logger.error(
+                f"Sync MongoDB command '{event.command_name}' ran on the event loop thread "
+                f"({threading.current_thread().name}); use get_collection_async()"
+            )
+    
+    def succeeded(self, event):
+        pass
+    
+    def failed(self, event):
+        pass
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Connection pool metrics: checkout wait time and saturation"""
+    
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        
+        self.connections_open = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.slow_checkouts = 0  # waited longer than 100 ms
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        logger.warning(f"MongoDB connection pool cleared for {event.address}")
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+    
+    def connection_check_out_started(self, event):
+        # Checkout events of one operation fire on the same thread
+        self._local.started_at = time.monotonic()
+    
+    def connection_check_out_failed(self, event):
+        reason = str(event.reason)
+        with self._lock:
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+        self._local.started_at = None
+    
+    def connection_checked_out(self, event):
+        # pymongo >= 4.7 reports the wait itself
+        wait = getattr(event, "duration", None)
+        started_at = getattr(self._local, "started_at", None)
+        if wait is None and started_at is not None:
+            wait = time.monotonic() - started_at
+        self._local.started_at = None
+        
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            if wait is not None:
+                self.wait_time_total += wait
+                self.wait_time_max = max(self.wait_time_max, wait)
+                if wait > 0.1:
+                    self.slow_checkouts += 1
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_pool_size": self.max_pool_size,
+            "connections_open": self.connections_open,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "saturation": round(self.checked_out / self.max_pool_size, 3) if self.max_pool_size else None,
+            "checkouts": self.checkouts,
+            "checkout_wait_avg_ms": round(self.wait_time_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+            "checkout_wait_max_ms": round(self.wait_time_max * 1000, 2),
+            "slow_checkouts": self.slow_checkouts,
+            "checkout_failures": dict(self.checkout_failures)
+        }
+
 class DatabaseManager:
-    """Database connection and management"""
+    """Database connection and management
+    
+    The server uses one Motor client per process (connect_async); the sync
+    client is created only by scripts that call connect().
+    """
     
     def __init__(self):
         self._client: Optional[MongoClient] = None
         self._db: Optional[Database] = None
         self._async_client: Optional[AsyncIOMotorClient] = None
         self._async_db: Optional[Database] = None
+        self.loop_guard = LoopThreadCommandGuard()
+        self.pool_metrics = PoolMetricsListener(settings.MONGO_MAX_POOL_SIZE)
+    
+    @staticmethod
+    def client_options() -> Dict[str, Any]:
+        """Pool, timeout and compression options from Settings"""
+        options = {
+            "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+            # Generated ids are stored as 16-byte binary UUIDs (subtype 4)
+            "uuidRepresentation": "standard"
+        }
+        if settings.MONGO_COMPRESSORS:
+            options["compressors"] = settings.MONGO_COMPRESSORS
+        return options
         
     def connect(self) -> Database:
-        """Connect to MongoDB (sync)"""
+        """Connect to MongoDB (sync, for scripts and threads without an event loop)"""
         if self._client is None:
-            self._client = MongoClient(settings.MONGO_URL)
+            self._client = MongoClient(
+                settings.MONGO_URL,
+                event_listeners=[self.loop_guard],
+                **self.client_options()
+            )
             self._db = self._client[settings.DB_NAME]
             logger.info(f"Connected to MongoDB: {settings.DB_NAME}")
         return self._db
@@ -29,13 +180,19 @@ class DatabaseManager:
     async def connect_async(self) -> Database:
         """Connect to MongoDB (async)"""
         if self._async_client is None:
-            self._async_client = AsyncIOMotorClient(settings.MONGO_URL)
+            self._async_client = AsyncIOMotorClient(
+                settings.MONGO_URL,
+                event_listeners=[self.pool_metrics],
+                **self.client_options()
+            )
             self._async_db = self._async_client[settings.DB_NAME]
             logger.info(f"Connected to MongoDB (async): {settings.DB_NAME}")
         return self._async_db
     
     def get_collection(self, name: str) -> Collection:
-        """Get a collection by name"""
+        """Get a collection by name (sync driver, must not be used from async code)"""
+        if settings.DB_STRICT_ASYNC and _on_event_loop_thread():
+            raise RuntimeError(f"Sync collection '{name}' requested on the event loop thread")
         db = self.connect()
         return db[name]
     
@@ -55,34 +212,30 @@ class DatabaseManager:
             self._async_client = None
             self._async_db = None
     
-    def create_indexes(self):
-        """Create database indexes for better performance"""
+    async def create_indexes(self) -> Dict[str, int]:
+        """Apply the index manifest (config/indexes.py), safe to run repeatedly"""
         try:
-            # User collection indexes
-            users_collection = self.get_collection("users")
-            users_collection.create_index("user_id", unique=True)
-            
-            # Food analysis collection indexes
-            food_collection = self.get_collection("food_analysis")
-            food_collection.create_index([("user_id", 1), ("timestamp", -1)])
-            food_collection.create_index("timestamp")
-            
-            # Movies collection indexes
-            movies_collection = self.get_collection("movies")
-            movies_collection.create_index([("user_id", 1), ("timestamp", -1)])
-            movies_collection.create_index("user_id")
-            
-            # Health profiles collection indexes
-            health_collection = self.get_collection("health_profiles")
-            health_collection.create_index("user_id", unique=True)
-            
-            # Workouts collection indexes
-            workouts_collection = self.get_collection("workouts")
-            workouts_collection.create_index([("user_id", 1), ("timestamp", -1)])
-            
-            logger.info("Database indexes created successfully")
+            db = await self.connect_async()
+            summary = await apply_indexes(db)
+            logger.info(f"Database indexes up to date: {summary}")
+            return summary
         except Exception as e:
             logger.error(f"Failed to create indexes: {e}")
+            return {}
+
+    async def ping(self) -> bool:
+        """Round trip to the server over the shared pool"""
+        db = await self.connect_async()
+        await db.command("ping")
+        return True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Database access metrics"""
+        return {
+            "pool": self.pool_metrics.get_stats(),
+            "sync_commands_on_loop": self.loop_guard.violations,
+            "last_sync_command_on_loop": self.loop_guard.last_violation
+        }
 
 # Global database manager instance
 db_manager = DatabaseManager()
\ No newline at end of file
@@ -0,0 +1,289 @@
+"""Index manifest
+
+Every query shape the services issue is registered in HOT_QUERIES, and
+INDEX_MANIFEST declares the indexes that serve them. apply_indexes() is an
+idempotent migration: it creates missing indexes, drops the obsolete ones and
+leaves everything else alone, so it is safe to run on every startup.
+
+dev_tools/check_index_plans.py runs explain() on each registered query
+against seeded data and fails on any COLLSCAN. A new query in a service
+should come with an entry here.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from pymongo.errors import OperationFailure
+from typing import Any, Dict, List, Optional, Tuple, Union
+import logging
+
+from .constants import (
+    COLLECTION_USERS, COLLECTION_FOOD_ANALYSIS, COLLECTION_MOVIES,
+    COLLECTION_HEALTH_PROFILES, COLLECTION_WORKOUTS, COLLECTION_STEPS, COLLECTION_FITNESS_MONTHS,
+    COLLECTION_TOPIC_SETTINGS, COLLECTION_DAILY_NUTRITION, COLLECTION_MOVIE_STATS
+)
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_SCHEDULED_MESSAGES = "scheduled_messages"
+COLLECTION_MESSAGE_TAGS = "message_tags"
+COLLECTION_TAGGED_MESSAGES = "tagged_messages"
+COLLECTION_MESSAGE_FILTERS = "message_filters"
+COLLECTION_CACHE_ENTRIES = "cache_entries"
+
+IndexKeys = Tuple[Tuple[str, Union[int, str]], ...]
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Index declaration"""
+    collection: str
+    keys: IndexKeys
+    unique: bool = False
+    partial_filter: Optional[Dict[str, Any]] = None
+    expire_after: Optional[int] = None  # seconds, TTL index
+
+    def options(self) -> Dict[str, Any]:
+        options = {}
+        if self.unique:
+            options["unique"] = True
+        if self.partial_filter:
+            options["partialFilterExpression"] = self.partial_filter
+        if self.expire_after is not None:
+            options["expireAfterSeconds"] = self.expire_after
+        return options
+
+@dataclass
+class QueryShape:
+    """Query issued by a service, with sample values for explain()"""
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Dict[str, int]] = None
+    source: str = ""
+
+INDEX_MANIFEST: List[IndexSpec] = [
+    # core.bot._ensure_user_exists
+    IndexSpec(COLLECTION_USERS, (("user_id", 1),), unique=True),
+
+    # food_health: statistics, search, rollups by time
+    IndexSpec(COLLECTION_FOOD_ANALYSIS, (("user_id", 1), ("analysis_timestamp", -1))),
+    IndexSpec(COLLECTION_DAILY_NUTRITION, (("user_id", 1), ("day", 1)), unique=True),
+    IndexSpec(COLLECTION_HEALTH_PROFILES, (("user_id", 1),), unique=True),
+    IndexSpec(COLLECTION_FITNESS_MONTHS, (("user_id", 1), ("month", 1)), unique=True),
+
+    # movie_expert: history by watch date, materialized stats
+    IndexSpec(COLLECTION_MOVIES, (("user_id", 1), ("watch_date", -1))),
+    IndexSpec(COLLECTION_MOVIE_STATS, (("user_id", 1),), unique=True),
+
+    # message_management
+    IndexSpec(COLLECTION_TOPIC_SETTINGS, (("chat_id", 1), ("topic_id", 1))),
+    IndexSpec(COLLECTION_SCHEDULED_MESSAGES, (("chat_id", 1), ("message_id", 1))),
+    # Only pending deletions are indexed, the sweeper never looks at the rest
+    IndexSpec(
+        COLLECTION_SCHEDULED_MESSAGES,
+        (("scheduled_delete_at", 1),),
+        partial_filter={"deleted": False, "deletion_attempted": False}
+    ),
+    IndexSpec(COLLECTION_MESSAGE_TAGS, (("chat_id", 1), ("topic_id", 1), ("name", 1))),
+    IndexSpec(COLLECTION_MESSAGE_TAGS, (("chat_id", 1), ("topic_id", 1), ("usage_count", -1))),
+    IndexSpec(COLLECTION_TAGGED_MESSAGES, (("chat_id", 1), ("topic_id", 1), ("tagged_at", -1))),
+    IndexSpec(COLLECTION_MESSAGE_FILTERS, (("chat_id", 1), ("enabled", 1), ("topic_id", 1), ("priority", -1))),
+
+    # core.cache shared backend (CACHE_BACKEND=mongodb), entries expire at expires_at
+    IndexSpec(COLLECTION_CACHE_ENTRIES, (("expires_at", 1),), expire_after=0),
+]
+
+# Indexes from earlier versions that no query uses any more
+OBSOLETE_INDEXES: List[IndexSpec] = [
+    # food_analysis has no "timestamp" field, services sort by analysis_timestamp
+    IndexSpec(COLLECTION_FOOD_ANALYSIS, (("user_id", 1), ("timestamp", -1))),
+    IndexSpec(COLLECTION_FOOD_ANALYSIS, (("timestamp", 1),)),
+    # movies are ordered by watch_date; user_id alone is a prefix of the compound indexes
+    IndexSpec(COLLECTION_MOVIES, (("user_id", 1), ("timestamp", -1))),
+    IndexSpec(COLLECTION_MOVIES, (("user_id", 1),)),
+    # highest/lowest rated lookups moved into movie_stats
+    IndexSpec(COLLECTION_MOVIES, (("user_id", 1), ("rating", -1))),
+    # steps and workouts moved into fitness_months buckets (scripts/backfill_fitness_buckets.py)
+    IndexSpec(COLLECTION_WORKOUTS, (("user_id", 1), ("timestamp", -1))),
+    IndexSpec(COLLECTION_STEPS, (("user_id", 1), ("date", 1)), unique=True),
+    # generated ids are stored as the _id (scripts/migrate_document_ids.py)
+    IndexSpec(COLLECTION_MESSAGE_TAGS, (("id", 1),), unique=True),
+]
+
+_SAMPLE_DATE = datetime(2024, 1, 1)
+
+HOT_QUERIES: List[QueryShape] = [
+    QueryShape("ensure_user", COLLECTION_USERS, {"user_id": 1}, source="core.bot"),
+
+    QueryShape(
+        "daily_nutrition_upsert", COLLECTION_DAILY_NUTRITION, {"user_id": 1, "day": _SAMPLE_DATE},
+        source="FoodAnalysisService._add_to_daily_rollup"
+    ),
+    QueryShape(
+        "food_statistics", COLLECTION_DAILY_NUTRITION,
+        {"user_id": 1, "day": {"$gte": _SAMPLE_DATE, "$lte": _SAMPLE_DATE}},
+        source="FoodAnalysisService.get_user_food_statistics"
+    ),
+    QueryShape(
+        "food_search", COLLECTION_FOOD_ANALYSIS,
+        {"user_id": 1, "$or": [
+            {"food_items.name": {"$regex": "apple", "$options": "i"}},
+            {"food_items.description": {"$regex": "apple", "$options": "i"}}
+        ]},
+        sort={"analysis_timestamp": -1},
+        source="FoodAnalysisService.search_food_database"
+    ),
+    QueryShape("health_profile", COLLECTION_HEALTH_PROFILES, {"user_id": 1}, source="HealthProfileService"),
+    QueryShape(
+        "fitness_month_upsert", COLLECTION_FITNESS_MONTHS, {"user_id": 1, "month": _SAMPLE_DATE},
+        source="HealthProfileService.save_steps/save_workout"
+    ),
+    QueryShape(
+        "fitness_period", COLLECTION_FITNESS_MONTHS,
+        {"user_id": 1, "month": {"$gte": _SAMPLE_DATE, "$lte": _SAMPLE_DATE}},
+        source="HealthProfileService.get_fitness_summary"
+    ),
+
+    QueryShape(
+        "user_movies", COLLECTION_MOVIES, {"user_id": 1}, sort={"watch_date": -1},
+        source="MovieExpertService.get_user_movies"
+    ),
+    QueryShape(
+        "movie_search", COLLECTION_MOVIES,
+        {"user_id": 1, "$or": [
+            {"title": {"$regex": "matrix", "$options": "i"}},
+            {"review": {"$regex": "matrix", "$options": "i"}}
+        ]},
+        sort={"watch_date": -1},
+        source="MovieExpertService.search_user_movies"
+    ),
+    QueryShape("movie_stats", COLLECTION_MOVIE_STATS, {"user_id": 1}, source="MovieExpertService.get_user_stats"),
+    QueryShape(
+        "movie_stats_rebuild", COLLECTION_MOVIES, {"user_id": 1},
+        source="MovieExpertService.rebuild_user_stats"
+    ),
+
+    QueryShape("topic_settings_chat", COLLECTION_TOPIC_SETTINGS, {"chat_id": -100}, source="ChatSnapshotStore._load"),
+    QueryShape(
+        "topic_settings_topic", COLLECTION_TOPIC_SETTINGS, {"chat_id": -100, "topic_id": 7},
+        source="ChatSnapshotStore._load"
+    ),
+    QueryShape(
+        "scheduled_by_message", COLLECTION_SCHEDULED_MESSAGES, {"chat_id": -100, "message_id": 42},
+        source="MessageManagementService.cancel_message_deletion"
+    ),
+    QueryShape(
+        "due_deletions", COLLECTION_SCHEDULED_MESSAGES,
+        {"deleted": False, "deletion_attempted": False, "scheduled_delete_at": {"$lte": _SAMPLE_DATE}},
+        source="MessageManagementService.sweep_due_deletions"
+    ),
+    QueryShape(
+        "tag_by_name", COLLECTION_MESSAGE_TAGS, {"chat_id": -100, "topic_id": 7, "name": "important"},
+        source="MessageManagementService.create_message_tag"
+    ),
+    QueryShape(
+        "topic_tags", COLLECTION_MESSAGE_TAGS, {"chat_id": -100, "topic_id": 7},
+        source="ChatSnapshotStore._load"
+    ),
+    QueryShape("tag_by_id", COLLECTION_MESSAGE_TAGS, {"_id": "tag-1"}, source="core.write_buffer (usage_count)"),
+    QueryShape(
+        "chat_tags", COLLECTION_MESSAGE_TAGS, {"chat_id": -100}, sort={"usage_count": -1},
+        source="MessageManagementService.get_chat_tags"
+    ),
+    QueryShape(
+        "tagged_search", COLLECTION_TAGGED_MESSAGES,
+        {"chat_id": -100, "topic_id": 7, "tags": {"$in": ["tag-1"]}}, sort={"tagged_at": -1},
+        source="MessageManagementService.search_tagged_messages"
+    ),
+    QueryShape(
+        "active_filters", COLLECTION_MESSAGE_FILTERS, {"chat_id": -100, "enabled": True}, sort={"priority": -1},
+        source="ChatSnapshotStore._load"
+    ),
+    QueryShape(
+        "active_topic_filters", COLLECTION_MESSAGE_FILTERS,
+        {"chat_id": -100, "enabled": True, "topic_id": 7}, sort={"priority": -1},
+        source="ChatSnapshotStore._load"
+    ),
+]
+
+def _key_of(keys) -> IndexKeys:
+    """Key spec as a tuple; the server may return 1.0 for 1, "text"/"2dsphere"/"hashed" stay as is"""
+    return tuple(
+        (name, int(direction) if isinstance(direction, (int, float)) else direction)
+        for name, direction in keys
+    )
+
+async def apply_indexes(db, manifest: Optional[List[IndexSpec]] = None,
+                        obsolete: Optional[List[IndexSpec]] = None) -> Dict[str, int]:
+    """Bring the indexes of db in line with the manifest
+
+    Idempotent: indexes that already exist with the same keys are skipped, so
+    running it again is a few listIndexes round trips. A failing build (e.g. a
+    unique index over duplicate data) is logged and does not stop the others.
+
+    Returns:
+        Dict with created, dropped, existing and failed counts
+    """
+    manifest = INDEX_MANIFEST if manifest is None else manifest
+    obsolete = OBSOLETE_INDEXES if obsolete is None else obsolete
+    summary = {"created": 0, "dropped": 0, "existing": 0, "failed": 0}
+
+    existing: Dict[str, Dict[IndexKeys, str]] = {}
+
+    async def indexes_of(collection: str) -> Dict[IndexKeys, str]:
+        if collection not in existing:
+            existing[collection] = {}
+            async for index in db[collection].list_indexes():
+                existing[collection][_key_of(index["key"].items())] = index["name"]
+        return existing[collection]
+
+    for spec in obsolete:
+        name = (await indexes_of(spec.collection)).pop(spec.keys, None)
+        if name is None:
+            continue
+        try:
+            await db[spec.collection].drop_index(name)
+            summary["dropped"] += 1
+            logger.info(f"Dropped obsolete index {spec.collection}.{name}")
+        except OperationFailure as e:
+            summary["failed"] += 1
+            logger.error(f"Failed to drop index {spec.collection}.{name}: {e}")
+
+    for spec in manifest:
+        current = await indexes_of(spec.collection)
+        if spec.keys in current:
+            summary["existing"] += 1
+            continue
+        try:
+            name = await db[spec.collection].create_index(list(spec.keys), **spec.options())
+            current[spec.keys] = name
+            summary["created"] += 1
+            logger.info(f"Created index {spec.collection}.{name}")
+        except OperationFailure as e:
+            summary["failed"] += 1
+            logger.error(f"Failed to create index on {spec.collection} {list(spec.keys)}: {e}")
+
+    return summary
+
+def plan_stages(plan: Any) -> List[str]:
+    """All stage names of an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+def winning_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Winning plan of a queryPlanner explain() result"""
+    return explain.get("queryPlanner", {}).get("winningPlan", {})
+
+async def explain_query(db, query: QueryShape) -> Dict[str, Any]:
+    """queryPlanner explain() of a registered query"""
+    command = {"find": query.collection, "filter": query.filter}
+    if query.sort:
+        command["sort"] = query.sort
+    return await db.command({"explain": command, "verbosity": "queryPlanner"})
@@ -8,22 +8,86 @@ class Settings:
     MONGO_URL: str = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     DB_NAME: str = os.getenv("DB_NAME", "telegram_bot_db")
     
+    # MongoDB connection pool (one client per process)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"
+    
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL_DEFAULT: str = "gpt-4o"
     OPENAI_MODEL_FALLBACK: str = "gpt-4o-mini"
     
+    # Raise instead of logging when sync MongoDB access happens on the event loop
+    DB_STRICT_ASYNC: bool = os.getenv("DB_STRICT_ASYNC", "false").lower() == "true"
+    
     # Telegram settings
     TELEGRAM_TOKEN: str = os.getenv("TELEGRAM_TOKEN", "")
     TELEGRAM_WEBHOOK_URL: str = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+    TELEGRAM_API_BASE_URL: str = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org")
+    
+    # Telegram HTTP connection pool (shared by every request path)
+    TELEGRAM_CONNECTION_POOL_SIZE: int = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", "32"))
+    TELEGRAM_POOL_TIMEOUT: float = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5.0"))
+    TELEGRAM_CONNECT_TIMEOUT: float = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5.0"))
+    TELEGRAM_READ_TIMEOUT: float = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10.0"))
+    TELEGRAM_WRITE_TIMEOUT: float = float(os.getenv("TELEGRAM_WRITE_TIMEOUT", "10.0"))
+    TELEGRAM_HTTP_VERSION: str = os.getenv("TELEGRAM_HTTP_VERSION", "1.1")  # "2" requires httpx[http2]
+    TELEGRAM_WARMUP_CONNECTIONS: int = int(os.getenv("TELEGRAM_WARMUP_CONNECTIONS", "4"))
+    
+    # Admission control for OpenAI-backed operations (core.admission)
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+    ADMISSION_MAX_WAITING: int = int(os.getenv("ADMISSION_MAX_WAITING", "50"))
+    ADMISSION_WAIT_TIMEOUT: float = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "60.0"))
+    ADMISSION_USER_RATE: float = float(os.getenv("ADMISSION_USER_RATE", "0.1"))  # tokens per second
+    ADMISSION_USER_BURST: int = int(os.getenv("ADMISSION_USER_BURST", "3"))
+    ADMISSION_CHAT_RATE: float = float(os.getenv("ADMISSION_CHAT_RATE", "0.5"))
+    ADMISSION_CHAT_BURST: int = int(os.getenv("ADMISSION_CHAT_BURST", "10"))
+    
+    # LLM gateway concurrency (core.llm_gateway): global cap, per-lane limits and weights
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_INTERACTIVE_CONCURRENCY: int = int(os.getenv("LLM_INTERACTIVE_CONCURRENCY", "8"))
+    LLM_BACKGROUND_CONCURRENCY: int = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "2"))
+    LLM_INTERACTIVE_WEIGHT: int = int(os.getenv("LLM_INTERACTIVE_WEIGHT", "3"))
+    LLM_BACKGROUND_WEIGHT: int = int(os.getenv("LLM_BACKGROUND_WEIGHT", "1"))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "120.0"))
+    
+    # Progressive rendering of streamed answers (core.streaming); Telegram allows
+    # about one message per second in a private chat and 20 per minute in a group
+    STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+    STREAM_GROUP_EDIT_INTERVAL: float = float(os.getenv("STREAM_GROUP_EDIT_INTERVAL", "3.0"))
+    STREAM_MIN_EDIT_CHARS: int = int(os.getenv("STREAM_MIN_EDIT_CHARS", "20"))
+    
+    # Write-behind buffer for small high-frequency writes (core.write_buffer)
+    WRITE_BUFFER_MAX_BATCH: int = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "500"))
+    WRITE_BUFFER_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "1.0"))
+    WRITE_BUFFER_MAX_PENDING: int = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "10000"))
     
     # Feature flags
     ENABLE_FOOD_ANALYSIS: bool = True
     ENABLE_MOVIE_EXPERT: bool = True
     ENABLE_MESSAGE_MANAGEMENT: bool = True
     
-    # Cache settings
-    CACHE_TIMEOUT: int = 300  # 5 minutes
+    # Cache settings (core.cache)
+    CACHE_TIMEOUT: int = int(os.getenv("CACHE_TIMEOUT", "300"))  # 5 minutes
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "")  # shared tier: "", "memory" or "mongodb"
+    CACHE_LOCAL_TTL: float = float(os.getenv("CACHE_LOCAL_TTL", "10"))  # local tier TTL with a shared backend
+    
+    # Completion cache for opt-in deterministic prompts (core.llm_gateway)
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "604800"))  # 7 days
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "mongodb")  # persistent tier: "", "memory" or "mongodb"
+    
+    # Per-(chat, topic) configuration snapshots (features.message_management.snapshots)
+    CHAT_SNAPSHOT_TTL: float = float(os.getenv("CHAT_SNAPSHOT_TTL", "300"))
+    CHAT_SNAPSHOT_MAX_ENTRIES: int = int(os.getenv("CHAT_SNAPSHOT_MAX_ENTRIES", "5000"))
+    CHAT_SNAPSHOT_CHANGE_STREAMS: bool = os.getenv("CHAT_SNAPSHOT_CHANGE_STREAMS", "false").lower() == "true"  # needs a replica set
     
     @classmethod
     def validate(cls) -> bool:
@@ -0,0 +1,262 @@
+"""Admission control and load shedding for expensive (OpenAI-backed) operations"""
+
+import asyncio
+import time
+import logging
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Operations under admission control
+OP_PHOTO_ANALYSIS = "photo_analysis"
+OP_HEALTH_ADVICE = "health_advice"
+OP_MOVIE_RECOMMENDATIONS = "movie_recommendations"
+
+# Rejection reasons
+REASON_USER_RATE = "user_rate_limited"
+REASON_CHAT_RATE = "chat_rate_limited"
+REASON_OVERLOADED = "overloaded"
+REASON_WAIT_TIMEOUT = "wait_timeout"
+
+# Idle buckets are dropped once the table grows past this size
+MAX_TRACKED_BUCKETS = 10000
+
+class AdmissionRejected(Exception):
+    """Request was not admitted; the caller should reply with user_message"""
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def user_message(self) -> str:
+        if self.reason in (REASON_USER_RATE, REASON_CHAT_RATE):
+            wait = max(int(self.retry_after or 0), 1)
+            return f"⏳ Слишком много запросов. Попробуйте снова через {wait} сек."
+        return "⏳ Сейчас очень много запросов. Попробуйте через минуту."
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, up to `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def retry_after(self) -> float:
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class AdmissionController:
+    """
+    Per-user and per-chat token buckets plus a global in-flight cap
+
+    Requests over the cap wait in a FIFO waiting room; the caller is told its
+    position right away. Requests beyond the waiting room are rejected.
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int, wait_timeout: float,
+                 user_rate: float, user_burst: int, chat_rate: float, chat_burst: int):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+
+        self.user_buckets: Dict[int, TokenBucket] = {}
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+        self.in_flight = 0
+        self.waiters: deque = deque()
+
+        # Metrics
+        self.admitted: Counter = Counter()
+        self.queued: Counter = Counter()
+        self.rejected: Counter = Counter()
+        self.peak_in_flight = 0
+        self.peak_waiting = 0
+
+    def _bucket(self, buckets: Dict[int, TokenBucket], key: int, rate: float, burst: int) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_TRACKED_BUCKETS:
+                self._prune(buckets)
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _prune(self, buckets: Dict[int, TokenBucket]) -> None:
+        """Drop full buckets, they are equivalent to new ones"""
+        now = time.monotonic()
+        for key in [key for key, bucket in buckets.items() if bucket.is_full(now)]:
+            del buckets[key]
+
+    def _check_rate(self, operation: str, user_id: Optional[int], chat_id: Optional[int]) -> List[TokenBucket]:
+        """Take a token from the user and chat buckets; returns the buckets taken from"""
+        now = time.monotonic()
+        user_bucket = None
+        chat_bucket = None
+
+        if user_id is not None:
+            user_bucket = self._bucket(self.user_buckets, user_id, self.user_rate, self.user_burst)
+            if not user_bucket.available(now):
+                self._reject(operation, REASON_USER_RATE, user_bucket.retry_after())
+
+        # Private chats have chat_id == user_id, one bucket is enough there
+        if chat_id is not None and chat_id != user_id:
+            chat_bucket = self._bucket(self.chat_buckets, chat_id, self.chat_rate, self.chat_burst)
+            if not chat_bucket.available(now):
+                self._reject(operation, REASON_CHAT_RATE, chat_bucket.retry_after())
+
+        # Take tokens only when both buckets allow the request
+        taken = [bucket for bucket in (user_bucket, chat_bucket) if bucket is not None]
+        for bucket in taken:
+            bucket.take()
+        return taken
+
+    @staticmethod
+    def _refund(buckets: List[TokenBucket]) -> None:
+        for bucket in buckets:
+            bucket.refund()
+
+    def _reject(self, operation: str, reason: str, retry_after: Optional[float] = None) -> None:
+        self.rejected[f"{operation}.{reason}"] += 1
+        logger.warning(f"Admission rejected {operation}: {reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    def _start(self, operation: str) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.admitted[operation] += 1
+
+    async def acquire(self, operation: str, user_id: Optional[int] = None, chat_id: Optional[int] = None,
+                      notify: Optional[Callable[[int], Awaitable[Any]]] = None) -> None:
+        """
+        Admit a request or raise AdmissionRejected
+
+        Args:
+            notify: called with the position in line if the request has to wait
+        """
+        taken = self._check_rate(operation, user_id, chat_id)
+
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self._start(operation)
+            return
+
+        if len(self.waiters) >= self.max_waiting:
+            # Shed for load, not for the caller's rate: the quota is given back
+            self._refund(taken)
+            self._reject(operation, REASON_OVERLOADED)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued[operation] += 1
+        self.peak_waiting = max(self.peak_waiting, len(self.waiters))
+
+        try:
+            # Inside the try: a cancel while the position is sent must still
+            # take the waiter out of line (or give back the slot it was handed)
+            if notify is not None:
+                try:
+                    await notify(len(self.waiters))
+                except Exception as e:
+                    logger.warning(f"Could not send queue position: {e}")
+
+            await asyncio.wait_for(asyncio.shield(waiter), self.wait_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over at the same moment, give it back
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            # Not run, so the rate quota is given back
+            self._refund(taken)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(operation, REASON_WAIT_TIMEOUT)
+
+        # release() handed its slot over, in_flight already counts this request
+        self.in_flight -= 1
+        self._start(operation)
+
+    def release(self) -> None:
+        """Free a slot or hand it to the next waiter"""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, operation: str, user_id: Optional[int] = None, chat_id: Optional[int] = None,
+                   notify: Optional[Callable[[int], Awaitable[Any]]] = None):
+        """async with admission_controller.slot(...): run the expensive call"""
+        await self.acquire(operation, user_id, chat_id, notify)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Admission metrics"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_waiting": self.peak_waiting,
+            "admitted": dict(self.admitted),
+            "queued": dict(self.queued),
+            "rejected": dict(self.rejected),
+            "tracked_users": len(self.user_buckets),
+            "tracked_chats": len(self.chat_buckets)
+        }
+
+def queue_position_text(position: int) -> str:
+    """Reply shown while a request waits for a slot"""
+    return f"⏳ Сейчас много запросов, вы #{position} в очереди. Ответ придет автоматически."
+
+# Global admission controller instance
+admission_controller = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_waiting=settings.ADMISSION_MAX_WAITING,
+    wait_timeout=settings.ADMISSION_WAIT_TIMEOUT,
+    user_rate=settings.ADMISSION_USER_RATE,
+    user_burst=settings.ADMISSION_USER_BURST,
+    chat_rate=settings.ADMISSION_CHAT_RATE,
+    chat_burst=settings.ADMISSION_CHAT_BURST
+)
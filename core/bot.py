@@ -1,7 +1,9 @@
+import asyncio
 import logging
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 from typing import Dict, Any, Optional, Callable
 from config.settings import settings
 from config.constants import ADMIN_IDS
@@ -23,20 +25,54 @@ class TelegramBotCore:
         if not settings.TELEGRAM_TOKEN:
             raise ValueError("TELEGRAM_TOKEN is required")
             
-        # Create application
-        self.app = Application.builder().token(settings.TELEGRAM_TOKEN).build()
+        # Create application with one tuned keep-alive connection pool
+        self.app = (
+            Application.builder()
+            .token(settings.TELEGRAM_TOKEN)
+            .base_url(f"{settings.TELEGRAM_API_BASE_URL.rstrip('/')}/bot")
+            .request(self._create_request())
+            .build()
+        )
         self.bot = self.app.bot
         
-        # Initialize database
-        db_manager.connect()
-        db_manager.create_indexes()
-        
         # Register core handlers
         self._register_core_handlers()
         
         logger.info("Telegram bot initialized successfully")
         return self.app
     
+    def _create_request(self) -> HTTPXRequest:
+        """Create the HTTP transport shared by all Bot API calls"""
+        return HTTPXRequest(
+            connection_pool_size=settings.TELEGRAM_CONNECTION_POOL_SIZE,
+            pool_timeout=settings.TELEGRAM_POOL_TIMEOUT,
+            connect_timeout=settings.TELEGRAM_CONNECT_TIMEOUT,
+            read_timeout=settings.TELEGRAM_READ_TIMEOUT,
+            write_timeout=settings.TELEGRAM_WRITE_TIMEOUT,
+            http_version=settings.TELEGRAM_HTTP_VERSION
+        )
+    
+    async def warm_up(self) -> None:
+        """Initialize the bot and open pooled connections to api.telegram.org"""
+        if not self.bot:
+            return
+        
+        # initialize() resolves get_me once; the extra calls pre-open TLS
+        # connections so the first updates don't pay for handshakes
+        await self.bot.initialize()
+        extra = max(settings.TELEGRAM_WARMUP_CONNECTIONS - 1, 0)
+        if extra:
+            await asyncio.gather(
+                *(self.bot.get_me() for _ in range(extra)),
+                return_exceptions=True
+            )
+        logger.info(f"Telegram bot connections warmed up ({extra + 1})")
+    
+    async def shutdown(self) -> None:
+        """Close the bot connection pool"""
+        if self.bot:
+            await self.bot.shutdown()
+    
     def _register_core_handlers(self):
         """Register core bot handlers"""
         # Command handlers
@@ -153,10 +189,10 @@ class TelegramBotCore:
     async def _ensure_user_exists(self, user_id: int, user_data) -> None:
         """Ensure user exists in database"""
         try:
-            users_collection = db_manager.get_collection("users")
+            users_collection = await db_manager.get_collection_async("users")
             
             # Check if user exists
-            existing_user = users_collection.find_one({"user_id": user_id})
+            existing_user = await users_collection.find_one({"user_id": user_id})
             
             if not existing_user:
                 # Create new user
@@ -173,7 +209,7 @@ class TelegramBotCore:
                     }
                 }
                 
-                users_collection.insert_one(user_doc)
+                await users_collection.insert_one(user_doc)
                 logger.info(f"Created new user: {user_id}")
         except Exception as e:
             logger.error(f"Error ensuring user exists: {e}")
@@ -0,0 +1,265 @@
+"""Read-through cache behind the CACHE_KEY_* constants
+
+Two tiers:
+- a bounded in-process LRU with per-entry TTL (always on)
+- an optional shared backend so workers see each other's entries and
+  invalidations: "mongodb" (cache_entries collection with a TTL index) or
+  "memory", an in-process stand-in with the same interface for tests and
+  single-worker setups
+
+With a shared backend the local tier keeps entries only for
+CACHE_LOCAL_TTL seconds, which bounds how long another worker's
+invalidation can go unnoticed.
+
+Services read through get_or_load() and call invalidate() after writes.
+Concurrent misses on one key share a single load (no stampede). Loader
+errors propagate to every waiter and are not cached. Cached values are
+shared between callers and must be treated as read-only.
+"""
+
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+
+from config.database import db_manager
+from config.indexes import COLLECTION_CACHE_ENTRIES
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Marks a miss, None is a legitimate cached value
+MISSING = object()
+
+class LRUCache:
+    """Bounded LRU with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+class MemoryCacheBackend:
+    """Shared backend stand-in kept in this process"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self._cache = LRUCache(max_entries)
+
+    async def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+class MongoCacheBackend:
+    """Shared backend in MongoDB; expired entries are removed by a TTL index on expires_at"""
+
+    name = "mongodb"
+
+    def __init__(self, collection_name: str = COLLECTION_CACHE_ENTRIES):
+        self.collection_name = collection_name
+
+    async def _collection(self):
+        return await db_manager.get_collection_async(self.collection_name)
+
+    async def get(self, key: str) -> Any:
+        collection = await self._collection()
+        # The TTL monitor runs once a minute, so expiry is checked here as well
+        entry = await collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return entry["value"] if entry else MISSING
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        collection = await self._collection()
+        await collection.replace_one(
+            {"_id": key},
+            {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    async def delete(self, key: str) -> None:
+        collection = await self._collection()
+        await collection.delete_one({"_id": key})
+
+class CacheManager:
+    """Read-through cache with stampede protection"""
+
+    def __init__(self, default_ttl: float = 300, max_entries: int = 10000,
+                 backend=None, local_ttl: Optional[float] = None):
+        self.default_ttl = default_ttl
+        self.local = LRUCache(max_entries)
+        self.backend = backend
+        self.local_ttl = local_ttl
+        self._loading: Dict[str, asyncio.Future] = {}
+
+        # Metrics
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.load_errors = 0
+        self.backend_errors = 0
+        self.invalidations = 0
+
+    def _local_ttl(self, ttl: float) -> float:
+        if self.backend is not None and self.local_ttl is not None:
+            return min(ttl, self.local_ttl)
+        return ttl
+
+    async def get(self, key: str) -> Any:
+        """Cached value or MISSING"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.local_hits += 1
+            return value
+
+        if self.backend is not None:
+            try:
+                value = await self.backend.get(key)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Cache backend read failed for {key}: {e}")
+                value = MISSING
+            if value is not MISSING:
+                self.shared_hits += 1
+                self.local.set(key, value, self._local_ttl(self.default_ttl))
+                return value
+
+        return MISSING
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = ttl or self.default_ttl
+        self.local.set(key, value, self._local_ttl(ttl))
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, ttl)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Cache backend write failed for {key}: {e}")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl: Optional[float] = None) -> Any:
+        """
+        Cached value of key, or the result of loader() which is then cached
+
+        Concurrent callers missing the same key wait for one loader call.
+        """
+        value = await self.get(key)
+        if value is not MISSING:
+            return value
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter must not cancel the shared load
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+            # An invalidation during the load unregisters it, the value may be stale
+            if self._loading.get(key) is future:
+                await self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.load_errors += 1
+            future.set_exception(e)
+            # Mark it retrieved, nobody may be waiting on it
+            future.exception()
+            raise
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    async def invalidate(self, *keys: str) -> None:
+        """Drop keys from both tiers after the underlying data changed"""
+        for key in keys:
+            self.local.delete(key)
+            self._loading.pop(key, None)
+            self.invalidations += 1
+            if self.backend is not None:
+                try:
+                    await self.backend.delete(key)
+                except Exception as e:
+                    self.backend_errors += 1
+                    logger.warning(f"Cache backend delete failed for {key}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache metrics"""
+        # Coalesced waiters did not load anything either
+        hits = self.local_hits + self.shared_hits + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "backend": self.backend.name if self.backend is not None else None,
+            "entries": len(self.local),
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "load_errors": self.load_errors,
+            "backend_errors": self.backend_errors,
+            "invalidations": self.invalidations,
+            "evictions": self.local.evictions,
+            "expirations": self.local.expirations
+        }
+
+def create_cache_backend(name: str):
+    """Shared backend for CACHE_BACKEND: empty (none), memory or mongodb"""
+    if not name:
+        return None
+    if name == "memory":
+        return MemoryCacheBackend(settings.CACHE_MAX_ENTRIES)
+    if name == "mongodb":
+        return MongoCacheBackend()
+    logger.warning(f"Unknown CACHE_BACKEND {name!r}, using the local cache only")
+    return None
+
+# Global cache
+cache = CacheManager(
+    default_ttl=settings.CACHE_TIMEOUT,
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    backend=create_cache_backend(settings.CACHE_BACKEND),
+    local_ttl=settings.CACHE_LOCAL_TTL
+)
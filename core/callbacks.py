@@ -0,0 +1,210 @@
+"""Callback query registry and compact callback_data codec"""
+
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+
+from config.constants import (
+    CB_CLOSE_MENU, CB_FOOD_STATS, CB_FOOD_SEARCH, CB_HEALTH_PROFILE_MENU,
+    CB_HEALTH_ADVICE, CB_HEALTH_GOALS, CB_HEALTH_EDIT, CB_HEALTH_ADD, CB_HEALTH_STATS,
+    CB_MOVIE_MENU, CB_MOVIE_ADD, CB_MOVIE_SEARCH, CB_MOVIE_RECOMMENDATIONS,
+    CB_MOVIE_STATS, CB_MOVIE_LIST, CB_MOVIE_TOP, CB_MOVIE_EXPORT, CB_MOVIE_TRENDS,
+    CB_TOPIC_SETTINGS_MENU, CB_TOPIC_AUTO_DELETE, CB_TOPIC_AI_SETTINGS, CB_TOPIC_TAGS,
+    CB_TOPIC_MODERATION, CB_TOPIC_STATS, CB_TOPIC_EXPORT, CB_TOGGLE_AUTO_DELETE,
+    CB_SET_DELETE_TIMEOUT, CB_TOGGLE_DELETE_BOTS, CB_TOGGLE_DELETE_USERS,
+    CB_TOGGLE_FOOD_ANALYSIS, CB_TOGGLE_AI_ASSISTANT, CB_TOGGLE_FOOD_AUTO,
+    CB_TOGGLE_AI_AUTO, CB_SET_CUSTOM_PROMPT, CB_TAG_CREATE, CB_TAG_SEARCH,
+    CB_TAG_STATS, CB_TAG_MANAGE
+)
+
+logger = logging.getLogger(__name__)
+
+# Telegram limit for InlineKeyboardButton.callback_data
+CALLBACK_DATA_MAX_BYTES = 64
+SEPARATOR = ":"
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+CallbackHandler = Callable[[Any, Any], Awaitable[Any]]
+
+def _encode_int(value: int) -> str:
+    """Encode int in base36 (chat ids shrink from 14 to 9 chars)"""
+    if value < 0:
+        return "-" + _encode_int(-value)
+    if value < 36:
+        return _DIGITS[value]
+    encoded = ""
+    while value:
+        value, remainder = divmod(value, 36)
+        encoded = _DIGITS[remainder] + encoded
+    return encoded
+
+def _encode_arg(value: Any, arg_type: type) -> str:
+    # None is stored as an empty field (e.g. topic_id of a chat without topics)
+    if value is None:
+        return ""
+    if arg_type is int:
+        return _encode_int(int(value))
+    if arg_type is bool:
+        return "1" if value else "0"
+    value = str(value)
+    if SEPARATOR in value:
+        raise ValueError(f"Callback argument must not contain '{SEPARATOR}': {value!r}")
+    return value
+
+def _decode_arg(field: str, arg_type: type) -> Any:
+    if field == "":
+        return None
+    if arg_type is int:
+        return int(field, 36)
+    if arg_type is bool:
+        return field == "1"
+    return field
+
+@dataclass(frozen=True)
+class CallbackRoute:
+    """Callback prefix with the types of its payload fields"""
+    prefix: str
+    feature: str
+    arg_types: Tuple[type, ...] = ()
+
+class CallbackRegistry:
+    """Maps callback prefixes to handlers; dispatch is a single dict lookup"""
+
+    def __init__(self, routes: List[CallbackRoute]):
+        self.routes: Dict[str, CallbackRoute] = {}
+        self.handlers: Dict[str, CallbackHandler] = {}
+        self.hits: Counter = Counter()
+
+        for route in routes:
+            if SEPARATOR in route.prefix:
+                raise ValueError(f"Invalid callback prefix: {route.prefix!r}")
+            if route.prefix in self.routes:
+                raise ValueError(f"Duplicate callback prefix: {route.prefix!r}")
+            self.routes[route.prefix] = route
+
+    def register(self, prefix: str, handler: CallbackHandler) -> None:
+        """Bind a handler to a declared prefix"""
+        if prefix not in self.routes:
+            raise KeyError(f"Unknown callback prefix: {prefix!r}")
+        self.handlers[prefix] = handler
+
+    def register_handlers(self, handlers: Dict[str, CallbackHandler]) -> None:
+        for prefix, handler in handlers.items():
+            self.register(prefix, handler)
+
+    def encode(self, prefix: str, *args) -> str:
+        """Build callback_data for a button"""
+        route = self.routes[prefix]
+        if len(args) != len(route.arg_types):
+            raise ValueError(
+                f"Callback {prefix!r} expects {len(route.arg_types)} arguments, got {len(args)}"
+            )
+
+        fields = [prefix] + [_encode_arg(value, arg_type) for value, arg_type in zip(args, route.arg_types)]
+        data = SEPARATOR.join(fields)
+        if len(data.encode("utf-8")) > CALLBACK_DATA_MAX_BYTES:
+            raise ValueError(f"Callback data exceeds {CALLBACK_DATA_MAX_BYTES} bytes: {data!r}")
+        return data
+
+    def decode(self, data: str) -> Optional[Tuple[CallbackRoute, Tuple[Any, ...]]]:
+        """Parse callback_data; None for unknown or malformed data"""
+        prefix, separator, payload = data.partition(SEPARATOR)
+        route = self.routes.get(prefix)
+        if route is None:
+            return None
+
+        fields = payload.split(SEPARATOR) if separator else []
+        if len(fields) != len(route.arg_types):
+            logger.warning(f"Malformed callback data: {data!r}")
+            return None
+
+        try:
+            args = tuple(_decode_arg(field, arg_type) for field, arg_type in zip(fields, route.arg_types))
+        except ValueError:
+            logger.warning(f"Malformed callback data: {data!r}")
+            return None
+
+        return route, args
+
+    async def dispatch(self, update, context) -> bool:
+        """
+        Decode the callback and call its handler
+
+        The decoded payload is passed as context.callback_args.
+
+        Returns:
+            bool: False if the data is not a registered callback
+        """
+        query = update.callback_query
+        decoded = self.decode(query.data or "")
+        if decoded is None:
+            return False
+
+        route, args = decoded
+        self.hits[route.prefix] += 1
+        context.callback_args = args
+
+        handler = self.handlers.get(route.prefix)
+        if handler is None:
+            await query.answer(f"⚠️ {route.feature} функция в разработке")
+            return True
+
+        await handler(update, context)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Dispatch counters by prefix"""
+        return dict(self.hits)
+
+# All callbacks used in inline keyboards. Routes without a handler answer
+# "in development"
+CALLBACK_ROUTES = [
+    # Food/Health
+    CallbackRoute(CB_CLOSE_MENU, "Food/Health"),
+    CallbackRoute(CB_FOOD_STATS, "Food/Health", (int, str)),  # user_id, period
+    CallbackRoute(CB_FOOD_SEARCH, "Food/Health", (int,)),  # user_id
+    CallbackRoute(CB_HEALTH_PROFILE_MENU, "Food/Health"),
+    CallbackRoute(CB_HEALTH_ADVICE, "Food/Health", (str,)),  # advice type
+    CallbackRoute(CB_HEALTH_GOALS, "Food/Health", (int,)),  # user_id
+    CallbackRoute(CB_HEALTH_EDIT, "Food/Health", (str,)),  # profile field
+    CallbackRoute(CB_HEALTH_ADD, "Food/Health", (str,)),  # workout / steps
+    CallbackRoute(CB_HEALTH_STATS, "Food/Health"),
+
+    # Movies
+    CallbackRoute(CB_MOVIE_MENU, "Movie"),
+    CallbackRoute(CB_MOVIE_ADD, "Movie"),
+    CallbackRoute(CB_MOVIE_SEARCH, "Movie"),
+    CallbackRoute(CB_MOVIE_RECOMMENDATIONS, "Movie"),
+    CallbackRoute(CB_MOVIE_STATS, "Movie"),
+    CallbackRoute(CB_MOVIE_LIST, "Movie"),
+    CallbackRoute(CB_MOVIE_TOP, "Movie"),
+    CallbackRoute(CB_MOVIE_EXPORT, "Movie"),
+    CallbackRoute(CB_MOVIE_TRENDS, "Movie"),
+
+    # Message management, payload is (chat_id, topic_id)
+    CallbackRoute(CB_TOPIC_SETTINGS_MENU, "Message Management"),
+    CallbackRoute(CB_TOPIC_AUTO_DELETE, "Message Management", (int, int)),
+    CallbackRoute(CB_TOPIC_AI_SETTINGS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOPIC_TAGS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOPIC_MODERATION, "Message Management", (int, int)),
+    CallbackRoute(CB_TOPIC_STATS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOPIC_EXPORT, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_AUTO_DELETE, "Message Management", (int, int)),
+    CallbackRoute(CB_SET_DELETE_TIMEOUT, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_DELETE_BOTS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_DELETE_USERS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_FOOD_ANALYSIS, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_AI_ASSISTANT, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_FOOD_AUTO, "Message Management", (int, int)),
+    CallbackRoute(CB_TOGGLE_AI_AUTO, "Message Management", (int, int)),
+    CallbackRoute(CB_SET_CUSTOM_PROMPT, "Message Management", (int, int)),
+    CallbackRoute(CB_TAG_CREATE, "Message Management", (int, int)),
+    CallbackRoute(CB_TAG_SEARCH, "Message Management", (int, int)),
+    CallbackRoute(CB_TAG_STATS, "Message Management", (int, int)),
+    CallbackRoute(CB_TAG_MANAGE, "Message Management", (int, int)),
+]
+
+# Global registry instance
+callback_registry = CallbackRegistry(CALLBACK_ROUTES)
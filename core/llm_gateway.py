@@ -0,0 +1,445 @@
+"""Shared async gateway for every feature's OpenAI calls
+
+All services go through one process-wide ReliableOpenAIClient
+(backend/openai_reliability.py: AsyncOpenAI, retries with backoff, circuit
+breaker), so a slow completion only suspends its own coroutine and never
+blocks the event loop. Services hold no clients of their own.
+
+Calls are governed by priority lanes:
+- "interactive": someone is waiting for the reply (photo analysis, chat)
+- "background": enrichment and advice that can be late
+
+Each lane has its own concurrency limit, and LLM_MAX_CONCURRENCY caps the
+total. When both lanes have waiters, free slots are shared by weight
+(smooth weighted round robin). Inside a lane, waiters are served round
+robin per user, so one user's burst queues behind everyone else's next
+request instead of in front of it.
+
+Call sites with deterministic prompts (JSON extraction at low temperature)
+can pass cache=True: the text is then cached under a hash of model,
+messages and parameters, in a bounded local LRU plus a persistent tier
+(LLM_CACHE_BACKEND, the cache_entries TTL collection by default). Hits skip
+the lane queue entirely, and identical concurrent requests share one call.
+Only usable answers are stored: a completion cut off by max_tokens, or one
+the call site's validate() rejects, is returned once and not cached.
+
+stream() yields the answer as it is generated (for progressive rendering,
+see core/streaming.py). Retries happen only before the first chunk; the
+lane slot is held until the stream ends.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import logging
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable
+
+from config.settings import settings
+from config.constants import CACHE_KEY_LLM_COMPLETION, OPENAI_PRICES_PER_MILLION
+from core.cache import CacheManager, create_cache_backend
+
+# backend/ is on sys.path (see backend/server.py)
+from openai_reliability import (
+    ReliableOpenAIClient, init_reliable_openai_client, get_reliable_openai_client
+)
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes
+LANE_INTERACTIVE = "interactive"
+LANE_BACKGROUND = "background"
+
+class _UncachedCompletion(Exception):
+    """Raised by the cache loader so that a completion is returned but not stored"""
+
+    def __init__(self, completion: Dict[str, Any]):
+        super().__init__("completion not cached")
+        self.completion = completion
+
+class LLMError(Exception):
+    """Completion failed; error_type as in ReliableOpenAIClient, or "queue_timeout\""""
+
+    def __init__(self, message: str, error_type: Optional[str] = None):
+        super().__init__(message)
+        self.error_type = error_type
+
+class _Lane:
+    """Waiters of one priority class, queued per user"""
+
+    def __init__(self, name: str, limit: int, weight: int):
+        self.name = name
+        self.limit = limit
+        self.weight = weight
+        self.current_weight = 0
+        self.in_flight = 0
+        # user key -> waiting futures; the front user is served next
+        self.queues: "OrderedDict[Any, deque]" = OrderedDict()
+        self.waiting = 0
+
+        # Metrics
+        self.started = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.max_wait = 0.0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.limit
+
+    def pop_next(self) -> Optional[asyncio.Future]:
+        """Next waiter, rotating the served user to the back of the line"""
+        while self.queues:
+            user, waiters = self.queues.popitem(last=False)
+            waiter = waiters.popleft()
+            if waiters:
+                self.queues[user] = waiters
+            self.waiting -= 1
+            if not waiter.done():
+                return waiter
+        self.waiting = 0
+        return None
+
+    def remove(self, user: Any, waiter: asyncio.Future) -> None:
+        waiters = self.queues.get(user)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+            self.waiting -= 1
+        except ValueError:
+            return
+        if not waiters:
+            del self.queues[user]
+
+    def record_wait(self, waited: float) -> None:
+        self.wait_total += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "weight": self.weight,
+            "queue_depth": self.waiting,
+            "waiting_users": len(self.queues),
+            "started": self.started,
+            "queued": self.queued,
+            "timeouts": self.timeouts,
+            "avg_wait_s": round(self.wait_total / self.started, 3) if self.started else 0.0,
+            "max_wait_s": round(self.max_wait, 3)
+        }
+
+class LLMGateway:
+    """Chat completions through the process-wide ReliableOpenAIClient"""
+
+    def __init__(self, max_concurrency: int = 8, interactive_limit: int = 8, background_limit: int = 2,
+                 interactive_weight: int = 3, background_weight: int = 1, queue_timeout: float = 120.0,
+                 completion_cache: Optional[CacheManager] = None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.completion_cache = completion_cache or CacheManager()
+        self.lanes: Dict[str, _Lane] = {
+            LANE_INTERACTIVE: _Lane(LANE_INTERACTIVE, interactive_limit, interactive_weight),
+            LANE_BACKGROUND: _Lane(LANE_BACKGROUND, background_limit, background_weight)
+        }
+        self.in_flight = 0
+
+        # Metrics
+        self.calls: Counter = Counter()
+        self.failures: Counter = Counter()
+        self.latency_total: Counter = Counter()
+        self.peak_in_flight = 0
+        self.streams: Counter = Counter()
+        self.first_chunk_total: Counter = Counter()
+        self.cache_hits: Counter = Counter()
+        self.cache_rejected: Counter = Counter()
+        self.tokens_saved: Counter = Counter()
+        self.cost_saved = 0.0
+
+    @property
+    def client(self) -> ReliableOpenAIClient:
+        """The server initializes the client on startup; scripts and tests get one on first use"""
+        try:
+            return get_reliable_openai_client()
+        except RuntimeError:
+            init_reliable_openai_client(settings.OPENAI_API_KEY)
+            return get_reliable_openai_client()
+
+    def _start(self, lane: _Lane) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        lane.in_flight += 1
+        lane.started += 1
+
+    def _next_lane(self) -> Optional[_Lane]:
+        """Smooth weighted round robin over lanes that have waiters and room"""
+        eligible = [lane for lane in self.lanes.values() if lane.waiting and lane.has_capacity()]
+        if not eligible:
+            return None
+        total = sum(lane.weight for lane in eligible)
+        for lane in eligible:
+            lane.current_weight += lane.weight
+        chosen = max(eligible, key=lambda lane: lane.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters"""
+        while self.in_flight < self.max_concurrency:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = lane.pop_next()
+            if waiter is None:
+                continue
+            self._start(lane)
+            waiter.set_result(None)
+
+    async def acquire(self, lane_name: str, user_id: Optional[int] = None) -> None:
+        """
+        Wait for a slot in the lane
+
+        Raises:
+            LLMError: no slot within queue_timeout
+        """
+        lane = self.lanes[lane_name]
+        if not lane.waiting and lane.has_capacity() and self.in_flight < self.max_concurrency:
+            self._start(lane)
+            lane.record_wait(0.0)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.queues.setdefault(user_id, deque()).append(waiter)
+        lane.waiting += 1
+        lane.queued += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over at the same moment, give it back
+                self.release(lane_name)
+            else:
+                waiter.cancel()
+                lane.remove(user_id, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            lane.timeouts += 1
+            raise LLMError("LLM queue timeout", "queue_timeout")
+
+        lane.record_wait(time.monotonic() - queued_at)
+
+    def release(self, lane_name: str) -> None:
+        """Free a slot and hand it to the next waiter"""
+        self.in_flight -= 1
+        self.lanes[lane_name].in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = LANE_INTERACTIVE, user_id: Optional[int] = None):
+        """async with llm_gateway.slot(...): hold a concurrency slot"""
+        await self.acquire(lane, user_id)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    async def complete(self, messages: List[Dict[str, Any]], model: Optional[str] = None,
+                       max_tokens: Optional[int] = None, temperature: float = 0.7,
+                       lane: str = LANE_INTERACTIVE, user_id: Optional[int] = None,
+                       cache: bool = False, validate: Optional[Callable[[str], bool]] = None,
+                       **kwargs) -> str:
+        """
+        Text of the first choice
+
+        Args:
+            lane: LANE_INTERACTIVE when a user waits for the answer, else LANE_BACKGROUND
+            user_id: whose request it is, for fair queuing inside the lane
+            cache: reuse the answer to an identical request (deterministic prompts only)
+            validate: with cache, only answers it accepts are stored (e.g. parseable JSON)
+
+        Raises:
+            LLMError: the request failed (after retries for transient errors)
+        """
+        model = model or settings.OPENAI_MODEL_DEFAULT
+        if not cache:
+            completion = await self._complete(messages, model, max_tokens, temperature, lane, user_id, **kwargs)
+            return completion["content"]
+
+        key = self._cache_key(messages, model, max_tokens, temperature, kwargs)
+        loaded = False
+
+        async def load() -> Dict[str, Any]:
+            nonlocal loaded
+            loaded = True
+            completion = await self._complete(messages, model, max_tokens, temperature, lane, user_id, **kwargs)
+            if completion["finish_reason"] == "length" or (validate and not validate(completion["content"])):
+                # Raising keeps it out of both tiers; a later request samples again
+                self.cache_rejected[model] += 1
+                raise _UncachedCompletion(completion)
+            return completion
+
+        try:
+            completion = await self.completion_cache.get_or_load(key, load, settings.LLM_CACHE_TTL)
+        except _UncachedCompletion as e:
+            # Callers that joined this load get the same answer
+            return e.completion["content"]
+        if not loaded:
+            self._record_saved(model, completion.get("usage") or {})
+        return completion["content"]
+
+    @staticmethod
+    def _cache_key(messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int],
+                   temperature: float, params: Dict[str, Any]) -> str:
+        request = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "params": params
+        }
+        digest = hashlib.sha256(
+            json.dumps(request, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+        return CACHE_KEY_LLM_COMPLETION.format(digest=digest)
+
+    def _record_saved(self, model: str, usage: Dict[str, int]) -> None:
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        self.cache_hits[model] += 1
+        self.tokens_saved[model] += prompt_tokens + completion_tokens
+        input_price, output_price = OPENAI_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+        self.cost_saved += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    async def _complete(self, messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int],
+                        temperature: float, lane: str, user_id: Optional[int], **kwargs) -> Dict[str, Any]:
+        """One call to OpenAI: {"content": str, "finish_reason": str, "usage": {prompt_tokens, completion_tokens}}"""
+        async with self.slot(lane, user_id):
+            started = time.monotonic()
+            self.calls[model] += 1
+            result = await self.client.safe_chat_completion(
+                messages=messages,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **kwargs
+            )
+            self.latency_total[model] += time.monotonic() - started
+
+        if not result["success"]:
+            self.failures[f"{model}.{result['error_type']}"] += 1
+            raise LLMError(result["error"], result["error_type"])
+
+        response = result["response"]
+        usage = getattr(response, "usage", None)
+        choice = response.choices[0]
+        return {
+            "content": choice.message.content or "",
+            "finish_reason": getattr(choice, "finish_reason", None),
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+            }
+        }
+
+    async def stream(self, messages: List[Dict[str, Any]], model: Optional[str] = None,
+                     max_tokens: Optional[int] = None, temperature: float = 0.7,
+                     lane: str = LANE_INTERACTIVE, user_id: Optional[int] = None,
+                     **kwargs) -> AsyncIterator[str]:
+        """
+        Text deltas of the first choice, as they arrive
+
+        Consume it to the end (or aclose() it): the lane slot is held until then.
+
+        Raises:
+            LLMError: the request failed, or the stream broke after it started
+        """
+        model = model or settings.OPENAI_MODEL_DEFAULT
+
+        async with self.slot(lane, user_id):
+            started = time.monotonic()
+            self.calls[model] += 1
+            self.streams[model] += 1
+            result = await self.client.safe_chat_completion(
+                messages=messages,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                **kwargs
+            )
+            if not result["success"]:
+                self.latency_total[model] += time.monotonic() - started
+                self.failures[f"{model}.{result['error_type']}"] += 1
+                raise LLMError(result["error"], result["error_type"])
+
+            response = result["response"]
+            first_chunk = True
+            try:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_chunk:
+                        first_chunk = False
+                        self.first_chunk_total[model] += time.monotonic() - started
+                    yield delta
+            except Exception as e:
+                # Already yielded text can't be taken back, so no retry here
+                self.failures[f"{model}.stream"] += 1
+                logger.error(f"LLM stream broke on {model}: {e}")
+                raise LLMError("The AI response was interrupted. Please try again.", "stream") from e
+            finally:
+                self.latency_total[model] += time.monotonic() - started
+                await response.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Gateway metrics"""
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "peak_in_flight": self.peak_in_flight,
+            "lanes": {name: lane.get_stats() for name, lane in self.lanes.items()},
+            "calls": dict(self.calls),
+            "failures": dict(self.failures),
+            "avg_latency_s": {
+                model: round(self.latency_total[model] / count, 3)
+                for model, count in self.calls.items() if count
+            },
+            "streams": dict(self.streams),
+            "avg_first_chunk_s": {
+                model: round(self.first_chunk_total[model] / count, 3)
+                for model, count in self.streams.items() if count
+            },
+            "completion_cache": {
+                **self.completion_cache.get_stats(),
+                "hits_by_model": dict(self.cache_hits),
+                "rejected_by_model": dict(self.cache_rejected),
+                "tokens_saved": dict(self.tokens_saved),
+                "cost_saved_usd": round(self.cost_saved, 4)
+            },
+            "client": self.client.get_status()
+        }
+
+# Global gateway, shared by every feature
+llm_gateway = LLMGateway(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    interactive_limit=settings.LLM_INTERACTIVE_CONCURRENCY,
+    background_limit=settings.LLM_BACKGROUND_CONCURRENCY,
+    interactive_weight=settings.LLM_INTERACTIVE_WEIGHT,
+    background_weight=settings.LLM_BACKGROUND_WEIGHT,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    completion_cache=CacheManager(
+        default_ttl=settings.LLM_CACHE_TTL,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        # Completions never change, the local tier can keep them for the full TTL
+        backend=create_cache_backend(settings.LLM_CACHE_BACKEND)
+    )
+)
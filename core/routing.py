@@ -0,0 +1,241 @@
+"""Declarative keyword routing for text messages"""
+
+import re
+import logging
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Set, Tuple
+from telegram import MessageEntity
+
+from config.constants import BOT_USERNAME
+
+logger = logging.getLogger(__name__)
+
+_BOT_MENTION_RE = re.compile(re.escape(f"@{BOT_USERNAME}"), re.IGNORECASE)
+
+class AhoCorasickMatcher:
+    """Multi-pattern substring matcher (Aho-Corasick automaton)"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[Any]] = [set()]
+        self._built = False
+
+    def add(self, pattern: str, label: Any) -> None:
+        """Add a pattern; every occurrence reports the label"""
+        if not pattern:
+            raise ValueError("Empty pattern")
+
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(label)
+        self._built = False
+
+    def build(self) -> None:
+        """Compute failure links (breadth-first)"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+        self._built = True
+
+    def search(self, text: str) -> Set[Any]:
+        """Return labels of all patterns found in text, in a single pass"""
+        if not self._built:
+            self.build()
+
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+@dataclass(frozen=True)
+class RouteRule:
+    """Rule matches if the text starts with a prefix or contains a keyword"""
+    name: str
+    keywords: Tuple[str, ...] = ()
+    prefixes: Tuple[str, ...] = ()
+
+@dataclass(frozen=True)
+class RouteTable:
+    """Ordered rules, the first matching rule wins"""
+    name: str
+    rules: Tuple[RouteRule, ...]
+    default: Optional[str] = None
+
+@dataclass
+class MessageEnvelope:
+    """Message normalized once and passed through the routing pipeline"""
+    text: str
+    text_lower: str
+    tokens: List[str]
+    mentions: Set[str]
+    command: Optional[str] = None
+    matched: Set[Tuple[str, str]] = field(default_factory=set)
+    routes: Dict[str, Optional[str]] = field(default_factory=dict)
+
+    @property
+    def mentions_bot(self) -> bool:
+        return BOT_USERNAME.lower() in self.mentions
+
+    def without_bot_mention(self) -> str:
+        """Text with the bot mention removed"""
+        return _BOT_MENTION_RE.sub("", self.text).strip()
+
+class KeywordRouter:
+    """Compiles all route tables into one matcher and resolves routes"""
+
+    def __init__(self, tables: List[RouteTable]):
+        self.tables: Dict[str, RouteTable] = {table.name: table for table in tables}
+        self.matcher = AhoCorasickMatcher()
+        self.rule_hits: Counter = Counter()
+
+        for table in tables:
+            for rule in table.rules:
+                for keyword in rule.keywords:
+                    self.matcher.add(keyword.lower(), (table.name, rule.name))
+        self.matcher.build()
+
+    def build_envelope(self, text: str, entity_mentions: Optional[Set[str]] = None) -> MessageEnvelope:
+        """Normalize text and run the matcher once"""
+        text_lower = text.lower()
+        tokens = text_lower.split()
+
+        mentions = set(entity_mentions or ())
+        command = None
+        if tokens and tokens[0].startswith("/"):
+            command, _, addressee = tokens[0][1:].partition("@")
+            if addressee:
+                mentions.add(addressee)
+
+        return MessageEnvelope(
+            text=text,
+            text_lower=text_lower,
+            tokens=tokens,
+            mentions=mentions,
+            command=command,
+            matched=self.matcher.search(text_lower)
+        )
+
+    def envelope_from_message(self, message) -> MessageEnvelope:
+        """Build an envelope from a telegram Message, mentions taken from entities"""
+        text = message.text or ""
+        mentions = {
+            mention.lstrip("@").lower()
+            for mention in message.parse_entities([MessageEntity.MENTION]).values()
+        }
+        return self.build_envelope(text, mentions)
+
+    def resolve(self, table_name: str, envelope: MessageEnvelope) -> Optional[str]:
+        """Return the first matching rule of a table (and remember it on the envelope)"""
+        if table_name in envelope.routes:
+            return envelope.routes[table_name]
+
+        table = self.tables[table_name]
+        route = table.default
+        for rule in table.rules:
+            if (table_name, rule.name) in envelope.matched or (
+                rule.prefixes and envelope.text_lower.startswith(rule.prefixes)
+            ):
+                route = rule.name
+                break
+
+        envelope.routes[table_name] = route
+        self.rule_hits[f"{table_name}.{route}"] += 1
+        logger.debug(f"Route {table_name}: {route}")
+        return route
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Rule hit counters"""
+        return dict(self.rule_hits)
+
+# Top-level routing of text messages (route_update)
+MESSAGE_ROUTES = RouteTable(
+    name="message",
+    rules=(
+        RouteRule("bot_mention", keywords=(f"@{BOT_USERNAME}",)),
+        RouteRule("health_menu", keywords=("здоровье", "профиль"), prefixes=("/health",)),
+        RouteRule("movie_menu", prefixes=("/movie",)),
+        RouteRule("topic_settings", keywords=("настройки топика",), prefixes=("/topic",)),
+        RouteRule("movie_report", keywords=("посмотрел", "посмотрела", "оценка", "/10")),
+        RouteRule("movie_talk", keywords=("фильм", "кино", "сериал", "рекомендации")),
+    ),
+    default="general_text"
+)
+
+# Search inside movie conversations
+MOVIE_SEARCH_ROUTES = RouteTable(
+    name="movie_search",
+    rules=(
+        RouteRule("search", keywords=("поиск", "найди")),
+    )
+)
+
+# Intent of a message addressed to the bot with @mention
+MENTION_INTENTS = RouteTable(
+    name="mention_intent",
+    rules=(
+        RouteRule("message_tags", keywords=("тег", "метка", "поиск")),
+        RouteRule("health_profile", keywords=("здоровье", "профиль", "тренировка", "шаги")),
+        RouteRule("movie_expert", keywords=("фильм", "кино", "рекомендации", "посмотрел", "сериал")),
+        RouteRule("food_analysis", keywords=("еда", "калории", "анализ", "питание", "блюдо")),
+    ),
+    default="general_ai"
+)
+
+# Feature hints for general text messages
+TEXT_HINTS = RouteTable(
+    name="text_hint",
+    rules=(
+        RouteRule("food", keywords=("еда", "калории", "питание")),
+        RouteRule("movie", keywords=("фильм", "кино", "сериал")),
+        RouteRule("settings", keywords=("настройки", "топик", "автоудаление")),
+    ),
+    default="default"
+)
+
+# Movie conversation intents (MovieAIService)
+MOVIE_MESSAGE_INTENTS = RouteTable(
+    name="movie_message",
+    rules=(
+        RouteRule("movie_report", keywords=(
+            "посмотрел", "посмотрела", "смотрел", "смотрела",
+            "оценка", "оценил", "оценила", "/10", "из 10"
+        )),
+        RouteRule("recommendation_request", keywords=(
+            "посоветуй", "рекомендации", "что посмотреть",
+            "предложи фильм", "что-нибудь интересное"
+        )),
+    ),
+    default="conversation"
+)
+
+# Global router, compiled once at import
+message_router = KeywordRouter([
+    MESSAGE_ROUTES, MOVIE_SEARCH_ROUTES, MENTION_INTENTS, TEXT_HINTS, MOVIE_MESSAGE_INTENTS
+])
@@ -0,0 +1,230 @@
+"""Progressive rendering of streamed LLM answers into a Telegram message
+
+The handler sends (or reuses) a placeholder message right away, and
+StreamingMessage edits it as text deltas arrive, so the first words show up
+within a few hundred milliseconds instead of after the whole completion.
+
+- Edits are throttled: at most one per STREAM_EDIT_INTERVAL in private chats
+  (STREAM_GROUP_EDIT_INTERVAL in groups), and only when at least
+  STREAM_MIN_EDIT_CHARS new characters arrived. RetryAfter pushes the next
+  edit back instead of failing the answer.
+- Partial text is made safe for Markdown: entities still open at the end
+  are closed (an unfinished link is hidden until it completes). If Telegram
+  still can't parse a preview, the following previews go as plain text.
+- finish() always renders the full text with the requested parse mode,
+  falling back to plain text, and splits answers longer than one message.
+"""
+
+import asyncio
+import time
+import logging
+from collections import Counter
+from typing import Optional, Dict, Any, AsyncIterator
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config.settings import settings
+from config.constants import MAX_MESSAGE_LENGTH
+from core.utils import chunk_text
+
+logger = logging.getLogger(__name__)
+
+# Shown at the end of a preview while the answer is still being generated
+CURSOR = " ▌"
+
+# Legacy Markdown entity markers, longest first
+MARKDOWN_MARKERS = ("```", "`", "*", "_", "[")
+
+# Counters of all renders, for /api/metrics
+stream_stats: Counter = Counter()
+
+def close_markdown(text: str) -> str:
+    """
+    Prefix of an unfinished Markdown text that Telegram can parse
+
+    An entity left open at the end is closed; an unfinished link
+    (or an opener with nothing after it yet) is cut off.
+    """
+    open_marker = None
+    open_at = 0
+    link_part = None  # "text" inside [...], "url" inside (...)
+    i = 0
+
+    while i < len(text):
+        if open_marker == "[":
+            if link_part == "text" and text[i] == "]":
+                if text.startswith("](", i):
+                    link_part = "url"
+                    i += 2
+                    continue
+                # Not a link after all: Telegram treats it as plain text
+                open_marker = None
+            elif link_part == "url" and text[i] == ")":
+                open_marker = None
+            i += 1
+            continue
+
+        if open_marker in ("```", "`"):
+            if text.startswith(open_marker, i):
+                i += len(open_marker)
+                open_marker = None
+            else:
+                i += 1
+            continue
+
+        if open_marker is None and text[i] == "\\":
+            i += 2
+            continue
+
+        marker = next((m for m in MARKDOWN_MARKERS if text.startswith(m, i)), None)
+        if marker is None:
+            i += 1
+        elif open_marker is None:
+            open_marker = marker
+            open_at = i
+            link_part = "text" if marker == "[" else None
+            i += len(marker)
+        elif marker == open_marker:
+            open_marker = None
+            i += len(marker)
+        else:
+            i += len(marker)
+
+    if open_marker is None:
+        return text
+
+    body = text[open_at + len(open_marker):]
+    if open_marker == "[" or not body.strip():
+        return text[:open_at].rstrip()
+    if open_marker == "```":
+        return text.rstrip() + "\n```"
+    return text.rstrip() + open_marker
+
+class StreamingMessage:
+    """Edits one Telegram message while a streamed answer arrives"""
+
+    def __init__(self, bot, chat_id: int, message_id: int, prefix: str = "",
+                 parse_mode: Optional[str] = "Markdown"):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.prefix = prefix
+        self.parse_mode = parse_mode
+        self.preview_parse_mode = parse_mode
+        self.interval = settings.STREAM_GROUP_EDIT_INTERVAL if chat_id < 0 else settings.STREAM_EDIT_INTERVAL
+        self.min_chars = settings.STREAM_MIN_EDIT_CHARS
+
+        self.text = ""
+        self.rendered_length = 0
+        self.next_edit_at = 0.0  # the first content is shown right away
+        self.started = time.monotonic()
+        self.first_render: Optional[float] = None
+
+    async def stream(self, chunks: AsyncIterator[str]) -> str:
+        """Consume the deltas, editing previews on the way; returns the full text"""
+        async for delta in chunks:
+            self.text += delta
+            if self._edit_due():
+                await self._render_preview()
+        return self.text
+
+    def _edit_due(self) -> bool:
+        if len(self.prefix) + len(self.text) + len(CURSOR) > MAX_MESSAGE_LENGTH:
+            # Longer answers are split only in finish()
+            return False
+        if len(self.text) - self.rendered_length < self.min_chars:
+            return False
+        return time.monotonic() >= self.next_edit_at
+
+    async def _render_preview(self) -> None:
+        text = self.prefix + self.text
+        if self.preview_parse_mode:
+            text = close_markdown(text)
+        self.rendered_length = len(self.text)
+        self.next_edit_at = time.monotonic() + self.interval
+
+        try:
+            await self._edit(text + CURSOR, self.preview_parse_mode)
+            stream_stats["previews"] += 1
+            if self.first_render is None:
+                self.first_render = time.monotonic() - self.started
+                stream_stats["first_render_total_ms"] += int(self.first_render * 1000)
+                stream_stats["first_renders"] += 1
+        except RetryAfter as e:
+            stream_stats["retry_after"] += 1
+            self.next_edit_at = time.monotonic() + e.retry_after
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            if self.preview_parse_mode and "parse" in str(e).lower():
+                stream_stats["plain_previews"] += 1
+                self.preview_parse_mode = None
+                return
+            logger.warning(f"Could not render stream preview: {e}")
+        except TelegramError as e:
+            logger.warning(f"Could not render stream preview: {e}")
+
+    async def finish(self, reply_markup=None) -> None:
+        """Final render of the whole text; reply_markup goes to the last message"""
+        parts = [
+            # chunk_text splits by lines; a single longer line is cut as is
+            part[start:start + MAX_MESSAGE_LENGTH]
+            for part in chunk_text(self.prefix + self.text, MAX_MESSAGE_LENGTH)
+            for start in range(0, len(part), MAX_MESSAGE_LENGTH)
+        ] or [""]
+        stream_stats["renders"] += 1
+
+        for index, part in enumerate(parts):
+            markup = reply_markup if index == len(parts) - 1 else None
+            if index == 0:
+                await self._final_edit(part, markup)
+            else:
+                await self._final_send(part, markup)
+
+    async def _final_edit(self, text: str, reply_markup) -> None:
+        try:
+            await self._edit_or_plain(text, reply_markup)
+        except RetryAfter as e:
+            # The final text must land: wait as asked and try once more
+            stream_stats["retry_after"] += 1
+            await asyncio.sleep(e.retry_after)
+            await self._edit_or_plain(text, reply_markup)
+
+    async def _edit_or_plain(self, text: str, reply_markup) -> None:
+        try:
+            await self._edit(text, self.parse_mode, reply_markup)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            if not self.parse_mode or "parse" not in str(e).lower():
+                raise
+            stream_stats["plain_finals"] += 1
+            await self._edit(text, None, reply_markup)
+
+    async def _final_send(self, text: str, reply_markup) -> None:
+        try:
+            await self.bot.send_message(
+                chat_id=self.chat_id, text=text, parse_mode=self.parse_mode, reply_markup=reply_markup
+            )
+        except BadRequest as e:
+            if not self.parse_mode or "parse" not in str(e).lower():
+                raise
+            stream_stats["plain_finals"] += 1
+            await self.bot.send_message(chat_id=self.chat_id, text=text, reply_markup=reply_markup)
+
+    async def _edit(self, text: str, parse_mode: Optional[str], reply_markup=None) -> None:
+        await self.bot.edit_message_text(
+            chat_id=self.chat_id,
+            message_id=self.message_id,
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup
+        )
+
+def get_stream_stats() -> Dict[str, Any]:
+    """Rendering metrics: previews per answer and time to the first visible text"""
+    first_renders = stream_stats["first_renders"]
+    return {
+        **dict(stream_stats),
+        "avg_first_render_ms": round(stream_stats["first_render_total_ms"] / first_renders) if first_renders else None
+    }
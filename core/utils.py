@@ -18,6 +18,21 @@ def generate_uuid() -> str:
     """Generate a unique identifier"""
     return str(uuid.uuid4())
 
+def id_to_bson(value: str) -> Union[uuid.UUID, str]:
+    """Stored form of a generated id: 16-byte binary UUID instead of the 36-character string"""
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        # Ids that are not UUIDs are stored as they are
+        return value
+
+def id_from_document(data: Dict[str, Any]) -> str:
+    """Id of a stored document: binary UUID _id, or the legacy "id" string field"""
+    document_id = data.get('_id')
+    if isinstance(document_id, uuid.UUID):
+        return str(document_id)
+    return data.get('id') or generate_uuid()
+
 def get_current_timestamp() -> datetime:
     """Get current timestamp"""
     return datetime.now()
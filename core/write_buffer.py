@@ -0,0 +1,255 @@
+"""Write-behind buffer for high-frequency small writes
+
+Services hand fire-and-forget writes (scheduled deletions, tag counters,
+deletion results) to the buffer instead of awaiting a round trip each. The
+buffer keeps them in order per collection and writes them with ordered
+bulk_write batches, flushed when max_batch writes are pending or every
+flush_interval seconds. $inc updates of the same document are coalesced
+into one.
+
+Durability: writes are at-least-once. A batch that fails with a transient
+error stays at the head of its queue and is retried; an ordered batch that
+hits a write error (e.g. a duplicate key) drops only the failing write.
+stop() flushes everything before the database client is closed. Without a
+running flusher (scripts, tests) every write is flushed right away.
+
+Reads do not see buffered writes, so only writes that nothing reads back
+immediately belong here.
+"""
+
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from config.database import db_manager
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Attempts of the final flush on shutdown before the rest is given up
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+class _Increment:
+    """Pending $inc of one document, merged with later increments of it"""
+
+    __slots__ = ("filter", "amounts")
+
+    def __init__(self, filter: Dict[str, Any], amounts: Dict[str, float]):
+        self.filter = filter
+        self.amounts = dict(amounts)
+
+    def to_operation(self) -> UpdateOne:
+        return UpdateOne(self.filter, {"$inc": self.amounts})
+
+class WriteBehindBuffer:
+    """Per-collection ordered write queues flushed with bulk_write"""
+
+    def __init__(self, max_batch: int = 500, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # collection -> pending writes in submission order
+        self._queues: "OrderedDict[str, List[Any]]" = OrderedDict()
+        # collection -> {filter key: pending _Increment}
+        self._increments: Dict[str, Dict[Tuple, _Increment]] = {}
+        self._pending = 0
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.flushes = 0
+        self.batches = 0
+        self.operations_written = 0
+        self.coalesced = 0
+        self.failed_batches = 0
+        self.dropped_operations = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.flush_time_total = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def insert_one(self, collection: str, document: Dict[str, Any]) -> None:
+        """Buffer an insert"""
+        await self._add(collection, InsertOne(document))
+
+    async def update_one(self, collection: str, filter: Dict[str, Any],
+                         update: Dict[str, Any], upsert: bool = False) -> None:
+        """Buffer an update, applied in order with the other writes to the collection"""
+        await self._add(collection, UpdateOne(filter, update, upsert=upsert))
+
+    async def increment(self, collection: str, filter: Dict[str, Any], amounts: Dict[str, float]) -> None:
+        """Buffer a counter $inc; increments of the same document are merged"""
+        key = tuple(sorted((name, repr(value)) for name, value in filter.items()))
+        pending = self._increments.setdefault(collection, {})
+        existing = pending.get(key)
+        if existing is not None:
+            for field, amount in amounts.items():
+                existing.amounts[field] = existing.amounts.get(field, 0) + amount
+            self.coalesced += 1
+            return
+
+        increment = _Increment(filter, amounts)
+        pending[key] = increment
+        await self._add(collection, increment)
+
+    async def _add(self, collection: str, operation: Any) -> None:
+        self._queues.setdefault(collection, []).append(operation)
+        self._pending += 1
+
+        if not self.is_running:
+            await self.flush()
+        elif self._pending >= self.max_pending:
+            # Backpressure: the producer waits for the database
+            await self.flush()
+        elif self._pending >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """
+        Write everything pending
+
+        Returns:
+            int: number of writes that are still pending (failed batches)
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            started = time.monotonic()
+            queues, self._queues = self._queues, OrderedDict()
+            # Later increments start new entries, merged ones are already queued
+            self._increments = {}
+
+            for collection, operations in queues.items():
+                remaining = await self._flush_collection(collection, operations)
+                if remaining:
+                    # Put failed writes back in front of anything queued meanwhile
+                    self._queues[collection] = remaining + self._queues.get(collection, [])
+                    self._queues.move_to_end(collection, last=False)
+
+            self._pending = sum(len(operations) for operations in self._queues.values())
+
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.flushes += 1
+            self.flush_time_total += elapsed_ms
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            return self._pending
+
+    async def _flush_collection(self, collection: str, operations: List[Any]) -> List[Any]:
+        """Write one collection's queue in batches; returns the writes left over"""
+        try:
+            target = await db_manager.get_collection_async(collection)
+        except Exception as e:
+            self.failed_batches += 1
+            logger.warning(f"Write buffer cannot reach {collection}, {len(operations)} writes kept: {e}")
+            return operations
+
+        while operations:
+            batch = operations[:self.max_batch]
+            requests = [op.to_operation() if isinstance(op, _Increment) else op for op in batch]
+            done = written = len(batch)
+            try:
+                await target.bulk_write(requests, ordered=True)
+            except BulkWriteError as e:
+                # Ordered batch: everything before the first write error is written,
+                # the failing write would fail again and is dropped
+                errors = e.details.get("writeErrors", [])
+                if errors:
+                    failed = errors[0]
+                    written = failed["index"]
+                    done = written + 1
+                    self.dropped_operations += 1
+                    logger.error(f"Dropped buffered write to {collection}: {failed.get('errmsg')}")
+                self.failed_batches += 1
+            except PyMongoError as e:
+                self.failed_batches += 1
+                logger.warning(f"Write buffer flush to {collection} failed, {len(operations)} writes kept: {e}")
+                return operations
+
+            operations = operations[done:]
+            self.batches += 1
+            self.operations_written += written
+            self.last_batch_size = done
+            self.max_batch_size = max(self.max_batch_size, done)
+
+        return []
+
+    def start(self) -> None:
+        """Start the background flusher"""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write everything pending"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for attempt in range(SHUTDOWN_FLUSH_ATTEMPTS):
+            try:
+                if not await self.flush():
+                    return
+            except Exception as e:
+                logger.error(f"Error flushing write buffer on shutdown: {e}")
+            await asyncio.sleep(0.5 * (attempt + 1))
+
+        logger.error(f"Write buffer stopped with {self._pending} unwritten writes")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing write buffer: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Buffer metrics"""
+        return {
+            "pending": self._pending,
+            "flushes": self.flushes,
+            "batches": self.batches,
+            "operations_written": self.operations_written,
+            "coalesced": self.coalesced,
+            "avg_batch_size": round((self.operations_written + self.dropped_operations) / self.batches, 1) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_ms": round(self.flush_time_total / self.flushes, 2) if self.flushes else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "failed_batches": self.failed_batches,
+            "dropped_operations": self.dropped_operations
+        }
+
+# Global write buffer
+write_buffer = WriteBehindBuffer(
+    max_batch=settings.WRITE_BUFFER_MAX_BATCH,
+    flush_interval=settings.WRITE_BUFFER_FLUSH_INTERVAL,
+    max_pending=settings.WRITE_BUFFER_MAX_PENDING
+)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Проверка, что async-код не использует синхронный драйвер MongoDB
+Статически ищет в async-функциях features/ и core/:
+- вызовы db_manager.get_collection() (sync pymongo)
+- операции коллекции (find_one, insert_one, ...) без await
+
+Во время работы то же самое ловит LoopThreadCommandGuard в config/database.py
+(счетчик sync_commands_on_loop в /api/metrics, DB_STRICT_ASYNC=true делает это ошибкой)
+
+    python dev_tools/check_async_db_access.py
+"""
+
+import ast
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PACKAGES = ["features", "core"]
+
+# Collection methods that do a round trip and must be awaited with Motor
+DRIVER_OPERATIONS = {
+    "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "count_documents",
+    "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "bulk_write", "create_index", "distinct", "to_list"
+}
+
+def check_file(path: str) -> list:
+    """Вернуть список нарушений в файле"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    problems = []
+    for function in ast.walk(tree):
+        if not isinstance(function, ast.AsyncFunctionDef):
+            continue
+
+        awaited = {id(node.value) for node in ast.walk(function) if isinstance(node, ast.Await)}
+        for node in ast.walk(function):
+            if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+                continue
+            name = node.func.attr
+            if name == "get_collection":
+                problems.append((node.lineno, function.name, "sync get_collection()"))
+            elif name in DRIVER_OPERATIONS and id(node) not in awaited:
+                problems.append((node.lineno, function.name, f"{name}() is not awaited"))
+
+    return problems
+
+def main() -> int:
+    print("🔍 ПРОВЕРКА АСИНХРОННОГО ДОСТУПА К MONGODB")
+    print("=" * 50)
+
+    total = 0
+    for package in PACKAGES:
+        for dirpath, _, filenames in os.walk(os.path.join(ROOT, package)):
+            for filename in sorted(filenames):
+                if not filename.endswith(".py"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                for lineno, function, problem in check_file(path):
+                    print(f"❌ {os.path.relpath(path, ROOT)}:{lineno} in {function}: {problem}")
+                    total += 1
+
+    if total:
+        print(f"\n❌ Found {total} blocking database calls")
+        return 1
+    print("✅ No sync driver calls in async code")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
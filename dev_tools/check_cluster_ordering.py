@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Проверка multi-worker режима (CLUSTER_ENABLED=true)
+N координаторов с собственными диспетчерами обрабатывают синтетический поток
+апдейтов через общую коллекцию update_inbox. Проверяется:
+- каждый чат обрабатывается ровно одним воркером
+- порядок апдейтов внутри чата сохраняется
+- при выходе воркера из кольца переезжает только ~1/N чатов
+
+Требуется MongoDB (MONGO_URL), используется отдельная база cluster_ordering_check:
+    python dev_tools/check_cluster_ordering.py --workers 4 --chats 50 --messages 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+from collections import defaultdict
+
+sys.path.append('/app/backend')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cluster import ClusterCoordinator, ConsistentHashRing
+from update_dispatcher import UpdateDispatcher
+from update_prerouter import preroute_update
+
+def make_update(update_id: int, chat_id: int, seq: int) -> dict:
+    """Синтетический текстовый апдейт"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": seq,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "chat": {"id": chat_id, "type": "private"},
+            "date": 0,
+            "text": f"message {seq}"
+        }
+    }
+
+def check_rebalance(workers: int, chats: int) -> bool:
+    """Доля чатов, сменивших владельца при выходе одного воркера"""
+    nodes = [f"worker-{i}" for i in range(workers)]
+    ring = ConsistentHashRing(nodes)
+    before = {chat: ring.owner(chat) for chat in range(chats)}
+
+    ring.set_nodes(nodes[1:])
+    moved = sum(1 for chat in range(chats) if ring.owner(chat) != before[chat])
+    expected = sum(1 for owner in before.values() if owner == nodes[0])
+
+    print(f"🔁 Rebalance: {moved}/{chats} chats moved (owned by the removed worker: {expected})")
+    return moved == expected
+
+async def check_ordering(workers: int, chats: int, messages: int) -> bool:
+    """Обработать поток апдейтов N воркерами и проверить порядок"""
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client["cluster_ordering_check"]
+    await client.drop_database("cluster_ordering_check")
+
+    processed = defaultdict(list)  # chat_id -> [(worker_id, seq)]
+    total = chats * messages
+    done = asyncio.Event()
+
+    coordinators = []
+    dispatchers = []
+    for i in range(workers):
+        worker_id = f"worker-{i}"
+        dispatcher = UpdateDispatcher(worker_count=4, max_queue_size=total)
+
+        async def handle(prerouted, worker_id=worker_id):
+            # Random processing time makes reordering visible if it happens
+            await asyncio.sleep(random.uniform(0, 0.01))
+            processed[prerouted.chat_id].append((worker_id, prerouted.data["message"]["message_id"]))
+            if sum(len(items) for items in processed.values()) == total:
+                done.set()
+
+        dispatcher.start(handle)
+        coordinator = ClusterCoordinator(worker_id, heartbeat_interval=1, poll_interval=0.05)
+        await coordinator.start(db, dispatcher.submit)
+        coordinators.append(coordinator)
+        dispatchers.append(dispatcher)
+
+    # Let every coordinator see the full membership before routing
+    for coordinator in coordinators:
+        await coordinator._heartbeat_once()
+
+    # Updates arrive in update_id order at random ingress workers
+    update_id = 1
+    for seq in range(1, messages + 1):
+        for chat_id in range(1, chats + 1):
+            prerouted = preroute_update(make_update(update_id, chat_id, seq))
+            await random.choice(coordinators).route(prerouted)
+            update_id += 1
+
+    try:
+        await asyncio.wait_for(done.wait(), timeout=60)
+    except asyncio.TimeoutError:
+        print("❌ Timed out waiting for updates to be processed")
+
+    for coordinator in coordinators:
+        await coordinator.stop()
+    for dispatcher in dispatchers:
+        await dispatcher.stop()
+    await client.drop_database("cluster_ordering_check")
+
+    ok = True
+    for chat_id in range(1, chats + 1):
+        items = processed.get(chat_id, [])
+        owners = {worker_id for worker_id, _ in items}
+        sequence = [seq for _, seq in items]
+        if len(owners) != 1:
+            print(f"❌ Chat {chat_id} processed by {sorted(owners)}")
+            ok = False
+        if sequence != list(range(1, messages + 1)):
+            print(f"❌ Chat {chat_id} out of order: {sequence}")
+            ok = False
+
+    per_worker = defaultdict(int)
+    for items in processed.values():
+        for worker_id, _ in items:
+            per_worker[worker_id] += 1
+    print(f"📊 Processed per worker: {dict(sorted(per_worker.items()))}")
+    return ok
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+
+    print("🔍 ПРОВЕРКА MULTI-WORKER РЕЖИМА")
+    print("=" * 50)
+
+    rebalance_ok = check_rebalance(args.workers, 10000)
+    ordering_ok = await check_ordering(args.workers, args.chats, args.messages)
+
+    if rebalance_ok and ordering_ok:
+        print("✅ Per-chat ordering holds across workers")
+        return 0
+    print("❌ Cluster check failed")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Проверка планов запросов по манифесту индексов (config/indexes.py)
+- Заполняет коллекции синтетическими документами
+- Применяет INDEX_MANIFEST (дважды, вторая миграция не должна ничего менять)
+- Выполняет explain() для каждого запроса из HOT_QUERIES
+- Падает, если в выигравшем плане есть COLLSCAN
+
+Требуется MongoDB (MONGO_URL), используется отдельная база index_plan_check:
+    python dev_tools/check_index_plans.py --docs 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append('/app')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config.indexes import (
+    INDEX_MANIFEST, HOT_QUERIES, apply_indexes, explain_query, plan_stages, winning_plan
+)
+
+CHECK_DB = "index_plan_check"
+
+def make_document(i: int) -> dict:
+    """Документ с полями всех запросов; уникальные ключи различаются у каждого i"""
+    base = datetime(2024, 1, 1)
+    return {
+        "id": f"tag-{i}",
+        "user_id": i,
+        "chat_id": -100 - (i % 20),
+        "topic_id": i % 10,
+        "message_id": i,
+        "name": f"tag {i % 50}",
+        "analysis_timestamp": base + timedelta(hours=i),
+        "timestamp": base + timedelta(hours=i),
+        "date": base + timedelta(days=i),
+        "day": base + timedelta(days=i),
+        "month": datetime(2024 + i // 12, i % 12 + 1, 1),
+        "watch_date": base + timedelta(hours=i),
+        "rating": float(i % 10 + 1),
+        "title": f"Movie {i}",
+        "review": "",
+        "food_items": [{"name": f"food {i % 100}", "description": ""}],
+        "scheduled_delete_at": base + timedelta(minutes=i),
+        "deleted": i % 3 == 0,
+        "deletion_attempted": i % 3 == 0,
+        "usage_count": i % 7,
+        "tagged_at": base + timedelta(minutes=i),
+        "tags": [f"tag-{i % 30}"],
+        "content": f"message {i}",
+        "enabled": i % 2 == 0,
+        "priority": i % 5
+    }
+
+async def seed(db, docs: int) -> None:
+    collections = {spec.collection for spec in INDEX_MANIFEST} | {query.collection for query in HOT_QUERIES}
+    for collection in sorted(collections):
+        await db[collection].insert_many([make_document(i) for i in range(docs)])
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000, help="documents per collection")
+    args = parser.parse_args()
+
+    print("🔍 ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ")
+    print("=" * 50)
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    await client.drop_database(CHECK_DB)
+    db = client[CHECK_DB]
+
+    failures = 0
+    try:
+        await seed(db, args.docs)
+
+        summary = await apply_indexes(db)
+        print(f"📦 Migration: {summary}")
+        if summary["failed"]:
+            failures += 1
+
+        again = await apply_indexes(db)
+        if again["created"] or again["dropped"]:
+            print(f"❌ Migration is not idempotent: {again}")
+            failures += 1
+
+        for query in HOT_QUERIES:
+            stages = plan_stages(winning_plan(await explain_query(db, query)))
+            plan = " → ".join(reversed(stages))
+            if "COLLSCAN" in stages:
+                print(f"❌ {query.name} ({query.collection}, {query.source}): {plan}")
+                failures += 1
+            else:
+                print(f"✅ {query.name}: {plan}")
+    finally:
+        await client.drop_database(CHECK_DB)
+        client.close()
+
+    if failures:
+        print(f"\n❌ {failures} problems found")
+        return 1
+    print(f"\n✅ All {len(HOT_QUERIES)} queries use an index")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Проверка long polling (TELEGRAM_UPDATE_MODE=polling) без Telegram
+Поднимает локальный фейковый Bot API (getUpdates, deleteWebhook) и гоняет
+PollingRunner через TELEGRAM_API_BASE_URL-совместимый адрес. Проверяется:
+- пачки не больше limit, все апдейты приходят по порядку ровно один раз
+- offset подтверждает обработанные апдейты (фейк их удаляет, как Telegram)
+- апдейт, отклоненный занятой очередью (INGEST_BUSY), приходит повторно
+- после рестарта runner продолжает с сохраненного offset
+- ошибка API не останавливает цикл, webhook снимается при старте
+
+MongoDB не нужна, offset хранится в коллекции-заглушке в памяти:
+    python dev_tools/check_polling_runner.py --updates 250
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.append('/app/backend')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from polling_runner import PollingRunner, INGEST_BUSY
+
+TOKEN = "123456:fake-token"
+
+class FakeBotAPI:
+    """Минимальный HTTP-сервер с методами Bot API, нужными PollingRunner"""
+
+    def __init__(self):
+        self.pending = []  # updates not confirmed by offset yet
+        self.next_update_id = 1000
+        self.calls = []  # (method, params)
+        self.fail_next = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def add_updates(self, count: int) -> None:
+        for _ in range(count):
+            chat_id = 100 + self.next_update_id % 7
+            self.pending.append({
+                "update_id": self.next_update_id,
+                "message": {
+                    "message_id": self.next_update_id,
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "Fake"},
+                    "chat": {"id": chat_id, "type": "private"},
+                    "date": 0,
+                    "text": f"update {self.next_update_id}"
+                }
+            })
+            self.next_update_id += 1
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _dispatch(self, method: str, params: dict) -> dict:
+        self.calls.append((method, params))
+        if self.fail_next:
+            self.fail_next -= 1
+            return {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        if method == "deleteWebhook":
+            return {"ok": True, "result": True}
+        if method == "getUpdates":
+            offset = params.get("offset")
+            if offset is not None:
+                # Like Telegram: an offset confirms every update below it
+                self.pending = [update for update in self.pending if update["update_id"] >= offset]
+            return {"ok": True, "result": self.pending[:params.get("limit", 100)]}
+        return {"ok": False, "error_code": 404, "description": "Not Found"}
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = request_line.decode().split()[1]
+                method = path.rsplit("/", 1)[-1]
+                payload = self._dispatch(method, json.loads(body or b"{}"))
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+class MemoryStateCollection:
+    """polling_state без MongoDB: find_one/update_one по _id"""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query):
+        return self.documents.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        document = self.documents.setdefault(query["_id"], {"_id": query["_id"]})
+        document.update(update["$set"])
+
+def make_runner(api: FakeBotAPI, ingest, state: MemoryStateCollection) -> PollingRunner:
+    runner = PollingRunner(token=TOKEN, ingest=ingest, api_base_url=api.base_url, poll_timeout=0)
+    runner.state_collection = state
+    runner.base_delay = 0.01
+    return runner
+
+async def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+async def check_polling(total: int) -> bool:
+    api = FakeBotAPI()
+    await api.start()
+    state = MemoryStateCollection()
+    received = []
+    busy_once = {api.next_update_id + total // 2}
+
+    async def ingest(update_data):
+        update_id = update_data["update_id"]
+        if update_id in busy_once:
+            # Full queue: the runner must not move the offset past it
+            busy_once.discard(update_id)
+            return INGEST_BUSY
+        received.append(update_id)
+        return "queued"
+
+    ok = True
+    try:
+        api.add_updates(total)
+        api.fail_next = 2  # deleteWebhook and the first getUpdates fail, the loop must recover
+        runner = make_runner(api, ingest, state)
+        await runner.start()
+
+        ok &= await wait_for(lambda: len(received) == total)
+        await runner.stop()
+
+        expected = list(range(1000, 1000 + total))
+        polls = [params for method, params in api.calls if method == "getUpdates"]
+        print(f"📦 {total} updates in {runner.batches_total} batches (limit {polls[0].get('limit')})")
+
+        if received != expected:
+            print("❌ Updates lost, duplicated or reordered")
+            ok = False
+        if not api.calls or api.calls[0][0] != "deleteWebhook":
+            print("❌ Webhook was not removed before polling")
+            ok = False
+        if runner.batches_total < (total + 99) // 100:
+            print("❌ Batches larger than the getUpdates limit")
+            ok = False
+        if runner.errors_total < 1:
+            print("❌ API error was not counted")
+            ok = False
+        if state.documents.get(runner.state_key, {}).get("offset") != 1000 + total:
+            print(f"❌ Saved offset {state.documents.get(runner.state_key)} != {1000 + total}")
+            ok = False
+        print(f"🔁 getUpdates calls: {len(polls)}, errors: {runner.errors_total}")
+
+        # Restart: a new runner resumes from the saved offset and sees only new updates
+        api.add_updates(10)
+        restarted = make_runner(api, ingest, state)
+        await restarted._load_offset()
+        async with httpx.AsyncClient() as client:
+            restarted._client = client
+            fetched = await restarted.poll_once()
+
+        resumed_offset = api.calls[-1][1].get("offset")
+        new_ids = list(range(1000 + total, 1010 + total))
+        if resumed_offset != 1000 + total or fetched != 10 or received[total:] != new_ids:
+            print(f"❌ Restart resumed from {resumed_offset}, fetched {fetched}")
+            ok = False
+        else:
+            print(f"✅ Restart resumed from offset {resumed_offset}")
+    finally:
+        await api.stop()
+
+    return ok
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=250)
+    args = parser.parse_args()
+
+    print("🧪 ПРОВЕРКА LONG POLLING НА ФЕЙКОВОМ BOT API")
+    print("=" * 50)
+
+    ok = await check_polling(args.updates)
+    print("✅ Polling runner OK" if ok else "❌ Polling runner check failed")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
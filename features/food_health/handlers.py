@@ -9,6 +9,16 @@ from core.utils import (
     download_image_as_base64, format_nutrition_text, 
     create_keyboard, get_current_timestamp
 )
+from core.callbacks import callback_registry
+from core.streaming import StreamingMessage
+from core.admission import (
+    admission_controller, AdmissionRejected, queue_position_text,
+    OP_PHOTO_ANALYSIS, OP_HEALTH_ADVICE
+)
+from config.constants import (
+    CB_CLOSE_MENU, CB_FOOD_STATS, CB_FOOD_SEARCH, CB_HEALTH_PROFILE_MENU,
+    CB_HEALTH_ADVICE, CB_HEALTH_GOALS, CB_HEALTH_EDIT, CB_HEALTH_ADD, CB_HEALTH_STATS
+)
 from .services import FoodAnalysisService, HealthProfileService, HealthAIService
 from .models import WorkoutSession, StepsData
 
@@ -42,16 +52,26 @@ class FoodHealthHandlers:
                 reply_to_message_id=message_id
             )
             
-            image_base64 = download_image_as_base64(file_url)
-            if not image_base64:
-                await status_message.edit_text("❌ Не удалось загрузить изображение")
+            # Vision call goes through admission control; when busy the status
+            # message shows the position in line
+            try:
+                async with admission_controller.slot(
+                    OP_PHOTO_ANALYSIS, user_id, chat_id,
+                    notify=lambda position: status_message.edit_text(queue_position_text(position))
+                ):
+                    image_base64 = download_image_as_base64(file_url)
+                    if not image_base64:
+                        await status_message.edit_text("❌ Не удалось загрузить изображение")
+                        return
+                    
+                    # Analyze food
+                    analysis = await self.food_service.analyze_food_image(
+                        image_base64, user_id, chat_id, message_id
+                    )
+            except AdmissionRejected as e:
+                await status_message.edit_text(e.user_message)
                 return
             
-            # Analyze food
-            analysis = await self.food_service.analyze_food_image(
-                image_base64, user_id, chat_id, message_id
-            )
-            
             if not analysis or not analysis.food_items:
                 await status_message.edit_text(
                     "🤷‍♂️ На изображении не обнаружено еды или не удалось проанализировать"
@@ -83,12 +103,12 @@ class FoodHealthHandlers:
             # Create action buttons
             keyboard = [
                 [
-                    InlineKeyboardButton("📈 Статистика", callback_data=f"food_stats_{user_id}"),
-                    InlineKeyboardButton("🎯 Цели", callback_data=f"health_goals_{user_id}")
+                    InlineKeyboardButton("📈 Статистика", callback_data=callback_registry.encode(CB_FOOD_STATS, user_id, None)),
+                    InlineKeyboardButton("🎯 Цели", callback_data=callback_registry.encode(CB_HEALTH_GOALS, user_id))
                 ],
                 [
-                    InlineKeyboardButton("💡 Совет", callback_data=f"health_advice_{user_id}"),
-                    InlineKeyboardButton("🔍 Поиск", callback_data=f"food_search_{user_id}")
+                    InlineKeyboardButton("💡 Совет", callback_data=callback_registry.encode(CB_HEALTH_ADVICE, "general")),
+                    InlineKeyboardButton("🔍 Поиск", callback_data=callback_registry.encode(CB_FOOD_SEARCH, user_id))
                 ]
             ]
             
@@ -145,25 +165,25 @@ class FoodHealthHandlers:
             # Menu buttons
             keyboard = [
                 [
-                    InlineKeyboardButton("✏️ Рост", callback_data="health_edit_height"),
-                    InlineKeyboardButton("⚖️ Вес", callback_data="health_edit_weight"),
-                    InlineKeyboardButton("🎂 Возраст", callback_data="health_edit_age")
+                    InlineKeyboardButton("✏️ Рост", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "height")),
+                    InlineKeyboardButton("⚖️ Вес", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "weight")),
+                    InlineKeyboardButton("🎂 Возраст", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "age"))
                 ],
                 [
-                    InlineKeyboardButton("👫 Пол", callback_data="health_edit_gender"),
-                    InlineKeyboardButton("🏃‍♂️ Активность", callback_data="health_edit_activity"),
-                    InlineKeyboardButton("🎯 Цель", callback_data="health_edit_goal")
+                    InlineKeyboardButton("👫 Пол", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "gender")),
+                    InlineKeyboardButton("🏃‍♂️ Активность", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "activity")),
+                    InlineKeyboardButton("🎯 Цель", callback_data=callback_registry.encode(CB_HEALTH_EDIT, "goal"))
                 ],
                 [
-                    InlineKeyboardButton("💪 Тренировка", callback_data="health_add_workout"),
-                    InlineKeyboardButton("👣 Шаги", callback_data="health_add_steps")
+                    InlineKeyboardButton("💪 Тренировка", callback_data=callback_registry.encode(CB_HEALTH_ADD, "workout")),
+                    InlineKeyboardButton("👣 Шаги", callback_data=callback_registry.encode(CB_HEALTH_ADD, "steps"))
                 ],
                 [
-                    InlineKeyboardButton("📊 Статистика", callback_data="health_stats"),
-                    InlineKeyboardButton("💡 Совет", callback_data="health_advice_general")
+                    InlineKeyboardButton("📊 Статистика", callback_data=callback_registry.encode(CB_HEALTH_STATS)),
+                    InlineKeyboardButton("💡 Совет", callback_data=callback_registry.encode(CB_HEALTH_ADVICE, "general"))
                 ],
                 [
-                    InlineKeyboardButton("❌ Закрыть", callback_data="close_menu")
+                    InlineKeyboardButton("❌ Закрыть", callback_data=callback_registry.encode(CB_CLOSE_MENU))
                 ]
             ]
             
@@ -188,18 +208,18 @@ class FoodHealthHandlers:
         """Show food statistics"""
         try:
             query = update.callback_query
-            user_id = int(query.data.split("_")[-1])
+            user_id, period = context.callback_args
             
             # Period selection buttons
-            if query.data == f"food_stats_{user_id}":
+            if period is None:
                 keyboard = [
                     [
-                        InlineKeyboardButton("Сегодня", callback_data=f"food_stats_period_{user_id}_today"),
-                        InlineKeyboardButton("Неделя", callback_data=f"food_stats_period_{user_id}_week")
+                        InlineKeyboardButton("Сегодня", callback_data=callback_registry.encode(CB_FOOD_STATS, user_id, "today")),
+                        InlineKeyboardButton("Неделя", callback_data=callback_registry.encode(CB_FOOD_STATS, user_id, "week"))
                     ],
                     [
-                        InlineKeyboardButton("Месяц", callback_data=f"food_stats_period_{user_id}_month"),
-                        InlineKeyboardButton("◀️ Назад", callback_data="health_profile_menu")
+                        InlineKeyboardButton("Месяц", callback_data=callback_registry.encode(CB_FOOD_STATS, user_id, "month")),
+                        InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_HEALTH_PROFILE_MENU))
                     ]
                 ]
                 
@@ -211,7 +231,6 @@ class FoodHealthHandlers:
                 return
             
             # Show statistics for period
-            period = query.data.split("_")[-1]
             stats = await self.food_service.get_user_food_statistics(user_id, period)
             
             period_names = {
@@ -234,8 +253,8 @@ class FoodHealthHandlers:
             
             keyboard = [
                 [
-                    InlineKeyboardButton("◀️ Назад", callback_data=f"food_stats_{user_id}"),
-                    InlineKeyboardButton("💡 Совет", callback_data="health_advice_nutrition")
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_FOOD_STATS, user_id, None)),
+                    InlineKeyboardButton("💡 Совет", callback_data=callback_registry.encode(CB_HEALTH_ADVICE, "nutrition"))
                 ]
             ]
             
@@ -258,33 +277,34 @@ class FoodHealthHandlers:
             user_id = update.effective_user.id
             
             # Determine advice type
-            advice_type = "general"
-            if "_nutrition" in query.data:
-                advice_type = "nutrition"
-            elif "_fitness" in query.data:
-                advice_type = "fitness"
-            elif "_goals" in query.data:
-                advice_type = "goals"
-            
-            # Get AI recommendation
-            recommendation = await self.ai_service.get_personalized_recommendation(
-                user_id, advice_type
-            )
+            advice_type = context.callback_args[0]
+            if advice_type not in ("nutrition", "fitness", "goals"):
+                advice_type = "general"
             
-            advice_text = f"🤖 **ПЕРСОНАЛЬНЫЙ СОВЕТ**\n\n{recommendation}"
+            # Stream the AI recommendation into the menu message
+            advice_title = "🤖 **ПЕРСОНАЛЬНЫЙ СОВЕТ**\n\n"
+            try:
+                async with admission_controller.slot(
+                    OP_HEALTH_ADVICE, user_id, update.effective_chat.id,
+                    notify=lambda position: query.message.reply_text(queue_position_text(position))
+                ):
+                    await query.edit_message_text(f"{advice_title}⏳ Генерирую совет...", parse_mode="Markdown")
+                    advice = StreamingMessage(
+                        context.bot, query.message.chat_id, query.message.message_id, prefix=advice_title
+                    )
+                    await advice.stream(self.ai_service.stream_personalized_recommendation(user_id, advice_type))
+            except AdmissionRejected as e:
+                await query.message.reply_text(e.user_message)
+                return
             
             keyboard = [
                 [
-                    InlineKeyboardButton("🔄 Другой совет", callback_data=f"health_advice_{advice_type}"),
-                    InlineKeyboardButton("📊 Профиль", callback_data="health_profile_menu")
+                    InlineKeyboardButton("🔄 Другой совет", callback_data=callback_registry.encode(CB_HEALTH_ADVICE, advice_type)),
+                    InlineKeyboardButton("📊 Профиль", callback_data=callback_registry.encode(CB_HEALTH_PROFILE_MENU))
                 ]
             ]
             
-            await query.edit_message_text(
-                advice_text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="Markdown"
-            )
+            await advice.finish(reply_markup=InlineKeyboardMarkup(keyboard))
         
         except Exception as e:
             logger.error(f"Error getting health advice: {e}")
@@ -339,8 +359,8 @@ class FoodHealthHandlers:
                 
                 keyboard = [
                     [
-                        InlineKeyboardButton("📊 Статистика", callback_data="health_stats"),
-                        InlineKeyboardButton("👤 Профиль", callback_data="health_profile_menu")
+                        InlineKeyboardButton("📊 Статистика", callback_data=callback_registry.encode(CB_HEALTH_STATS)),
+                        InlineKeyboardButton("👤 Профиль", callback_data=callback_registry.encode(CB_HEALTH_PROFILE_MENU))
                     ]
                 ]
                 
@@ -396,8 +416,8 @@ class FoodHealthHandlers:
                 
                 keyboard = [
                     [
-                        InlineKeyboardButton("📊 Статистика", callback_data="health_stats"),
-                        InlineKeyboardButton("👤 Профиль", callback_data="health_profile_menu")
+                        InlineKeyboardButton("📊 Статистика", callback_data=callback_registry.encode(CB_HEALTH_STATS)),
+                        InlineKeyboardButton("👤 Профиль", callback_data=callback_registry.encode(CB_HEALTH_PROFILE_MENU))
                     ]
                 ]
                 
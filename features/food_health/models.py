@@ -3,7 +3,7 @@
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from core.utils import generate_uuid, get_current_timestamp
+from core.utils import generate_uuid, get_current_timestamp, id_to_bson, id_from_document
 
 @dataclass
 class NutritionData:
@@ -52,8 +52,8 @@ class FoodItem:
     created_at: datetime = field(default_factory=get_current_timestamp)
     
     def to_dict(self) -> Dict[str, Any]:
+        # Embedded in food_analysis and never referenced, so the id is not stored
         return {
-            'id': self.id,
             'name': self.name,
             'description': self.description,
             'portion_size': self.portion_size,
@@ -109,7 +109,7 @@ class FoodAnalysis:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'user_id': self.user_id,
             'chat_id': self.chat_id,
             'message_id': self.message_id,
@@ -131,7 +131,7 @@ class FoodAnalysis:
             total_nutrition = NutritionData.from_dict(data['total_nutrition'])
         
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             user_id=data.get('user_id', 0),
             chat_id=data.get('chat_id', 0),
             message_id=data.get('message_id', 0),
@@ -272,7 +272,7 @@ class WorkoutSession:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            'id': id_to_bson(self.id),
             'user_id': self.user_id,
             'activity_type': self.activity_type,
             'duration': self.duration,
@@ -285,7 +285,7 @@ class WorkoutSession:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'WorkoutSession':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=str(data.get('id') or generate_uuid()),
             user_id=data.get('user_id', 0),
             activity_type=data.get('activity_type', ''),
             duration=data.get('duration', 0.0),
@@ -3,14 +3,18 @@
 import logging
 import json
 import asyncio
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from datetime import datetime, timedelta
-import openai
-from openai import OpenAI
 
 from config.settings import settings
 from config.database import db_manager
-from config.constants import COLLECTION_FOOD_ANALYSIS, COLLECTION_HEALTH_PROFILES, COLLECTION_WORKOUTS, COLLECTION_STEPS
+from config.constants import (
+    COLLECTION_FOOD_ANALYSIS, COLLECTION_HEALTH_PROFILES, COLLECTION_FITNESS_MONTHS,
+    COLLECTION_DAILY_NUTRITION, DAILY_NUTRITION_FIELDS,
+    CACHE_KEY_FOOD_STATS, CACHE_KEY_USER_PROFILE, FOOD_STATS_PERIODS
+)
+from core.cache import cache
+from core.llm_gateway import llm_gateway, LANE_INTERACTIVE
 from core.utils import (
     download_image_as_base64, validate_nutrition_data, 
     format_nutrition_text, parse_json_response, get_date_range
@@ -22,12 +26,17 @@ from .models import (
 
 logger = logging.getLogger(__name__)
 
+def rollup_day(timestamp: datetime) -> datetime:
+    """Day key of the daily_nutrition rollup"""
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def fitness_month(timestamp: datetime) -> datetime:
+    """Month key of the fitness_months buckets"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
 class FoodAnalysisService:
     """Service for food analysis using OpenAI Vision API"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        
     async def analyze_food_image(self, image_base64: str, user_id: int, chat_id: int, message_id: int) -> Optional[FoodAnalysis]:
         """Analyze food image using OpenAI Vision API"""
         try:
@@ -39,13 +48,13 @@ class FoodAnalysisService:
             # Try with primary model first
             try:
                 response = await self._call_openai_vision(
-                    image_base64, prompt, settings.OPENAI_MODEL_DEFAULT
+                    image_base64, prompt, settings.OPENAI_MODEL_DEFAULT, user_id
                 )
                 model_used = settings.OPENAI_MODEL_DEFAULT
             except Exception as e:
                 logger.warning(f"Primary model failed, trying fallback: {e}")
                 response = await self._call_openai_vision(
-                    image_base64, prompt, settings.OPENAI_MODEL_FALLBACK
+                    image_base64, prompt, settings.OPENAI_MODEL_FALLBACK, user_id
                 )
                 model_used = settings.OPENAI_MODEL_FALLBACK
             
@@ -74,10 +83,11 @@ class FoodAnalysisService:
             logger.error(f"Error analyzing food image: {e}")
             return None
     
-    async def _call_openai_vision(self, image_base64: str, prompt: str, model: str) -> str:
+    async def _call_openai_vision(self, image_base64: str, prompt: str, model: str,
+                                  user_id: Optional[int] = None) -> str:
         """Call OpenAI Vision API"""
         try:
-            response = self.client.chat.completions.create(
+            return await llm_gateway.complete(
                 model=model,
                 messages=[
                     {
@@ -95,11 +105,11 @@ class FoodAnalysisService:
                     }
                 ],
                 max_tokens=1000,
-                temperature=0.3
+                temperature=0.3,
+                lane=LANE_INTERACTIVE,
+                user_id=user_id
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"OpenAI Vision API error: {e}")
             raise
@@ -192,77 +202,90 @@ class FoodAnalysisService:
     async def _save_food_analysis(self, food_analysis: FoodAnalysis) -> None:
         """Save food analysis to database"""
         try:
-            collection = db_manager.get_collection(COLLECTION_FOOD_ANALYSIS)
-            collection.insert_one(food_analysis.to_dict())
+            collection = await db_manager.get_collection_async(COLLECTION_FOOD_ANALYSIS)
+            await collection.insert_one(food_analysis.to_dict())
             logger.info(f"Food analysis saved for user {food_analysis.user_id}")
         except Exception as e:
             logger.error(f"Error saving food analysis: {e}")
             raise
+        
+        await self._add_to_daily_rollup(food_analysis)
+    
+    async def _add_to_daily_rollup(self, food_analysis: FoodAnalysis) -> None:
+        """Add a saved analysis to its day in daily_nutrition (atomic $inc upsert)"""
+        try:
+            nutrition = food_analysis.total_nutrition or food_analysis.calculate_total_nutrition()
+            increments = {field: getattr(nutrition, field) or 0 for field in DAILY_NUTRITION_FIELDS}
+            increments["meal_count"] = 1
+            
+            collection = await db_manager.get_collection_async(COLLECTION_DAILY_NUTRITION)
+            await collection.update_one(
+                {"user_id": food_analysis.user_id, "day": rollup_day(food_analysis.analysis_timestamp)},
+                {"$inc": increments, "$set": {"updated_at": datetime.now()}},
+                upsert=True
+            )
+            
+            await cache.invalidate(*(
+                CACHE_KEY_FOOD_STATS.format(user_id=food_analysis.user_id, period=period)
+                for period in FOOD_STATS_PERIODS
+            ))
+        except Exception as e:
+            # The analysis itself is saved; scripts/backfill_daily_nutrition.py repairs the day
+            logger.error(f"Error updating daily nutrition rollup: {e}")
     
     async def get_user_food_statistics(
         self, user_id: int, period: str = "week"
     ) -> Dict[str, Any]:
-        """Get user food statistics for a period"""
+        """Get user food statistics for a period (cached, invalidated when a meal is saved)"""
         try:
-            start_date, end_date = get_date_range(period)
-            
-            collection = db_manager.get_collection(COLLECTION_FOOD_ANALYSIS)
-            
-            # Aggregation pipeline
-            pipeline = [
-                {
-                    "$match": {
-                        "user_id": user_id,
-                        "analysis_timestamp": {"$gte": start_date, "$lte": end_date}
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": None,
-                        "total_calories": {"$sum": "$total_nutrition.calories"},
-                        "total_protein": {"$sum": "$total_nutrition.protein"},
-                        "total_carbs": {"$sum": "$total_nutrition.carbs"},
-                        "total_fat": {"$sum": "$total_nutrition.fat"},
-                        "meal_count": {"$sum": 1},
-                        "avg_calories_per_meal": {"$avg": "$total_nutrition.calories"}
-                    }
-                }
-            ]
-            
-            result = list(collection.aggregate(pipeline))
-            
-            if result:
-                stats = result[0]
-                return {
-                    "period": period,
-                    "total_calories": round(stats.get("total_calories", 0), 1),
-                    "total_protein": round(stats.get("total_protein", 0), 1),
-                    "total_carbs": round(stats.get("total_carbs", 0), 1),
-                    "total_fat": round(stats.get("total_fat", 0), 1),
-                    "meal_count": stats.get("meal_count", 0),
-                    "avg_calories_per_meal": round(stats.get("avg_calories_per_meal", 0), 1)
-                }
-            else:
-                return {
-                    "period": period,
-                    "total_calories": 0,
-                    "total_protein": 0,
-                    "total_carbs": 0,
-                    "total_fat": 0,
-                    "meal_count": 0,
-                    "avg_calories_per_meal": 0
-                }
-                
+            return await cache.get_or_load(
+                CACHE_KEY_FOOD_STATS.format(user_id=user_id, period=period),
+                lambda: self._compute_food_statistics(user_id, period)
+            )
         except Exception as e:
             logger.error(f"Error getting food statistics: {e}")
             return {}
     
+    async def _compute_food_statistics(self, user_id: int, period: str) -> Dict[str, Any]:
+        start_date, end_date = get_date_range(period)
+        
+        # Whole days from the daily rollup: at most 31 small documents for a month
+        collection = await db_manager.get_collection_async(COLLECTION_DAILY_NUTRITION)
+        days = await collection.find(
+            {"user_id": user_id, "day": {"$gte": rollup_day(start_date), "$lte": end_date}},
+            {"_id": 0, "meal_count": 1, **{field: 1 for field in DAILY_NUTRITION_FIELDS}}
+        ).to_list(length=None)
+        
+        meal_count = sum(day.get("meal_count", 0) for day in days)
+        
+        if meal_count:
+            totals = {field: sum(day.get(field, 0) for day in days) for field in DAILY_NUTRITION_FIELDS}
+            return {
+                "period": period,
+                "total_calories": round(totals["calories"], 1),
+                "total_protein": round(totals["protein"], 1),
+                "total_carbs": round(totals["carbs"], 1),
+                "total_fat": round(totals["fat"], 1),
+                "meal_count": meal_count,
+                "avg_calories_per_meal": round(totals["calories"] / meal_count, 1)
+            }
+        else:
+            return {
+                "period": period,
+                "total_calories": 0,
+                "total_protein": 0,
+                "total_carbs": 0,
+                "total_fat": 0,
+                "meal_count": 0,
+                "avg_calories_per_meal": 0
+            }
+    
     async def search_food_database(
         self, user_id: int, query: str, limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Search user's food database"""
         try:
-            collection = db_manager.get_collection(COLLECTION_FOOD_ANALYSIS)
+            collection = await db_manager.get_collection_async(COLLECTION_FOOD_ANALYSIS)
             
             # Create search query
             search_query = {
@@ -276,7 +299,7 @@ class FoodAnalysisService:
             results = collection.find(search_query).limit(limit).sort("analysis_timestamp", -1)
             
             found_items = []
-            for analysis in results:
+            async for analysis in results:
                 for food_item in analysis.get("food_items", []):
                     if (query.lower() in food_item.get("name", "").lower() or 
                         query.lower() in food_item.get("description", "").lower()):
@@ -299,39 +322,47 @@ class HealthProfileService:
     """Service for managing user health profiles"""
     
     async def get_or_create_profile(self, user_id: int) -> HealthProfile:
-        """Get existing profile or create new one"""
+        """Get existing profile or create new one (cached, invalidated by update_profile)"""
         try:
-            collection = db_manager.get_collection(COLLECTION_HEALTH_PROFILES)
-            
-            # Try to find existing profile
-            existing = collection.find_one({"user_id": user_id})
-            
-            if existing:
-                return HealthProfile.from_dict(existing)
-            else:
-                # Create new profile
-                profile = HealthProfile(user_id=user_id)
-                collection.insert_one(profile.to_dict())
-                logger.info(f"Created new health profile for user {user_id}")
-                return profile
+            profile_data = await cache.get_or_load(
+                CACHE_KEY_USER_PROFILE.format(user_id=user_id),
+                lambda: self._load_or_create_profile(user_id)
+            )
+            return HealthProfile.from_dict(profile_data)
                 
         except Exception as e:
             logger.error(f"Error getting/creating health profile: {e}")
             return HealthProfile(user_id=user_id)
     
+    async def _load_or_create_profile(self, user_id: int) -> Dict[str, Any]:
+        collection = await db_manager.get_collection_async(COLLECTION_HEALTH_PROFILES)
+        
+        # Try to find existing profile
+        existing = await collection.find_one({"user_id": user_id}, {"_id": 0})
+        
+        if existing:
+            return existing
+        
+        # Create new profile
+        profile = HealthProfile(user_id=user_id)
+        await collection.insert_one(profile.to_dict())
+        logger.info(f"Created new health profile for user {user_id}")
+        return profile.to_dict()
+    
     async def update_profile(self, user_id: int, updates: Dict[str, Any]) -> bool:
         """Update health profile"""
         try:
-            collection = db_manager.get_collection(COLLECTION_HEALTH_PROFILES)
+            collection = await db_manager.get_collection_async(COLLECTION_HEALTH_PROFILES)
             
             # Add updated timestamp
             updates["updated_at"] = datetime.now()
             
-            result = collection.update_one(
+            result = await collection.update_one(
                 {"user_id": user_id},
                 {"$set": updates},
                 upsert=True
             )
+            await cache.invalidate(CACHE_KEY_USER_PROFILE.format(user_id=user_id))
             
             logger.info(f"Updated health profile for user {user_id}")
             return result.modified_count > 0 or result.upserted_id is not None
@@ -350,10 +381,17 @@ class HealthProfileService:
             return {}
     
     async def save_workout(self, workout: WorkoutSession) -> bool:
-        """Save workout session"""
+        """Save workout session into the user's monthly fitness bucket"""
         try:
-            collection = db_manager.get_collection(COLLECTION_WORKOUTS)
-            collection.insert_one(workout.to_dict())
+            entry = workout.to_dict()
+            del entry["user_id"]
+            
+            collection = await db_manager.get_collection_async(COLLECTION_FITNESS_MONTHS)
+            await collection.update_one(
+                {"user_id": workout.user_id, "month": fitness_month(workout.timestamp)},
+                {"$push": {"workouts": entry}},
+                upsert=True
+            )
             logger.info(f"Saved workout for user {workout.user_id}")
             return True
         except Exception as e:
@@ -361,17 +399,18 @@ class HealthProfileService:
             return False
     
     async def save_steps(self, steps_data: StepsData) -> bool:
-        """Save daily steps data"""
+        """Save daily steps data into the user's monthly fitness bucket"""
         try:
-            collection = db_manager.get_collection(COLLECTION_STEPS)
-            
-            # Update or insert for the specific date
-            result = collection.update_one(
-                {
-                    "user_id": steps_data.user_id,
-                    "date": steps_data.date
-                },
-                {"$set": steps_data.to_dict()},
+            entry = steps_data.to_dict()
+            # The bucket and the day slot already identify the entry
+            del entry["user_id"], entry["id"]
+            
+            collection = await db_manager.get_collection_async(COLLECTION_FITNESS_MONTHS)
+            
+            # Update or insert for the specific date (one slot per day of the month)
+            await collection.update_one(
+                {"user_id": steps_data.user_id, "month": fitness_month(steps_data.date)},
+                {"$set": {f"steps.{steps_data.date.day:02d}": entry}},
                 upsert=True
             )
             
@@ -382,40 +421,56 @@ class HealthProfileService:
             return False
     
     async def get_fitness_summary(self, user_id: int, period: str = "week") -> Dict[str, Any]:
-        """Get fitness activity summary"""
+        """Get fitness activity summary (summed on the server over at most two monthly buckets)"""
         try:
             start_date, end_date = get_date_range(period)
             
-            # Get workouts
-            workouts_collection = db_manager.get_collection(COLLECTION_WORKOUTS)
-            workouts = list(workouts_collection.find({
-                "user_id": user_id,
-                "timestamp": {"$gte": start_date, "$lte": end_date}
-            }))
+            def in_period(path: str) -> Dict[str, Any]:
+                return {"$and": [{"$gte": [path, start_date]}, {"$lte": [path, end_date]}]}
             
-            # Get steps
-            steps_collection = db_manager.get_collection(COLLECTION_STEPS)
-            steps = list(steps_collection.find({
-                "user_id": user_id,
-                "date": {"$gte": start_date, "$lte": end_date}
-            }))
+            pipeline = [
+                {"$match": {
+                    "user_id": user_id,
+                    "month": {"$gte": fitness_month(start_date), "$lte": end_date}
+                }},
+                {"$project": {
+                    "workouts": {"$filter": {
+                        "input": {"$ifNull": ["$workouts", []]},
+                        "as": "workout",
+                        "cond": in_period("$$workout.timestamp")
+                    }},
+                    "steps": {"$filter": {
+                        "input": {"$objectToArray": {"$ifNull": ["$steps", {}]}},
+                        "as": "day",
+                        "cond": in_period("$$day.v.date")
+                    }}
+                }},
+                {"$group": {
+                    "_id": None,
+                    "total_workouts": {"$sum": {"$size": "$workouts"}},
+                    "total_workout_time": {"$sum": {"$sum": "$workouts.duration"}},
+                    "total_workout_calories": {"$sum": {"$sum": "$workouts.calories_burned"}},
+                    "total_steps": {"$sum": {"$sum": "$steps.v.steps"}},
+                    "active_days": {"$sum": {"$size": "$steps"}}
+                }}
+            ]
             
-            # Calculate summary
-            total_workouts = len(workouts)
-            total_workout_time = sum(w.get("duration", 0) for w in workouts)
-            total_workout_calories = sum(w.get("calories_burned", 0) for w in workouts)
+            collection = await db_manager.get_collection_async(COLLECTION_FITNESS_MONTHS)
+            result = await collection.aggregate(pipeline).to_list(length=1)
+            summary = result[0] if result else {}
             
-            total_steps = sum(s.get("steps", 0) for s in steps)
-            avg_daily_steps = total_steps / max(len(steps), 1)
+            total_steps = summary.get("total_steps", 0)
+            active_days = summary.get("active_days", 0)
+            avg_daily_steps = total_steps / max(active_days, 1)
             
             return {
                 "period": period,
-                "total_workouts": total_workouts,
-                "total_workout_time": round(total_workout_time, 1),
-                "total_workout_calories": round(total_workout_calories, 1),
+                "total_workouts": summary.get("total_workouts", 0),
+                "total_workout_time": round(summary.get("total_workout_time", 0), 1),
+                "total_workout_calories": round(summary.get("total_workout_calories", 0), 1),
                 "total_steps": total_steps,
                 "avg_daily_steps": round(avg_daily_steps, 0),
-                "active_days": len(steps)
+                "active_days": active_days
             }
             
         except Exception as e:
@@ -426,7 +481,6 @@ class HealthAIService:
     """AI service for personalized health recommendations"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
         self.food_service = FoodAnalysisService()
         self.profile_service = HealthProfileService()
     
@@ -434,6 +488,15 @@ class HealthAIService:
         self, user_id: int, request_type: str = "general"
     ) -> str:
         """Get personalized health recommendation"""
+        return "".join([
+            delta async for delta in self.stream_personalized_recommendation(user_id, request_type)
+        ])
+    
+    async def stream_personalized_recommendation(
+        self, user_id: int, request_type: str = "general"
+    ) -> AsyncIterator[str]:
+        """Personalized health recommendation, yielded as it is generated"""
+        streamed = False
         try:
             # Gather user data
             profile = await self.profile_service.get_or_create_profile(user_id)
@@ -447,21 +510,29 @@ class HealthAIService:
             )
             
             # Get AI recommendation
-            response = self.client.chat.completions.create(
+            async for delta in llm_gateway.stream(
                 model=settings.OPENAI_MODEL_DEFAULT,
                 messages=[
                     {"role": "system", "content": "Ты персональный AI-консультант по здоровью и питанию. Давай практические, научно обоснованные советы на основе данных пользователя."},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=800,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
+                temperature=0.7,
+                # The user watches the answer arrive, and the slot stays held
+                # through the Telegram edits: the small background lane would
+                # let two slow chats block every other background job
+                lane=LANE_INTERACTIVE,
+                user_id=user_id
+            ):
+                streamed = True
+                yield delta
             
         except Exception as e:
             logger.error(f"Error getting health recommendation: {e}")
-            return "Извините, не удалось получить персональную рекомендацию. Попробуйте позже."
+            if streamed:
+                yield "\n\n⚠️ Ответ прервался. Попробуйте позже."
+            else:
+                yield "Извините, не удалось получить персональную рекомендацию. Попробуйте позже."
     
     def _create_health_prompt(
         self, profile: HealthProfile, food_stats: Dict, 
@@ -6,6 +6,15 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from core.utils import create_keyboard, get_current_timestamp
+from core.callbacks import callback_registry
+from config.constants import (
+    CB_CLOSE_MENU, CB_TOPIC_SETTINGS_MENU, CB_TOPIC_AUTO_DELETE, CB_TOPIC_AI_SETTINGS,
+    CB_TOPIC_TAGS, CB_TOPIC_MODERATION, CB_TOPIC_STATS, CB_TOPIC_EXPORT,
+    CB_TOGGLE_AUTO_DELETE, CB_SET_DELETE_TIMEOUT, CB_TOGGLE_DELETE_BOTS,
+    CB_TOGGLE_DELETE_USERS, CB_TOGGLE_FOOD_ANALYSIS, CB_TOGGLE_AI_ASSISTANT,
+    CB_TOGGLE_FOOD_AUTO, CB_TOGGLE_AI_AUTO, CB_SET_CUSTOM_PROMPT, CB_TAG_CREATE,
+    CB_TAG_SEARCH, CB_TAG_STATS, CB_TAG_MANAGE
+)
 from .services import MessageManagementService, AutoModerationService
 from .models import TopicSettings
 
@@ -75,35 +84,35 @@ class MessageManagementHandlers:
                 [
                     InlineKeyboardButton(
                         "🗑️ Автоудаление", 
-                        callback_data=f"topic_auto_delete_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_AUTO_DELETE, chat_id, topic_id)
                     ),
                     InlineKeyboardButton(
                         "🤖 AI настройки", 
-                        callback_data=f"topic_ai_settings_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_AI_SETTINGS, chat_id, topic_id)
                     )
                 ],
                 [
                     InlineKeyboardButton(
                         "🏷️ Теги", 
-                        callback_data=f"topic_tags_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_TAGS, chat_id, topic_id)
                     ),
                     InlineKeyboardButton(
                         "🛡️ Модерация", 
-                        callback_data=f"topic_moderation_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_MODERATION, chat_id, topic_id)
                     )
                 ],
                 [
                     InlineKeyboardButton(
                         "📊 Статистика", 
-                        callback_data=f"topic_stats_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_STATS, chat_id, topic_id)
                     ),
                     InlineKeyboardButton(
                         "📤 Экспорт", 
-                        callback_data=f"topic_export_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOPIC_EXPORT, chat_id, topic_id)
                     )
                 ],
                 [
-                    InlineKeyboardButton("❌ Закрыть", callback_data="close_menu")
+                    InlineKeyboardButton("❌ Закрыть", callback_data=callback_registry.encode(CB_CLOSE_MENU))
                 ]
             ]
             
@@ -128,9 +137,7 @@ class MessageManagementHandlers:
         """Handle auto-delete settings"""
         try:
             query = update.callback_query
-            data_parts = query.data.split("_")
-            chat_id = int(data_parts[-2])
-            topic_id = int(data_parts[-1]) if data_parts[-1] != "0" else None
+            chat_id, topic_id = context.callback_args
             
             # Get current settings
             settings = await self.message_service.get_topic_settings(chat_id, topic_id)
@@ -152,26 +159,26 @@ class MessageManagementHandlers:
             
             if settings.auto_delete_enabled:
                 keyboard.append([
-                    InlineKeyboardButton("❌ Выключить", callback_data=f"toggle_auto_delete_{chat_id}_{topic_id or 0}"),
-                    InlineKeyboardButton("⏱️ Изменить время", callback_data=f"set_delete_timeout_{chat_id}_{topic_id or 0}")
+                    InlineKeyboardButton("❌ Выключить", callback_data=callback_registry.encode(CB_TOGGLE_AUTO_DELETE, chat_id, topic_id)),
+                    InlineKeyboardButton("⏱️ Изменить время", callback_data=callback_registry.encode(CB_SET_DELETE_TIMEOUT, chat_id, topic_id))
                 ])
                 keyboard.append([
                     InlineKeyboardButton(
                         f"🤖 Боты: {'✅' if settings.delete_bot_messages else '❌'}", 
-                        callback_data=f"toggle_delete_bots_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_DELETE_BOTS, chat_id, topic_id)
                     ),
                     InlineKeyboardButton(
                         f"👥 Юзеры: {'✅' if settings.delete_user_messages else '❌'}", 
-                        callback_data=f"toggle_delete_users_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_DELETE_USERS, chat_id, topic_id)
                     )
                 ])
             else:
                 keyboard.append([
-                    InlineKeyboardButton("✅ Включить", callback_data=f"toggle_auto_delete_{chat_id}_{topic_id or 0}")
+                    InlineKeyboardButton("✅ Включить", callback_data=callback_registry.encode(CB_TOGGLE_AUTO_DELETE, chat_id, topic_id))
                 ])
             
             keyboard.append([
-                InlineKeyboardButton("◀️ Назад", callback_data="topic_settings_menu")
+                InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_TOPIC_SETTINGS_MENU))
             ])
             
             await query.edit_message_text(
@@ -188,9 +195,7 @@ class MessageManagementHandlers:
         """Toggle auto-delete setting"""
         try:
             query = update.callback_query
-            data_parts = query.data.split("_")
-            chat_id = int(data_parts[-2])
-            topic_id = int(data_parts[-1]) if data_parts[-1] != "0" else None
+            chat_id, topic_id = context.callback_args
             
             # Get current settings
             settings = await self.message_service.get_topic_settings(chat_id, topic_id)
@@ -219,9 +224,7 @@ class MessageManagementHandlers:
         """Handle AI settings"""
         try:
             query = update.callback_query
-            data_parts = query.data.split("_")
-            chat_id = int(data_parts[-2])
-            topic_id = int(data_parts[-1]) if data_parts[-1] != "0" else None
+            chat_id, topic_id = context.callback_args
             
             # Get current settings
             settings = await self.message_service.get_topic_settings(chat_id, topic_id)
@@ -256,11 +259,11 @@ class MessageManagementHandlers:
                 [
                     InlineKeyboardButton(
                         f"🍽️ Еда: {'✅' if settings.food_analysis_enabled else '❌'}", 
-                        callback_data=f"toggle_food_analysis_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_FOOD_ANALYSIS, chat_id, topic_id)
                     ),
                     InlineKeyboardButton(
                         f"🧠 AI: {'✅' if settings.ai_assistant_enabled else '❌'}", 
-                        callback_data=f"toggle_ai_assistant_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_AI_ASSISTANT, chat_id, topic_id)
                     )
                 ]
             ]
@@ -269,7 +272,7 @@ class MessageManagementHandlers:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"🍽️ Режим: {'Авто' if settings.food_analysis_auto else '@'}", 
-                        callback_data=f"toggle_food_auto_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_FOOD_AUTO, chat_id, topic_id)
                     )
                 ])
             
@@ -277,16 +280,16 @@ class MessageManagementHandlers:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"🧠 Режим: {'Авто' if settings.ai_assistant_auto else '@'}", 
-                        callback_data=f"toggle_ai_auto_{chat_id}_{topic_id or 0}"
+                        callback_data=callback_registry.encode(CB_TOGGLE_AI_AUTO, chat_id, topic_id)
                     )
                 ])
             
             keyboard.extend([
                 [
-                    InlineKeyboardButton("📝 Кастомный промпт", callback_data=f"set_custom_prompt_{chat_id}_{topic_id or 0}")
+                    InlineKeyboardButton("📝 Кастомный промпт", callback_data=callback_registry.encode(CB_SET_CUSTOM_PROMPT, chat_id, topic_id))
                 ],
                 [
-                    InlineKeyboardButton("◀️ Назад", callback_data="topic_settings_menu")
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_TOPIC_SETTINGS_MENU))
                 ]
             ])
             
@@ -304,9 +307,7 @@ class MessageManagementHandlers:
         """Handle message tags menu"""
         try:
             query = update.callback_query
-            data_parts = query.data.split("_")
-            chat_id = int(data_parts[-2])
-            topic_id = int(data_parts[-1]) if data_parts[-1] != "0" else None
+            chat_id, topic_id = context.callback_args
             
             # Get existing tags
             tags = await self.message_service.get_chat_tags(chat_id, topic_id)
@@ -331,15 +332,15 @@ class MessageManagementHandlers:
             # Create buttons
             keyboard = [
                 [
-                    InlineKeyboardButton("➕ Создать тег", callback_data=f"create_tag_{chat_id}_{topic_id or 0}"),
-                    InlineKeyboardButton("🔍 Поиск по тегам", callback_data=f"search_tags_{chat_id}_{topic_id or 0}")
+                    InlineKeyboardButton("➕ Создать тег", callback_data=callback_registry.encode(CB_TAG_CREATE, chat_id, topic_id)),
+                    InlineKeyboardButton("🔍 Поиск по тегам", callback_data=callback_registry.encode(CB_TAG_SEARCH, chat_id, topic_id))
                 ],
                 [
-                    InlineKeyboardButton("📊 Статистика тегов", callback_data=f"tag_stats_{chat_id}_{topic_id or 0}"),
-                    InlineKeyboardButton("🗑️ Управление", callback_data=f"manage_tags_{chat_id}_{topic_id or 0}")
+                    InlineKeyboardButton("📊 Статистика тегов", callback_data=callback_registry.encode(CB_TAG_STATS, chat_id, topic_id)),
+                    InlineKeyboardButton("🗑️ Управление", callback_data=callback_registry.encode(CB_TAG_MANAGE, chat_id, topic_id))
                 ],
                 [
-                    InlineKeyboardButton("◀️ Назад", callback_data="topic_settings_menu")
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_TOPIC_SETTINGS_MENU))
                 ]
             ]
             
@@ -362,9 +363,10 @@ class MessageManagementHandlers:
             text = update.message.text
             user_id = update.effective_user.id
             
-            # Process the message
+            # Process the message (reuse the envelope built by the router)
             result = await self.message_service.process_message_with_bot_mention(
-                chat_id, message_id, topic_id, text, user_id
+                chat_id, message_id, topic_id, text, user_id,
+                envelope=getattr(context, "envelope", None)
             )
             
             if result.get("processed"):
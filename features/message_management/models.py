@@ -3,7 +3,7 @@
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from core.utils import generate_uuid, get_current_timestamp
+from core.utils import generate_uuid, get_current_timestamp, id_to_bson, id_from_document
 
 @dataclass
 class TopicSettings:
@@ -40,7 +40,7 @@ class TopicSettings:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'chat_id': self.chat_id,
             'topic_id': self.topic_id,
             'topic_name': self.topic_name,
@@ -63,7 +63,7 @@ class TopicSettings:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TopicSettings':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             chat_id=data.get('chat_id', 0),
             topic_id=data.get('topic_id'),
             topic_name=data.get('topic_name', ''),
@@ -101,7 +101,7 @@ class ScheduledMessage:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'chat_id': self.chat_id,
             'message_id': self.message_id,
             'topic_id': self.topic_id,
@@ -118,7 +118,7 @@ class ScheduledMessage:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ScheduledMessage':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             chat_id=data.get('chat_id', 0),
             message_id=data.get('message_id', 0),
             topic_id=data.get('topic_id'),
@@ -148,7 +148,7 @@ class MessageTag:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'name': self.name,
             'description': self.description,
             'color': self.color,
@@ -163,7 +163,7 @@ class MessageTag:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MessageTag':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             name=data.get('name', ''),
             description=data.get('description', ''),
             color=data.get('color', '#007bff'),
@@ -190,13 +190,13 @@ class TaggedMessage:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'chat_id': self.chat_id,
             'message_id': self.message_id,
             'topic_id': self.topic_id,
             'user_id': self.user_id,
             'content': self.content,
-            'tags': self.tags,
+            'tags': [id_to_bson(tag_id) for tag_id in self.tags],
             'tagged_by': self.tagged_by,
             'tagged_at': self.tagged_at
         }
@@ -204,13 +204,13 @@ class TaggedMessage:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TaggedMessage':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             chat_id=data.get('chat_id', 0),
             message_id=data.get('message_id', 0),
             topic_id=data.get('topic_id'),
             user_id=data.get('user_id', 0),
             content=data.get('content', ''),
-            tags=data.get('tags', []),
+            tags=[str(tag_id) for tag_id in data.get('tags', [])],
             tagged_by=data.get('tagged_by', 0),
             tagged_at=data.get('tagged_at', get_current_timestamp())
         )
@@ -245,7 +245,7 @@ class MessageFilter:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'name': self.name,
             'description': self.description,
             'chat_id': self.chat_id,
@@ -268,7 +268,7 @@ class MessageFilter:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MessageFilter':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             name=data.get('name', ''),
             description=data.get('description', ''),
             chat_id=data.get('chat_id', 0),
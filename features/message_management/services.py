@@ -13,10 +13,13 @@ from config.constants import (
     COLLECTION_TOPIC_SETTINGS, AUTO_DELETE_TIMEOUT_DEFAULT,
     AUTO_DELETE_TIMEOUT_MIN, AUTO_DELETE_TIMEOUT_MAX
 )
-from core.utils import get_current_timestamp
+from core.utils import get_current_timestamp, id_to_bson
+from core.routing import message_router, MessageEnvelope
+from core.write_buffer import write_buffer
+from .snapshots import chat_snapshots
 from .models import (
     TopicSettings, ScheduledMessage, MessageTag, 
-    TaggedMessage, MessageFilter
+    TaggedMessage
 )
 
 logger = logging.getLogger(__name__)
@@ -25,34 +28,18 @@ class MessageManagementService:
     """Service for message management functionality"""
     
     def __init__(self):
-        self.scheduled_deletions = {}  # In-memory store for scheduled deletions
-        self.deletion_tasks = {}  # Store asyncio tasks
+        # Deletions live in the scheduled_messages collection; every worker runs
+        # a sweeper and claims due messages atomically, so any worker can cancel
+        # a deletion and none are lost on restart
+        self.sweep_interval = 5  # seconds
+        self.sweep_batch = 100
+        self.sweeper_task = None
     
     async def get_topic_settings(self, chat_id: int, topic_id: Optional[int] = None) -> TopicSettings:
-        """Get or create topic settings"""
+        """Get or create topic settings (from the chat snapshot)"""
         try:
-            collection = db_manager.get_collection(COLLECTION_TOPIC_SETTINGS)
-            
-            # Find existing settings
-            query = {"chat_id": chat_id}
-            if topic_id is not None:
-                query["topic_id"] = topic_id
-            
-            existing = collection.find_one(query)
-            
-            if existing:
-                return TopicSettings.from_dict(existing)
-            else:
-                # Create new settings
-                settings = TopicSettings(
-                    chat_id=chat_id,
-                    topic_id=topic_id,
-                    topic_name=f"Topic {topic_id}" if topic_id else "General Chat"
-                )
-                
-                collection.insert_one(settings.to_dict())
-                logger.info(f"Created new topic settings for chat {chat_id}, topic {topic_id}")
-                return settings
+            snapshot = await chat_snapshots.get(chat_id, topic_id)
+            return snapshot.settings
                 
         except Exception as e:
             logger.error(f"Error getting topic settings: {e}")
@@ -63,7 +50,7 @@ class MessageManagementService:
                                   updates: Dict[str, Any]) -> bool:
         """Update topic settings"""
         try:
-            collection = db_manager.get_collection(COLLECTION_TOPIC_SETTINGS)
+            collection = await db_manager.get_collection_async(COLLECTION_TOPIC_SETTINGS)
             
             # Add updated timestamp
             updates["updated_at"] = get_current_timestamp()
@@ -72,11 +59,12 @@ class MessageManagementService:
             if topic_id is not None:
                 query["topic_id"] = topic_id
             
-            result = collection.update_one(
+            result = await collection.update_one(
                 query,
                 {"$set": updates},
                 upsert=True
             )
+            await chat_snapshots.invalidate_chat(chat_id)
             
             logger.info(f"Updated topic settings for chat {chat_id}, topic {topic_id}")
             return result.modified_count > 0 or result.upserted_id is not None
@@ -86,10 +74,12 @@ class MessageManagementService:
             return False
     
     async def should_auto_delete(self, chat_id: int, topic_id: Optional[int], 
-                               message_type: str, user_id: int) -> bool:
+                               message_type: str, user_id: int,
+                               settings: Optional[TopicSettings] = None) -> bool:
         """Check if message should be auto-deleted"""
         try:
-            settings = await self.get_topic_settings(chat_id, topic_id)
+            if settings is None:
+                settings = await self.get_topic_settings(chat_id, topic_id)
             
             if not settings.auto_delete_enabled:
                 return False
@@ -115,7 +105,7 @@ class MessageManagementService:
         try:
             settings = await self.get_topic_settings(chat_id, topic_id)
             
-            if not await self.should_auto_delete(chat_id, topic_id, message_type, user_id):
+            if not await self.should_auto_delete(chat_id, topic_id, message_type, user_id, settings):
                 return False
             
             # Calculate deletion time
@@ -132,16 +122,8 @@ class MessageManagementService:
                 scheduled_delete_at=delete_at
             )
             
-            # Save to database
-            collection = db_manager.get_collection("scheduled_messages")
-            collection.insert_one(scheduled_msg.to_dict())
-            
-            # Schedule the deletion task
-            task_key = f"{chat_id}_{message_id}"
-            task = asyncio.create_task(
-                self._delayed_delete_message(chat_id, message_id, settings.auto_delete_timeout)
-            )
-            self.deletion_tasks[task_key] = task
+            # Buffered write, the deletion sweeper picks it up when due
+            await write_buffer.insert_one("scheduled_messages", scheduled_msg.to_dict())
             
             logger.info(f"Scheduled deletion for message {message_id} in {settings.auto_delete_timeout}s")
             return True
@@ -153,18 +135,10 @@ class MessageManagementService:
     async def cancel_message_deletion(self, chat_id: int, message_id: int) -> bool:
         """Cancel scheduled message deletion"""
         try:
-            task_key = f"{chat_id}_{message_id}"
-            
-            # Cancel the asyncio task
-            if task_key in self.deletion_tasks:
-                task = self.deletion_tasks[task_key]
-                if not task.done():
-                    task.cancel()
-                del self.deletion_tasks[task_key]
-            
-            # Update database
-            collection = db_manager.get_collection("scheduled_messages")
-            collection.update_one(
+            # Update database (the sweeper skips deleted entries); goes through
+            # the write buffer so it lands after a still buffered insert
+            await write_buffer.update_one(
+                "scheduled_messages",
                 {"chat_id": chat_id, "message_id": message_id},
                 {"$set": {"deleted": True, "deletion_error": "Cancelled by user"}}
             )
@@ -176,12 +150,55 @@ class MessageManagementService:
             logger.error(f"Error cancelling message deletion: {e}")
             return False
     
-    async def _delayed_delete_message(self, chat_id: int, message_id: int, delay: int) -> None:
-        """Delete message after delay"""
-        try:
-            # Wait for the specified delay
-            await asyncio.sleep(delay)
+    def start_deletion_sweeper(self) -> None:
+        """Start the background loop that deletes due messages"""
+        if self.sweeper_task is None or self.sweeper_task.done():
+            self.sweeper_task = asyncio.create_task(self._deletion_sweeper_loop())
+    
+    async def stop_deletion_sweeper(self) -> None:
+        """Stop the deletion sweeper"""
+        if self.sweeper_task:
+            self.sweeper_task.cancel()
+            await asyncio.gather(self.sweeper_task, return_exceptions=True)
+            self.sweeper_task = None
+    
+    async def _deletion_sweeper_loop(self) -> None:
+        """Sweep due deletions every sweep_interval seconds"""
+        while True:
+            try:
+                await self.sweep_due_deletions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in deletion sweeper: {e}")
+            await asyncio.sleep(self.sweep_interval)
+    
+    async def sweep_due_deletions(self) -> int:
+        """Delete messages whose time has come; returns the number of claimed messages"""
+        collection = await db_manager.get_collection_async("scheduled_messages")
+        
+        claimed = 0
+        while claimed < self.sweep_batch:
+            # Atomic claim, so only one worker deletes each message
+            scheduled = await collection.find_one_and_update(
+                {
+                    "deleted": False,
+                    "deletion_attempted": False,
+                    "scheduled_delete_at": {"$lte": get_current_timestamp()}
+                },
+                {"$set": {"deletion_attempted": True}}
+            )
+            if not scheduled:
+                break
             
+            claimed += 1
+            await self._delete_scheduled_message(scheduled["chat_id"], scheduled["message_id"])
+        
+        return claimed
+    
+    async def _delete_scheduled_message(self, chat_id: int, message_id: int) -> None:
+        """Delete a claimed message"""
+        try:
             # Get bot instance
             from core.bot import bot_core
             bot = bot_core.get_bot()
@@ -191,8 +208,8 @@ class MessageManagementService:
                 await bot.delete_message(chat_id=chat_id, message_id=message_id)
                 
                 # Update database
-                collection = db_manager.get_collection("scheduled_messages")
-                collection.update_one(
+                await write_buffer.update_one(
+                    "scheduled_messages",
                     {"chat_id": chat_id, "message_id": message_id},
                     {"$set": {"deleted": True, "deletion_attempted": True}}
                 )
@@ -203,8 +220,8 @@ class MessageManagementService:
             logger.warning(f"Failed to delete message {message_id}: {e}")
             
             # Update database with error
-            collection = db_manager.get_collection("scheduled_messages")
-            collection.update_one(
+            await write_buffer.update_one(
+                "scheduled_messages",
                 {"chat_id": chat_id, "message_id": message_id},
                 {
                     "$set": {
@@ -214,11 +231,8 @@ class MessageManagementService:
                 }
             )
             
-        except asyncio.CancelledError:
-            logger.info(f"Deletion cancelled for message {message_id}")
-            
         except Exception as e:
-            logger.error(f"Error in delayed delete: {e}")
+            logger.error(f"Error deleting scheduled message: {e}")
     
     async def create_message_tag(self, chat_id: int, topic_id: Optional[int], 
                                name: str, description: str = "", 
@@ -227,8 +241,8 @@ class MessageManagementService:
         """Create a new message tag"""
         try:
             # Check if tag already exists
-            collection = db_manager.get_collection("message_tags")
-            existing = collection.find_one({
+            collection = await db_manager.get_collection_async("message_tags")
+            existing = await collection.find_one({
                 "chat_id": chat_id,
                 "topic_id": topic_id,
                 "name": name
@@ -248,7 +262,8 @@ class MessageManagementService:
                 topic_id=topic_id
             )
             
-            collection.insert_one(tag.to_dict())
+            await collection.insert_one(tag.to_dict())
+            await chat_snapshots.invalidate_chat(chat_id)
             logger.info(f"Created tag '{name}' for chat {chat_id}")
             return tag
             
@@ -261,24 +276,13 @@ class MessageManagementService:
                          tagged_by: int) -> bool:
         """Tag a message"""
         try:
-            # Get tag IDs
-            tag_collection = db_manager.get_collection("message_tags")
-            tag_ids = []
-            
-            for tag_name in tag_names:
-                tag = tag_collection.find_one({
-                    "chat_id": chat_id,
-                    "topic_id": topic_id,
-                    "name": tag_name
-                })
-                
-                if tag:
-                    tag_ids.append(tag["id"])
-                    # Increment usage count
-                    tag_collection.update_one(
-                        {"id": tag["id"]},
-                        {"$inc": {"usage_count": 1}}
-                    )
+            # Get tag IDs from the chat snapshot
+            snapshot = await chat_snapshots.get(chat_id, topic_id)
+            tag_ids = [snapshot.tag_ids[name] for name in tag_names if name in snapshot.tag_ids]
+            
+            for tag_id in tag_ids:
+                # Increment usage count (buffered, merged per tag)
+                await write_buffer.increment("message_tags", {"_id": id_to_bson(tag_id)}, {"usage_count": 1})
             
             if not tag_ids:
                 return False
@@ -295,8 +299,7 @@ class MessageManagementService:
             )
             
             # Save to database
-            collection = db_manager.get_collection("tagged_messages")
-            collection.insert_one(tagged_message.to_dict())
+            await write_buffer.insert_one("tagged_messages", tagged_message.to_dict())
             
             logger.info(f"Tagged message {message_id} with {len(tag_ids)} tags")
             return True
@@ -310,7 +313,7 @@ class MessageManagementService:
                                    query: str = None) -> List[TaggedMessage]:
         """Search tagged messages"""
         try:
-            collection = db_manager.get_collection("tagged_messages")
+            collection = await db_manager.get_collection_async("tagged_messages")
             
             # Build search query
             search_query = {"chat_id": chat_id}
@@ -318,21 +321,12 @@ class MessageManagementService:
                 search_query["topic_id"] = topic_id
             
             if tag_names:
-                # Get tag IDs
-                tag_collection = db_manager.get_collection("message_tags")
-                tag_ids = []
-                
-                for tag_name in tag_names:
-                    tag = tag_collection.find_one({
-                        "chat_id": chat_id,
-                        "topic_id": topic_id,
-                        "name": tag_name
-                    })
-                    if tag:
-                        tag_ids.append(tag["id"])
+                # Get tag IDs from the chat snapshot
+                snapshot = await chat_snapshots.get(chat_id, topic_id)
+                tag_ids = [snapshot.tag_ids[name] for name in tag_names if name in snapshot.tag_ids]
                 
                 if tag_ids:
-                    search_query["tags"] = {"$in": tag_ids}
+                    search_query["tags"] = {"$in": [id_to_bson(tag_id) for tag_id in tag_ids]}
             
             if query:
                 search_query["content"] = {"$regex": query, "$options": "i"}
@@ -341,7 +335,7 @@ class MessageManagementService:
             results = collection.find(search_query).sort("tagged_at", -1).limit(50)
             
             tagged_messages = []
-            for result in results:
+            async for result in results:
                 tagged_messages.append(TaggedMessage.from_dict(result))
             
             return tagged_messages
@@ -353,7 +347,7 @@ class MessageManagementService:
     async def get_chat_tags(self, chat_id: int, topic_id: Optional[int] = None) -> List[MessageTag]:
         """Get all tags for a chat/topic"""
         try:
-            collection = db_manager.get_collection("message_tags")
+            collection = await db_manager.get_collection_async("message_tags")
             
             query = {"chat_id": chat_id}
             if topic_id is not None:
@@ -362,7 +356,7 @@ class MessageManagementService:
             tags_data = collection.find(query).sort("usage_count", -1)
             
             tags = []
-            for tag_data in tags_data:
+            async for tag_data in tags_data:
                 tags.append(MessageTag.from_dict(tag_data))
             
             return tags
@@ -373,57 +367,21 @@ class MessageManagementService:
     
     async def process_message_with_bot_mention(self, chat_id: int, message_id: int,
                                              topic_id: Optional[int], text: str,
-                                             user_id: int) -> Dict[str, Any]:
+                                             user_id: int,
+                                             envelope: Optional[MessageEnvelope] = None) -> Dict[str, Any]:
         """Process message that mentions the bot"""
         try:
-            settings = await self.get_topic_settings(chat_id, topic_id)
+            if envelope is None:
+                envelope = message_router.build_envelope(text)
             
-            # Clean text by removing bot mentions
-            clean_text = text
-            for mention in ["@DMPlove_bot", "@dmplove_bot"]:
-                clean_text = clean_text.replace(mention, "").strip()
-            
-            result = {
+            # Intent comes from the compiled route table (see core.routing.MENTION_INTENTS)
+            return {
                 "processed": True,
-                "clean_text": clean_text,
-                "should_respond": False,
-                "response_type": None
+                "clean_text": envelope.without_bot_mention(),
+                "should_respond": True,
+                "response_type": message_router.resolve("mention_intent", envelope)
             }
             
-            # Check if it's a command or request
-            text_lower = clean_text.lower()
-            
-            # Food analysis keywords
-            food_keywords = ["еда", "калории", "анализ", "питание", "блюдо"]
-            if any(keyword in text_lower for keyword in food_keywords):
-                result["should_respond"] = True
-                result["response_type"] = "food_analysis"
-            
-            # Movie keywords
-            movie_keywords = ["фильм", "кино", "рекомендации", "посмотрел", "сериал"]
-            if any(keyword in text_lower for keyword in movie_keywords):
-                result["should_respond"] = True
-                result["response_type"] = "movie_expert"
-            
-            # Health keywords
-            health_keywords = ["здоровье", "профиль", "тренировка", "шаги"]
-            if any(keyword in text_lower for keyword in health_keywords):
-                result["should_respond"] = True
-                result["response_type"] = "health_profile"
-            
-            # Tag keywords
-            tag_keywords = ["тег", "метка", "поиск"]
-            if any(keyword in text_lower for keyword in tag_keywords):
-                result["should_respond"] = True
-                result["response_type"] = "message_tags"
-            
-            # If no specific keywords, use general AI
-            if not result["should_respond"]:
-                result["should_respond"] = True
-                result["response_type"] = "general_ai"
-            
-            return result
-            
         except Exception as e:
             logger.error(f"Error processing message with bot mention: {e}")
             return {"processed": False, "error": str(e)}
@@ -437,19 +395,10 @@ class AutoModerationService:
     async def check_message_filters(self, chat_id: int, topic_id: Optional[int],
                                   message_text: str, user_id: int, 
                                   message_type: str) -> Dict[str, Any]:
-        """Check if message matches any filters"""
+        """Check if message matches any filters (compiled filters from the chat snapshot)"""
         try:
-            collection = db_manager.get_collection("message_filters")
-            
-            # Get active filters for this chat/topic
-            query = {
-                "chat_id": chat_id,
-                "enabled": True
-            }
-            if topic_id is not None:
-                query["topic_id"] = topic_id
-            
-            filters = collection.find(query).sort("priority", -1)
+            snapshot = await chat_snapshots.get(chat_id, topic_id)
+            text_lower = message_text.lower()
             
             actions = {
                 "auto_delete": False,
@@ -459,70 +408,28 @@ class AutoModerationService:
                 "matched_filters": []
             }
             
-            for filter_data in filters:
-                filter_obj = MessageFilter.from_dict(filter_data)
+            for compiled in snapshot.filters:
+                if not compiled.matches(text_lower, user_id, message_type):
+                    continue
+                
+                filter_obj = compiled.filter
+                actions["matched_filters"].append(filter_obj.name)
+                
+                # Apply actions
+                if filter_obj.auto_delete:
+                    actions["auto_delete"] = True
                 
-                if await self._message_matches_filter(filter_obj, message_text, user_id, message_type):
-                    actions["matched_filters"].append(filter_obj.name)
-                    
-                    # Apply actions
-                    if filter_obj.auto_delete:
-                        actions["auto_delete"] = True
-                    
-                    if filter_obj.auto_tag:
-                        actions["auto_tag"].extend(filter_obj.auto_tag)
-                    
-                    if filter_obj.forward_to_chat:
-                        actions["forward_to_chat"] = filter_obj.forward_to_chat
-                    
-                    if filter_obj.send_notification:
-                        actions["send_notification"] = True
+                if filter_obj.auto_tag:
+                    actions["auto_tag"].extend(filter_obj.auto_tag)
+                
+                if filter_obj.forward_to_chat:
+                    actions["forward_to_chat"] = filter_obj.forward_to_chat
+                
+                if filter_obj.send_notification:
+                    actions["send_notification"] = True
             
             return actions
             
         except Exception as e:
             logger.error(f"Error checking message filters: {e}")
             return {"error": str(e)}
-    
-    async def _message_matches_filter(self, filter_obj: MessageFilter, 
-                                    message_text: str, user_id: int, 
-                                    message_type: str) -> bool:
-        """Check if message matches a specific filter"""
-        try:
-            text_lower = message_text.lower()
-            
-            # Check message type
-            if filter_obj.message_types and message_type not in filter_obj.message_types:
-                return False
-            
-            # Check user ID
-            if filter_obj.user_ids and user_id not in filter_obj.user_ids:
-                return False
-            
-            # Check excluded users
-            if filter_obj.excluded_user_ids and user_id in filter_obj.excluded_user_ids:
-                return False
-            
-            # Check keywords
-            if filter_obj.keywords:
-                has_keyword = any(
-                    keyword.lower() in text_lower 
-                    for keyword in filter_obj.keywords
-                )
-                if not has_keyword:
-                    return False
-            
-            # Check excluded keywords
-            if filter_obj.excluded_keywords:
-                has_excluded = any(
-                    keyword.lower() in text_lower 
-                    for keyword in filter_obj.excluded_keywords
-                )
-                if has_excluded:
-                    return False
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error matching filter: {e}")
-            return False
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""Per-(chat, topic) configuration snapshots for the per-message hot path
+
+A snapshot holds the topic settings, the enabled filters compiled for
+matching and the tag name -> id map. It is loaded once (one load per key
+even under concurrent messages) and then served from memory, so filtering,
+auto-delete checks and tagging of an ordinary group message need no
+database reads.
+
+Snapshots are dropped for the whole chat whenever its settings, filters or
+tags are written through the services (invalidate_chat). Writes from other
+processes are picked up by the TTL, or right away with
+CHAT_SNAPSHOT_CHANGE_STREAMS=true on a replica set. In cluster mode a
+chat's messages and callbacks are handled by one worker, so its own
+invalidations already cover the common case.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Set, FrozenSet
+
+from config.settings import settings
+from config.database import db_manager
+from config.constants import COLLECTION_TOPIC_SETTINGS
+from core.cache import CacheManager
+from core.utils import id_from_document
+from .models import TopicSettings, MessageFilter
+
+logger = logging.getLogger(__name__)
+
+# Collections whose writes change snapshots
+SNAPSHOT_COLLECTIONS = (COLLECTION_TOPIC_SETTINGS, "message_filters", "message_tags")
+
+@dataclass
+class CompiledFilter:
+    """MessageFilter with its criteria prepared for matching"""
+    filter: MessageFilter
+    keywords: List[str]
+    excluded_keywords: List[str]
+    user_ids: FrozenSet[int]
+    excluded_user_ids: FrozenSet[int]
+    message_types: FrozenSet[str]
+
+    @classmethod
+    def compile(cls, filter_obj: MessageFilter) -> 'CompiledFilter':
+        return cls(
+            filter=filter_obj,
+            keywords=[keyword.lower() for keyword in filter_obj.keywords],
+            excluded_keywords=[keyword.lower() for keyword in filter_obj.excluded_keywords],
+            user_ids=frozenset(filter_obj.user_ids),
+            excluded_user_ids=frozenset(filter_obj.excluded_user_ids),
+            message_types=frozenset(filter_obj.message_types)
+        )
+
+    def matches(self, text_lower: str, user_id: int, message_type: str) -> bool:
+        if self.message_types and message_type not in self.message_types:
+            return False
+        if self.user_ids and user_id not in self.user_ids:
+            return False
+        if self.excluded_user_ids and user_id in self.excluded_user_ids:
+            return False
+        if self.keywords and not any(keyword in text_lower for keyword in self.keywords):
+            return False
+        if self.excluded_keywords and any(keyword in text_lower for keyword in self.excluded_keywords):
+            return False
+        return True
+
+@dataclass
+class ChatSnapshot:
+    """Configuration of one (chat, topic); shared between callers, read-only"""
+    chat_id: int
+    topic_id: Optional[int]
+    settings: TopicSettings
+    filters: List[CompiledFilter] = field(default_factory=list)  # by priority, highest first
+    tag_ids: Dict[str, str] = field(default_factory=dict)  # tag name -> tag id
+
+class ChatSnapshotStore:
+    """Loads, caches and invalidates ChatSnapshots"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 5000, change_streams: bool = False):
+        self.cache = CacheManager(default_ttl=ttl, max_entries=max_entries)
+        self.change_streams = change_streams
+        self._topics: Dict[int, Set[Optional[int]]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.loads = 0
+        self.settings_created = 0
+        self.stream_invalidations = 0
+
+    @staticmethod
+    def _key(chat_id: int, topic_id: Optional[int]) -> str:
+        return f"chat_snapshot_{chat_id}_{topic_id}"
+
+    async def get(self, chat_id: int, topic_id: Optional[int] = None) -> ChatSnapshot:
+        """Snapshot of (chat, topic), loaded on first use"""
+        self._topics.setdefault(chat_id, set()).add(topic_id)
+        return await self.cache.get_or_load(
+            self._key(chat_id, topic_id),
+            lambda: self._load(chat_id, topic_id)
+        )
+
+    async def _load(self, chat_id: int, topic_id: Optional[int]) -> ChatSnapshot:
+        self.loads += 1
+        scope = {"chat_id": chat_id}
+        if topic_id is not None:
+            scope["topic_id"] = topic_id
+
+        # Settings, created with defaults on first contact
+        settings_collection = await db_manager.get_collection_async(COLLECTION_TOPIC_SETTINGS)
+        existing = await settings_collection.find_one(scope)
+        if existing:
+            topic_settings = TopicSettings.from_dict(existing)
+        else:
+            topic_settings = TopicSettings(
+                chat_id=chat_id,
+                topic_id=topic_id,
+                topic_name=f"Topic {topic_id}" if topic_id else "General Chat"
+            )
+            await settings_collection.insert_one(topic_settings.to_dict())
+            self.settings_created += 1
+            logger.info(f"Created new topic settings for chat {chat_id}, topic {topic_id}")
+
+        # Enabled filters, highest priority first
+        filters_collection = await db_manager.get_collection_async("message_filters")
+        filters = [
+            CompiledFilter.compile(MessageFilter.from_dict(filter_data))
+            async for filter_data in filters_collection.find({**scope, "enabled": True}).sort("priority", -1)
+        ]
+
+        # Tag names of exactly this topic
+        tags_collection = await db_manager.get_collection_async("message_tags")
+        tag_ids = {
+            tag["name"]: id_from_document(tag)
+            async for tag in tags_collection.find({"chat_id": chat_id, "topic_id": topic_id}, {"name": 1, "id": 1})
+        }
+
+        return ChatSnapshot(chat_id, topic_id, topic_settings, filters, tag_ids)
+
+    async def invalidate_chat(self, chat_id: int) -> None:
+        """Drop every snapshot of the chat (topic-less snapshots see all topics)"""
+        topics = self._topics.pop(chat_id, set())
+        await self.cache.invalidate(*(self._key(chat_id, topic_id) for topic_id in topics))
+
+    def clear(self) -> None:
+        self.cache.local.clear()
+        self._topics.clear()
+
+    def start(self) -> None:
+        """Start the change stream watcher if enabled"""
+        if self.change_streams and (self._watch_task is None or self._watch_task.done()):
+            self._watch_task = asyncio.create_task(self._watch_loop())
+
+    async def stop(self) -> None:
+        if self._watch_task:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+
+    async def _watch_loop(self):
+        """Invalidate on writes from any process (requires a replica set)"""
+        pipeline = [{"$match": {"ns.coll": {"$in": list(SNAPSHOT_COLLECTIONS)}}}]
+        while True:
+            try:
+                db = await db_manager.connect_async()
+                async with db.watch(pipeline, full_document="updateLookup") as stream:
+                    # Anything written while the stream was down is unknown
+                    self.clear()
+                    async for change in stream:
+                        self.stream_invalidations += 1
+                        chat_id = (change.get("fullDocument") or {}).get("chat_id")
+                        if chat_id is None:
+                            # Deletes carry only the _id
+                            self.clear()
+                        else:
+                            await self.invalidate_chat(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Chat snapshot change stream failed, retrying: {e}")
+                await asyncio.sleep(5)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot metrics"""
+        stats = self.cache.get_stats()
+        return {
+            "snapshots": stats["entries"],
+            "hit_ratio": stats["hit_ratio"],
+            "loads": self.loads,
+            "coalesced": stats["coalesced"],
+            "invalidations": stats["invalidations"],
+            "settings_created": self.settings_created,
+            "change_streams": self.change_streams,
+            "stream_invalidations": self.stream_invalidations
+        }
+
+# Global snapshot store, shared by every service instance
+chat_snapshots = ChatSnapshotStore(
+    ttl=settings.CHAT_SNAPSHOT_TTL,
+    max_entries=settings.CHAT_SNAPSHOT_MAX_ENTRIES,
+    change_streams=settings.CHAT_SNAPSHOT_CHANGE_STREAMS
+)
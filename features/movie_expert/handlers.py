@@ -6,6 +6,15 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from core.utils import create_keyboard, get_current_timestamp, is_valid_rating
+from core.callbacks import callback_registry
+from core.streaming import StreamingMessage
+from core.admission import (
+    admission_controller, AdmissionRejected, queue_position_text, OP_MOVIE_RECOMMENDATIONS
+)
+from config.constants import (
+    CB_CLOSE_MENU, CB_MOVIE_MENU, CB_MOVIE_ADD, CB_MOVIE_SEARCH, CB_MOVIE_RECOMMENDATIONS,
+    CB_MOVIE_STATS, CB_MOVIE_LIST, CB_MOVIE_TOP, CB_MOVIE_EXPORT, CB_MOVIE_TRENDS
+)
 from .services import MovieExpertService, MovieAIService
 from .models import MovieEntry
 
@@ -52,20 +61,20 @@ class MovieExpertHandlers:
             # Menu buttons
             keyboard = [
                 [
-                    InlineKeyboardButton("➕ Добавить фильм", callback_data="movie_add"),
-                    InlineKeyboardButton("🔍 Поиск", callback_data="movie_search")
+                    InlineKeyboardButton("➕ Добавить фильм", callback_data=callback_registry.encode(CB_MOVIE_ADD)),
+                    InlineKeyboardButton("🔍 Поиск", callback_data=callback_registry.encode(CB_MOVIE_SEARCH))
                 ],
                 [
-                    InlineKeyboardButton("💡 Рекомендации", callback_data="movie_recommendations"),
-                    InlineKeyboardButton("📊 Статистика", callback_data="movie_stats")
+                    InlineKeyboardButton("💡 Рекомендации", callback_data=callback_registry.encode(CB_MOVIE_RECOMMENDATIONS)),
+                    InlineKeyboardButton("📊 Статистика", callback_data=callback_registry.encode(CB_MOVIE_STATS))
                 ],
                 [
-                    InlineKeyboardButton("📋 Мои фильмы", callback_data="movie_list"),
-                    InlineKeyboardButton("⭐ Топ фильмы", callback_data="movie_top")
+                    InlineKeyboardButton("📋 Мои фильмы", callback_data=callback_registry.encode(CB_MOVIE_LIST)),
+                    InlineKeyboardButton("⭐ Топ фильмы", callback_data=callback_registry.encode(CB_MOVIE_TOP))
                 ],
                 [
-                    InlineKeyboardButton("📤 Экспорт", callback_data="movie_export"),
-                    InlineKeyboardButton("❌ Закрыть", callback_data="close_menu")
+                    InlineKeyboardButton("📤 Экспорт", callback_data=callback_registry.encode(CB_MOVIE_EXPORT)),
+                    InlineKeyboardButton("❌ Закрыть", callback_data=callback_registry.encode(CB_CLOSE_MENU))
                 ]
             ]
             
@@ -95,7 +104,15 @@ class MovieExpertHandlers:
             user_id = update.effective_user.id
             
             # Get recommendations
-            recommendations = await self.movie_service.get_recommendations(user_id, 5)
+            try:
+                async with admission_controller.slot(
+                    OP_MOVIE_RECOMMENDATIONS, user_id, update.effective_chat.id,
+                    notify=lambda position: query.message.reply_text(queue_position_text(position))
+                ):
+                    recommendations = await self.movie_service.get_recommendations(user_id, 5)
+            except AdmissionRejected as e:
+                await query.message.reply_text(e.user_message)
+                return
             
             if not recommendations:
                 text = "🤷‍♂️ **НЕТ РЕКОМЕНДАЦИЙ**\n\n"
@@ -127,8 +144,8 @@ class MovieExpertHandlers:
             
             keyboard = [
                 [
-                    InlineKeyboardButton("🔄 Новые рекомендации", callback_data="movie_recommendations"),
-                    InlineKeyboardButton("◀️ Назад", callback_data="movie_menu")
+                    InlineKeyboardButton("🔄 Новые рекомендации", callback_data=callback_registry.encode(CB_MOVIE_RECOMMENDATIONS)),
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_MOVIE_MENU))
                 ]
             ]
             
@@ -180,11 +197,11 @@ class MovieExpertHandlers:
             
             keyboard = [
                 [
-                    InlineKeyboardButton("🔍 Поиск", callback_data="movie_search"),
-                    InlineKeyboardButton("📤 Экспорт", callback_data="movie_export")
+                    InlineKeyboardButton("🔍 Поиск", callback_data=callback_registry.encode(CB_MOVIE_SEARCH)),
+                    InlineKeyboardButton("📤 Экспорт", callback_data=callback_registry.encode(CB_MOVIE_EXPORT))
                 ],
                 [
-                    InlineKeyboardButton("◀️ Назад", callback_data="movie_menu")
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_MOVIE_MENU))
                 ]
             ]
             
@@ -243,11 +260,11 @@ class MovieExpertHandlers:
             
             keyboard = [
                 [
-                    InlineKeyboardButton("📈 Тренды", callback_data="movie_trends"),
-                    InlineKeyboardButton("🏆 Топ-10", callback_data="movie_top")
+                    InlineKeyboardButton("📈 Тренды", callback_data=callback_registry.encode(CB_MOVIE_TRENDS)),
+                    InlineKeyboardButton("🏆 Топ-10", callback_data=callback_registry.encode(CB_MOVIE_TOP))
                 ],
                 [
-                    InlineKeyboardButton("◀️ Назад", callback_data="movie_menu")
+                    InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_MOVIE_MENU))
                 ]
             ]
             
@@ -267,25 +284,26 @@ class MovieExpertHandlers:
             user_id = update.effective_user.id
             message_text = update.message.text
             
-            # Process with AI service
-            response = await self.ai_service.process_movie_message(user_id, message_text)
+            # Process with AI service, rendering the answer as it is generated
+            placeholder = await update.message.reply_text("🎬 Думаю...")
+            reply = StreamingMessage(context.bot, placeholder.chat_id, placeholder.message_id)
+            # Reuse the envelope built by the router
+            response = await reply.stream(self.ai_service.stream_movie_message(
+                user_id, message_text, envelope=getattr(context, "envelope", None)
+            ))
             
             # Add action buttons if movie was saved
             if "сохранен" in response:
                 keyboard = [
                     [
-                        InlineKeyboardButton("🎬 Меню фильмов", callback_data="movie_menu"),
-                        InlineKeyboardButton("💡 Рекомендации", callback_data="movie_recommendations")
+                        InlineKeyboardButton("🎬 Меню фильмов", callback_data=callback_registry.encode(CB_MOVIE_MENU)),
+                        InlineKeyboardButton("💡 Рекомендации", callback_data=callback_registry.encode(CB_MOVIE_RECOMMENDATIONS))
                     ]
                 ]
                 
-                await update.message.reply_text(
-                    response,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode="Markdown"
-                )
+                await reply.finish(reply_markup=InlineKeyboardMarkup(keyboard))
             else:
-                await update.message.reply_text(response, parse_mode="Markdown")
+                await reply.finish()
         
         except Exception as e:
             logger.error(f"Error handling movie message: {e}")
@@ -306,7 +324,7 @@ class MovieExpertHandlers:
             text += "• 'космос'"
             
             keyboard = [
-                [InlineKeyboardButton("◀️ Назад", callback_data="movie_menu")]
+                [InlineKeyboardButton("◀️ Назад", callback_data=callback_registry.encode(CB_MOVIE_MENU))]
             ]
             
             await query.edit_message_text(
@@ -351,8 +369,8 @@ class MovieExpertHandlers:
             
             keyboard = [
                 [
-                    InlineKeyboardButton("🎬 Меню", callback_data="movie_menu"),
-                    InlineKeyboardButton("🔍 Новый поиск", callback_data="movie_search")
+                    InlineKeyboardButton("🎬 Меню", callback_data=callback_registry.encode(CB_MOVIE_MENU)),
+                    InlineKeyboardButton("🔍 Новый поиск", callback_data=callback_registry.encode(CB_MOVIE_SEARCH))
                 ]
             ]
             
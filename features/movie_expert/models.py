@@ -3,7 +3,7 @@
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from core.utils import generate_uuid, get_current_timestamp
+from core.utils import generate_uuid, get_current_timestamp, id_to_bson, id_from_document
 
 @dataclass
 class MovieEntry:
@@ -27,7 +27,7 @@ class MovieEntry:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'user_id': self.user_id,
             'title': self.title,
             'year': self.year,
@@ -48,7 +48,7 @@ class MovieEntry:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MovieEntry':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             user_id=data.get('user_id', 0),
             title=data.get('title', ''),
             year=data.get('year'),
@@ -189,7 +189,7 @@ class WatchList:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
-            'id': self.id,
+            '_id': id_to_bson(self.id),
             'user_id': self.user_id,
             'title': self.title,
             'year': self.year,
@@ -207,7 +207,7 @@ class WatchList:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'WatchList':
         return cls(
-            id=data.get('id', generate_uuid()),
+            id=id_from_document(data),
             user_id=data.get('user_id', 0),
             title=data.get('title', ''),
             year=data.get('year'),
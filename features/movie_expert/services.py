@@ -2,18 +2,26 @@
 
 import logging
 import json
-from typing import Optional, Dict, Any, List, Tuple
+import re
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from datetime import datetime, timedelta
-import openai
-from openai import OpenAI
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from config.settings import settings
 from config.database import db_manager
-from config.constants import COLLECTION_MOVIES, COLLECTION_USERS
+from config.constants import (
+    COLLECTION_MOVIES, COLLECTION_USERS, COLLECTION_MOVIE_STATS,
+    CACHE_KEY_MOVIE_RECOMMENDATIONS, MAX_MOVIE_RECOMMENDATIONS
+)
 from core.utils import (
     get_date_range, parse_json_response, is_valid_rating, 
     normalize_rating, extract_movie_keywords
 )
+from core.cache import cache
+from core.llm_gateway import llm_gateway, LANE_INTERACTIVE, LANE_BACKGROUND
+from core.routing import message_router, MessageEnvelope
 from .models import (
     MovieEntry, MovieRecommendation, MovieStats, 
     WatchList, MoviePreferences
@@ -21,17 +29,52 @@ from .models import (
 
 logger = logging.getLogger(__name__)
 
+# Genre and director names are keys of movie_stats maps, where "." and a
+# leading "$" are not allowed; full-width look-alikes stand in for them
+_STATS_KEY_ESCAPES = (("．", "."), ("＄", "$"))
+
+def _encode_stats_key(name: str) -> str:
+    for escaped, char in _STATS_KEY_ESCAPES:
+        name = name.replace(char, escaped)
+    return name
+
+def _decode_stats_key(key: str) -> str:
+    for escaped, char in _STATS_KEY_ESCAPES:
+        key = key.replace(escaped, char)
+    return key
+
+# Movie info comes from the AI: genre may be a string, numbers may be "142 мин"
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+def _as_number(value: Any) -> Optional[float]:
+    """Number from an int/float or the first number in a string, else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            number = float(match.group().replace(",", "."))
+            return int(number) if number.is_integer() else number
+    return None
+
+def _genre_list(value: Any) -> List[str]:
+    """Genres as a list of non-empty strings ("драма, комедия" is split)"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return []
+    return [genre.strip() for genre in value if isinstance(genre, str) and genre.strip()]
+
 class MovieExpertService:
     """Service for movie expert functionality"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    
     async def save_movie(self, user_id: int, title: str, rating: float, review: str = "", 
                         watch_date: Optional[datetime] = None, is_series: bool = False) -> bool:
         """Save a watched movie/series"""
         try:
-            collection = db_manager.get_collection(COLLECTION_MOVIES)
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIES)
             
             # Normalize rating
             rating = normalize_rating(rating)
@@ -47,18 +90,25 @@ class MovieExpertService:
             )
             
             # Try to extract additional info using AI
-            movie_info = await self._extract_movie_info(title, is_series)
+            movie_info = await self._extract_movie_info(title, is_series, user_id)
             if movie_info:
                 movie_entry.year = movie_info.get('year')
-                movie_entry.genre = movie_info.get('genre', [])
-                movie_entry.director = movie_info.get('director')
-                movie_entry.duration = movie_info.get('duration')
+                movie_entry.genre = _genre_list(movie_info.get('genre'))
+                director = movie_info.get('director')
+                movie_entry.director = director if isinstance(director, str) else None
+                duration = _as_number(movie_info.get('duration'))
+                movie_entry.duration = int(duration) if duration else None
+            
+            # Bump the stats revision before the movie exists, so a rebuild
+            # that may already count it can't also receive its increment
+            revision = await self._reserve_stats_update(user_id)
             
             # Save to database
-            collection.insert_one(movie_entry.to_dict())
+            await collection.insert_one(movie_entry.to_dict())
             
             # Update user stats
-            await self._update_user_stats(user_id)
+            await self._update_user_stats(movie_entry, revision)
+            await cache.invalidate(CACHE_KEY_MOVIE_RECOMMENDATIONS.format(user_id=user_id))
             
             logger.info(f"Saved movie '{title}' for user {user_id}")
             return True
@@ -70,14 +120,14 @@ class MovieExpertService:
     async def get_user_movies(self, user_id: int, limit: int = 50) -> List[MovieEntry]:
         """Get user's watched movies"""
         try:
-            collection = db_manager.get_collection(COLLECTION_MOVIES)
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIES)
             
             movies_data = collection.find(
                 {"user_id": user_id}
             ).sort("watch_date", -1).limit(limit)
             
             movies = []
-            for movie_data in movies_data:
+            async for movie_data in movies_data:
                 movies.append(MovieEntry.from_dict(movie_data))
             
             return movies
@@ -89,7 +139,7 @@ class MovieExpertService:
     async def search_user_movies(self, user_id: int, query: str) -> List[MovieEntry]:
         """Search user's movies"""
         try:
-            collection = db_manager.get_collection(COLLECTION_MOVIES)
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIES)
             
             search_query = {
                 "user_id": user_id,
@@ -104,7 +154,7 @@ class MovieExpertService:
             movies_data = collection.find(search_query).sort("watch_date", -1).limit(20)
             
             movies = []
-            for movie_data in movies_data:
+            async for movie_data in movies_data:
                 movies.append(MovieEntry.from_dict(movie_data))
             
             return movies
@@ -114,126 +164,157 @@ class MovieExpertService:
             return []
     
     async def get_recommendations(self, user_id: int, count: int = 5) -> List[MovieRecommendation]:
-        """Get AI-powered movie recommendations"""
+        """Get AI-powered movie recommendations (cached until the user saves a movie)"""
         try:
-            # Get user's movie history
-            user_movies = await self.get_user_movies(user_id, 100)
-            
-            if len(user_movies) < 3:
-                # Not enough data for recommendations
-                return await self._get_popular_recommendations(count)
+            recommendations = await cache.get_or_load(
+                CACHE_KEY_MOVIE_RECOMMENDATIONS.format(user_id=user_id),
+                lambda: self._load_recommendations(user_id)
+            )
+            return [MovieRecommendation.from_dict(data) for data in recommendations[:count]]
             
+        except Exception as e:
+            logger.error(f"Error getting recommendations: {e}")
+            return []
+    
+    async def _load_recommendations(self, user_id: int) -> List[Dict[str, Any]]:
+        """Generate the full set once; callers asking for fewer get a prefix of it"""
+        # Get user's movie history
+        user_movies = await self.get_user_movies(user_id, 100)
+        
+        if len(user_movies) < 3:
+            # Not enough data for recommendations
+            recommendations = await self._get_popular_recommendations(MAX_MOVIE_RECOMMENDATIONS)
+        else:
             # Get user preferences
             preferences = await self._analyze_user_preferences(user_movies)
             
             # Generate recommendations using AI
             recommendations = await self._generate_ai_recommendations(
-                user_movies, preferences, count
+                user_movies, preferences, MAX_MOVIE_RECOMMENDATIONS, user_id
             )
-            
-            return recommendations
-            
-        except Exception as e:
-            logger.error(f"Error getting recommendations: {e}")
-            return []
+            if not recommendations:
+                # Raising keeps a failed generation out of the cache
+                raise RuntimeError("AI returned no recommendations")
+        
+        return [recommendation.to_dict() for recommendation in recommendations]
     
     async def get_user_stats(self, user_id: int) -> MovieStats:
-        """Get user movie statistics"""
+        """Get user movie statistics (one read of the materialized movie_stats document)"""
         try:
-            collection = db_manager.get_collection(COLLECTION_MOVIES)
-            
-            # Aggregation pipeline for stats
-            pipeline = [
-                {"$match": {"user_id": user_id}},
-                {
-                    "$group": {
-                        "_id": None,
-                        "total_movies": {
-                            "$sum": {"$cond": [{"$eq": ["$is_series", False]}, 1, 0]}
-                        },
-                        "total_series": {
-                            "$sum": {"$cond": [{"$eq": ["$is_series", True]}, 1, 0]}
-                        },
-                        "average_rating": {"$avg": "$rating"},
-                        "total_watch_time": {"$sum": {"$ifNull": ["$duration", 120]}},
-                        "genres": {"$push": "$genre"},
-                        "directors": {"$push": "$director"},
-                        "highest_rated": {"$max": "$rating"},
-                        "lowest_rated": {"$min": "$rating"}
-                    }
-                }
-            ]
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIE_STATS)
+            document = await collection.find_one({"user_id": user_id})
             
-            result = list(collection.aggregate(pipeline))
+            if document is None or document.get("dirty"):
+                # Users from before movie_stats existed get it built once, and a
+                # save that could not update it marks it for a rebuild
+                document = await self.rebuild_user_stats(user_id)
             
-            if result:
-                stats_data = result[0]
-                
-                # Flatten and count genres
-                all_genres = []
-                for genre_list in stats_data.get("genres", []):
-                    if isinstance(genre_list, list):
-                        all_genres.extend(genre_list)
-                
-                # Count genre frequency
-                genre_counts = {}
-                for genre in all_genres:
-                    if genre:
-                        genre_counts[genre] = genre_counts.get(genre, 0) + 1
-                
-                # Get top genres
-                favorite_genres = sorted(
-                    genre_counts.items(), 
-                    key=lambda x: x[1], 
-                    reverse=True
-                )[:5]
-                
-                # Count movies this month/year
-                now = datetime.now()
-                this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                this_year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-                
-                movies_this_month = collection.count_documents({
-                    "user_id": user_id,
-                    "watch_date": {"$gte": this_month_start}
-                })
-                
-                movies_this_year = collection.count_documents({
-                    "user_id": user_id,
-                    "watch_date": {"$gte": this_year_start}
-                })
-                
-                # Find highest/lowest rated movies
-                highest_movie = collection.find_one({
-                    "user_id": user_id,
-                    "rating": stats_data["highest_rated"]
-                })
-                
-                lowest_movie = collection.find_one({
-                    "user_id": user_id,
-                    "rating": stats_data["lowest_rated"]
-                })
-                
-                return MovieStats(
-                    user_id=user_id,
-                    total_movies=stats_data.get("total_movies", 0),
-                    total_series=stats_data.get("total_series", 0),
-                    total_watch_time=stats_data.get("total_watch_time", 0),
-                    average_rating=round(stats_data.get("average_rating", 0), 1),
-                    favorite_genres=[genre for genre, count in favorite_genres],
-                    movies_this_month=movies_this_month,
-                    movies_this_year=movies_this_year,
-                    highest_rated_movie=highest_movie.get("title") if highest_movie else None,
-                    lowest_rated_movie=lowest_movie.get("title") if lowest_movie else None
-                )
-            else:
-                return MovieStats(user_id=user_id)
+            return self._stats_from_document(user_id, document)
                 
         except Exception as e:
             logger.error(f"Error getting movie stats: {e}")
             return MovieStats(user_id=user_id)
     
-    async def _extract_movie_info(self, title: str, is_series: bool) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _stats_from_document(user_id: int, document: Dict[str, Any]) -> MovieStats:
+        """MovieStats view of a movie_stats document"""
+        def top(counts: Dict[str, int]) -> List[str]:
+            ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:5]
+            return [_decode_stats_key(key) for key, count in ranked if count > 0]
+        
+        # Month and year counters are resolved against the current date here,
+        # so they never go stale between saves
+        now = datetime.now()
+        rating_count = document.get("rating_count", 0)
+        highest = document.get("highest") or {}
+        lowest = document.get("lowest") or {}
+        
+        return MovieStats(
+            user_id=user_id,
+            total_movies=document.get("total_movies", 0),
+            total_series=document.get("total_series", 0),
+            total_watch_time=document.get("total_watch_time", 0),
+            average_rating=round(document.get("rating_sum", 0) / rating_count, 1) if rating_count else 0.0,
+            favorite_genres=top(document.get("genre_counts", {})),
+            favorite_directors=top(document.get("director_counts", {})),
+            movies_this_month=document.get("month_counts", {}).get(now.strftime("%Y-%m"), 0),
+            movies_this_year=document.get("year_counts", {}).get(now.strftime("%Y"), 0),
+            highest_rated_movie=highest.get("title"),
+            lowest_rated_movie=lowest.get("title"),
+            last_updated=document.get("last_updated", now)
+        )
+    
+    @staticmethod
+    def _stats_increments(movie: Dict[str, Any]) -> Dict[str, Any]:
+        """$inc of one movie in the movie_stats document"""
+        increments = {
+            "total_series" if movie.get("is_series") else "total_movies": 1,
+            "total_watch_time": _as_number(movie.get("duration")) or 120,
+            "rating_sum": _as_number(movie.get("rating")) or 0,
+            "rating_count": 1
+        }
+        for genre in _genre_list(movie.get("genre")):
+            key = f"genre_counts.{_encode_stats_key(genre)}"
+            increments[key] = increments.get(key, 0) + 1
+        director = movie.get("director")
+        if isinstance(director, str) and director.strip():
+            increments[f"director_counts.{_encode_stats_key(director.strip())}"] = 1
+        
+        watch_date = movie.get("watch_date")
+        if watch_date:
+            increments[f"month_counts.{watch_date.strftime('%Y-%m')}"] = 1
+            increments[f"year_counts.{watch_date.strftime('%Y')}"] = 1
+        return increments
+    
+    async def rebuild_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """
+        Recompute the movie_stats document of a user from the movies collection
+
+        The result replaces the stored document only if its revision did not
+        change during the scan. Saves bump the revision before inserting the
+        movie and apply their increment only to that revision, so a save that
+        overlaps a rebuild either fails the rebuild's replace or finds the
+        document replaced and marks it dirty; it is never counted twice.
+        """
+        stats = await db_manager.get_collection_async(COLLECTION_MOVIE_STATS)
+        current = await stats.find_one({"user_id": user_id}, {"revision": 1})
+        revision = current.get("revision") if current else None
+        
+        movies = await db_manager.get_collection_async(COLLECTION_MOVIES)
+        projection = {
+            "_id": 0, "title": 1, "rating": 1, "is_series": 1, "duration": 1,
+            "genre": 1, "director": 1, "watch_date": 1
+        }
+        
+        document: Dict[str, Any] = {"user_id": user_id}
+        async for movie in movies.find({"user_id": user_id}, projection):
+            for path, amount in self._stats_increments(movie).items():
+                target = document
+                *parents, name = path.split(".")
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                target[name] = target.get(name, 0) + amount
+            
+            # Same order as $max/$min on the embedded {rating, title} document
+            ranked = {"rating": _as_number(movie.get("rating")) or 0, "title": movie.get("title") or ""}
+            rank = (ranked["rating"], ranked["title"])
+            if "highest" not in document or rank > tuple(document["highest"].values()):
+                document["highest"] = ranked
+            if "lowest" not in document or rank < tuple(document["lowest"].values()):
+                document["lowest"] = ranked
+        
+        document["last_updated"] = datetime.now()
+        document["revision"] = (revision or 0) + 1
+        
+        try:
+            await stats.replace_one({"user_id": user_id, "revision": revision}, document, upsert=True)
+        except DuplicateKeyError:
+            # A save (or another rebuild) got there first; its document stays
+            logger.info(f"Movie stats of user {user_id} changed during rebuild, not replaced")
+        return document
+    
+    async def _extract_movie_info(self, title: str, is_series: bool,
+                                  user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """Extract movie information using AI"""
         try:
             media_type = "сериал" if is_series else "фильм"
@@ -253,14 +334,19 @@ class MovieExpertService:
 Отвечай ТОЛЬКО JSON без дополнительного текста.
 """
             
-            response = self.client.chat.completions.create(
+            content = await llm_gateway.complete(
                 model=settings.OPENAI_MODEL_FALLBACK,  # Use cheaper model for this
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=200,
-                temperature=0.3
+                temperature=0.3,
+                lane=LANE_BACKGROUND,  # Enrichment, the movie is saved either way
+                user_id=user_id,
+                cache=True,
+                # A reply that doesn't parse would otherwise be served for the whole TTL
+                validate=lambda text: parse_json_response(text) is not None
             )
             
-            return parse_json_response(response.choices[0].message.content)
+            return parse_json_response(content)
             
         except Exception as e:
             logger.error(f"Error extracting movie info: {e}")
@@ -307,7 +393,8 @@ class MovieExpertService:
             return {}
     
     async def _generate_ai_recommendations(
-        self, user_movies: List[MovieEntry], preferences: Dict[str, Any], count: int
+        self, user_movies: List[MovieEntry], preferences: Dict[str, Any], count: int,
+        user_id: Optional[int] = None
     ) -> List[MovieRecommendation]:
         """Generate AI-powered recommendations"""
         try:
@@ -358,14 +445,16 @@ class MovieExpertService:
 5. Отвечай ТОЛЬКО JSON
 """
             
-            response = self.client.chat.completions.create(
+            content = await llm_gateway.complete(
                 model=settings.OPENAI_MODEL_DEFAULT,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=1500,
-                temperature=0.7
+                temperature=0.7,
+                lane=LANE_INTERACTIVE,
+                user_id=user_id
             )
             
-            ai_response = parse_json_response(response.choices[0].message.content)
+            ai_response = parse_json_response(content)
             
             if not ai_response or "recommendations" not in ai_response:
                 return []
@@ -442,28 +531,93 @@ class MovieExpertService:
         
         return recommendations
     
-    async def _update_user_stats(self, user_id: int) -> None:
-        """Update user statistics after adding a movie"""
+    async def _reserve_stats_update(self, user_id: int) -> Optional[int]:
+        """
+        Bump the movie_stats revision ahead of a save; returns the new revision
+
+        A user without stats gets a dirty document, built on the next read.
+        """
         try:
-            # This could trigger recalculation of user stats
-            # For now, we'll just log it
-            logger.info(f"Stats updated for user {user_id}")
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIE_STATS)
+            document = await collection.find_one_and_update(
+                {"user_id": user_id},
+                {"$inc": {"revision": 1}, "$setOnInsert": {"dirty": True}},
+                projection={"revision": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return document["revision"]
+        except Exception as e:
+            logger.error(f"Error reserving movie stats update: {e}")
+            return None
+    
+    async def _update_user_stats(self, movie_entry: MovieEntry, revision: Optional[int]) -> None:
+        """
+        Add a saved movie to the user's movie_stats document (one atomic update)
+
+        The update applies only if the document still has the revision
+        reserved before the movie was inserted. Otherwise a rebuild (which may
+        already count the movie) or another save came in between, and the
+        document is marked dirty instead of risking a double count.
+        """
+        user_id = movie_entry.user_id
+        try:
+            movie = movie_entry.to_dict()
+            ranked = {"rating": _as_number(movie_entry.rating) or 0, "title": movie_entry.title}
+            
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIE_STATS)
+            result = None if revision is None else await collection.update_one(
+                {"user_id": user_id, "revision": revision},
+                {
+                    "$inc": {**self._stats_increments(movie), "revision": 1},
+                    # Embedded documents compare by rating first, so $max/$min keep the title
+                    "$max": {"highest": ranked},
+                    "$min": {"lowest": ranked},
+                    "$set": {"last_updated": datetime.now()}
+                }
+            )
+            if result and result.matched_count:
+                return
         except Exception as e:
             logger.error(f"Error updating user stats: {e}")
+        
+        # The stats changed meanwhile, or this movie is missing from them: the
+        # next read rebuilds them from movies (the new movie is already saved)
+        try:
+            collection = await db_manager.get_collection_async(COLLECTION_MOVIE_STATS)
+            await collection.update_one(
+                {"user_id": user_id},
+                {"$set": {"dirty": True}, "$inc": {"revision": 1}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error marking movie stats of user {user_id} for rebuild: {e}")
 
 class MovieAIService:
     """AI service for movie-related conversations"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
         self.movie_service = MovieExpertService()
     
     async def process_movie_message(self, user_id: int, message: str) -> str:
         """Process movie-related message and potentially save movie"""
+        return "".join([delta async for delta in self.stream_movie_message(user_id, message)])
+    
+    async def stream_movie_message(self, user_id: int, message: str,
+                                   envelope: Optional[MessageEnvelope] = None) -> AsyncIterator[str]:
+        """process_movie_message, with the conversational answer yielded as it is generated"""
+        streamed = False
         try:
+            if envelope is None:
+                envelope = message_router.build_envelope(message)
+            
+            # Rule order in MOVIE_MESSAGE_INTENTS puts a report before a
+            # recommendation request
+            intent = message_router.resolve("movie_message", envelope)
+            
             # Check if user is reporting a watched movie
-            if await self._is_movie_report(message):
-                movie_info = await self._extract_movie_from_message(message)
+            if intent == "movie_report":
+                movie_info = await self._extract_movie_from_message(message, user_id)
                 
                 if movie_info:
                     # Save the movie
@@ -476,12 +630,14 @@ class MovieAIService:
                     )
                     
                     if success:
-                        return f"✅ Фильм '{movie_info['title']}' сохранен с оценкой {movie_info['rating']}/10!"
+                        yield f"✅ Фильм '{movie_info['title']}' сохранен с оценкой {movie_info['rating']}/10!"
                     else:
-                        return "❌ Не удалось сохранить фильм"
+                        yield "❌ Не удалось сохранить фильм"
+                else:
+                    yield "❌ Не удалось распознать фильм в сообщении"
             
             # Check if user is asking for recommendations
-            elif await self._is_recommendation_request(message):
+            elif intent == "recommendation_request":
                 recommendations = await self.movie_service.get_recommendations(user_id, 3)
                 
                 if recommendations:
@@ -494,40 +650,24 @@ class MovieAIService:
                         response += f"📝 {rec.description}\n"
                         response += f"💡 {rec.reason}\n\n"
                     
-                    return response
+                    yield response
                 else:
-                    return "🤷‍♂️ Пока не хватает данных для рекомендаций. Добавьте несколько фильмов!"
+                    yield "🤷‍♂️ Пока не хватает данных для рекомендаций. Добавьте несколько фильмов!"
             
             # General movie conversation
             else:
                 user_movies = await self.movie_service.get_user_movies(user_id, 10)
-                return await self._generate_movie_response(message, user_movies)
+                async for delta in self._stream_movie_response(message, user_movies, user_id):
+                    streamed = True
+                    yield delta
         
         except Exception as e:
             logger.error(f"Error processing movie message: {e}")
-            return "❌ Произошла ошибка при обработке сообщения о фильмах"
+            if not streamed:
+                yield "❌ Произошла ошибка при обработке сообщения о фильмах"
     
-    async def _is_movie_report(self, message: str) -> bool:
-        """Check if message is a movie watching report"""
-        movie_indicators = [
-            "посмотрел", "посмотрела", "смотрел", "смотрела",
-            "оценка", "оценил", "оценила", "/10", "из 10"
-        ]
-        
-        message_lower = message.lower()
-        return any(indicator in message_lower for indicator in movie_indicators)
-    
-    async def _is_recommendation_request(self, message: str) -> bool:
-        """Check if message is asking for recommendations"""
-        recommendation_indicators = [
-            "посоветуй", "рекомендации", "что посмотреть",
-            "предложи фильм", "что-нибудь интересное"
-        ]
-        
-        message_lower = message.lower()
-        return any(indicator in message_lower for indicator in recommendation_indicators)
-    
-    async def _extract_movie_from_message(self, message: str) -> Optional[Dict[str, Any]]:
+    async def _extract_movie_from_message(self, message: str,
+                                          user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """Extract movie information from user message"""
         try:
             prompt = f"""
@@ -546,21 +686,27 @@ class MovieAIService:
 Отвечай ТОЛЬКО JSON без дополнительного текста.
 """
             
-            response = self.client.chat.completions.create(
+            content = await llm_gateway.complete(
                 model=settings.OPENAI_MODEL_FALLBACK,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=300,
-                temperature=0.3
+                temperature=0.3,
+                lane=LANE_INTERACTIVE,
+                user_id=user_id,
+                cache=True,
+                validate=lambda text: parse_json_response(text) is not None
             )
             
-            return parse_json_response(response.choices[0].message.content)
+            return parse_json_response(content)
             
         except Exception as e:
             logger.error(f"Error extracting movie from message: {e}")
             return None
     
-    async def _generate_movie_response(self, message: str, user_movies: List[MovieEntry]) -> str:
-        """Generate conversational response about movies"""
+    async def _stream_movie_response(self, message: str, user_movies: List[MovieEntry],
+                                     user_id: Optional[int] = None) -> AsyncIterator[str]:
+        """Generate conversational response about movies, yielded as it is generated"""
+        streamed = False
         try:
             # Prepare user movie history
             movie_history = []
@@ -582,18 +728,23 @@ class MovieAIService:
 Ответ должен быть не более 500 символов.
 """
             
-            response = self.client.chat.completions.create(
+            async for delta in llm_gateway.stream(
                 model=settings.OPENAI_MODEL_DEFAULT,
                 messages=[
                     {"role": "system", "content": "Ты эксперт по фильмам и сериалам. Даёшь полезные советы о кино."},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=400,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
+                temperature=0.7,
+                lane=LANE_INTERACTIVE,
+                user_id=user_id
+            ):
+                streamed = True
+                yield delta
             
         except Exception as e:
             logger.error(f"Error generating movie response: {e}")
-            return "🎬 Интересный вопрос о кино! К сожалению, не могу сейчас дать развернутый ответ."
\ No newline at end of file
+            if streamed:
+                yield "\n\n⚠️ Ответ прервался. Попробуйте еще раз."
+            else:
+                yield "🎬 Интересный вопрос о кино! К сожалению, не могу сейчас дать развернутый ответ."
\ No newline at end of file
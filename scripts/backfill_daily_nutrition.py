@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Пересчет сводки daily_nutrition по истории food_analysis
+- Группирует анализы по (user_id, день) и записывает суммы через $set,
+  поэтому повторный запуск безопасен и исправляет расхождения
+- Анализы, сохраненные во время пересчета, могут попасть в сводку дважды
+  или не попасть: после деплоя запускайте в спокойное время или повторите
+  для затронутых пользователей (--user-id)
+
+    python scripts/backfill_daily_nutrition.py [--user-id 123] [--since 2024-01-01] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.append('/app')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pymongo import UpdateOne
+
+from config.database import db_manager
+from config.constants import COLLECTION_FOOD_ANALYSIS, COLLECTION_DAILY_NUTRITION, DAILY_NUTRITION_FIELDS
+
+BATCH_SIZE = 500
+
+def build_pipeline(user_id=None, since=None) -> list:
+    """Суммы по (user_id, день), день как в FoodAnalysisService (rollup_day)"""
+    match = {}
+    if user_id is not None:
+        match["user_id"] = user_id
+    if since is not None:
+        match["analysis_timestamp"] = {"$gte": since}
+
+    timestamp = "$analysis_timestamp"
+    group = {
+        "_id": {
+            "user_id": "$user_id",
+            "day": {"$dateFromParts": {
+                "year": {"$year": timestamp},
+                "month": {"$month": timestamp},
+                "day": {"$dayOfMonth": timestamp}
+            }}
+        },
+        "meal_count": {"$sum": 1}
+    }
+    for field in DAILY_NUTRITION_FIELDS:
+        group[field] = {"$sum": {"$ifNull": [f"$total_nutrition.{field}", 0]}}
+
+    # Projection keeps the large embedded images out of the pipeline
+    projection = {"user_id": 1, "analysis_timestamp": 1, "total_nutrition": 1}
+    return [{"$match": match}, {"$project": projection}, {"$group": group}]
+
+async def backfill(user_id=None, since=None, dry_run=False) -> int:
+    await db_manager.connect_async()
+    source = await db_manager.get_collection_async(COLLECTION_FOOD_ANALYSIS)
+    rollup = await db_manager.get_collection_async(COLLECTION_DAILY_NUTRITION)
+
+    now = datetime.now()
+    days = 0
+    batch = []
+
+    async for row in source.aggregate(build_pipeline(user_id, since), allowDiskUse=True):
+        values = {field: row[field] for field in DAILY_NUTRITION_FIELDS}
+        values.update(meal_count=row["meal_count"], updated_at=now)
+        batch.append(UpdateOne(
+            {"user_id": row["_id"]["user_id"], "day": row["_id"]["day"]},
+            {"$set": values},
+            upsert=True
+        ))
+        days += 1
+
+        if len(batch) >= BATCH_SIZE:
+            if not dry_run:
+                await rollup.bulk_write(batch, ordered=False)
+            batch = []
+            print(f"📦 {days} days processed")
+
+    if batch and not dry_run:
+        await rollup.bulk_write(batch, ordered=False)
+    return days
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="only this user")
+    parser.add_argument("--since", type=lambda value: datetime.strptime(value, "%Y-%m-%d"), help="YYYY-MM-DD")
+    parser.add_argument("--dry-run", action="store_true", help="compute without writing")
+    args = parser.parse_args()
+
+    print("🔄 ПЕРЕСЧЕТ DAILY_NUTRITION")
+    print("=" * 50)
+
+    try:
+        days = await backfill(args.user_id, args.since, args.dry_run)
+    finally:
+        db_manager.close()
+
+    action = "computed" if args.dry_run else "written"
+    print(f"✅ {days} daily rollups {action}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
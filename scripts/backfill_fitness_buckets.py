@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Перенос истории steps и workouts в месячные корзины fitness_months
+- Шаги записываются в слот дня только если он еще пуст, тренировки
+  добавляются только если их id еще нет в корзине, поэтому повторный
+  запуск безопасен и не перезаписывает данные, сохраненные после деплоя
+- Старые коллекции не изменяются, удалите их вручную после проверки
+
+    python scripts/backfill_fitness_buckets.py [--user-id 123] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime
+
+sys.path.append('/app')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config.database import db_manager
+from config.constants import COLLECTION_WORKOUTS, COLLECTION_STEPS, COLLECTION_FITNESS_MONTHS
+
+BATCH_SIZE = 500
+DUPLICATE_KEY = 11000
+
+def fitness_month(timestamp: datetime) -> datetime:
+    """Ключ корзины, как в HealthProfileService (fitness_month)"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def to_uuid(value):
+    """Как core.utils.id_to_bson: не-UUID строки остаются как есть"""
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return value
+
+def steps_operation(doc: dict) -> UpdateOne:
+    day_key = f"steps.{doc['date'].day:02d}"
+    entry = {key: value for key, value in doc.items() if key not in ("_id", "id", "user_id")}
+    return UpdateOne(
+        {"user_id": doc["user_id"], "month": fitness_month(doc["date"]), day_key: {"$exists": False}},
+        {"$set": {day_key: entry}},
+        upsert=True
+    )
+
+def workout_operation(doc: dict) -> UpdateOne:
+    entry = {key: value for key, value in doc.items() if key not in ("_id", "user_id")}
+    entry["id"] = to_uuid(doc["id"])
+    return UpdateOne(
+        {"user_id": doc["user_id"], "month": fitness_month(doc["timestamp"]), "workouts.id": {"$ne": entry["id"]}},
+        {"$push": {"workouts": entry}},
+        upsert=True
+    )
+
+async def write_batch(buckets, batch: list) -> None:
+    try:
+        await buckets.bulk_write(batch, ordered=False)
+    except BulkWriteError as e:
+        # Уже перенесенная запись не совпадает с фильтром, и upsert
+        # упирается в уникальный индекс (user_id, month): это не ошибка
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+        if errors:
+            raise
+
+async def migrate(source_name: str, make_operation, user_id=None, dry_run=False) -> int:
+    source = await db_manager.get_collection_async(source_name)
+    buckets = await db_manager.get_collection_async(COLLECTION_FITNESS_MONTHS)
+
+    query = {"user_id": user_id} if user_id is not None else {}
+    processed = 0
+    batch = []
+
+    async for doc in source.find(query):
+        batch.append(make_operation(doc))
+        processed += 1
+
+        if len(batch) >= BATCH_SIZE:
+            if not dry_run:
+                await write_batch(buckets, batch)
+            batch = []
+            print(f"📦 {source_name}: {processed} documents processed")
+
+    if batch and not dry_run:
+        await write_batch(buckets, batch)
+    return processed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="only this user")
+    parser.add_argument("--dry-run", action="store_true", help="read without writing")
+    args = parser.parse_args()
+
+    print("🔄 ПЕРЕНОС STEPS/WORKOUTS В FITNESS_MONTHS")
+    print("=" * 50)
+
+    try:
+        await db_manager.connect_async()
+        steps = await migrate(COLLECTION_STEPS, steps_operation, args.user_id, args.dry_run)
+        workouts = await migrate(COLLECTION_WORKOUTS, workout_operation, args.user_id, args.dry_run)
+    finally:
+        db_manager.close()
+
+    action = "read" if args.dry_run else "migrated"
+    print(f"✅ {steps} steps days and {workouts} workouts {action}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Перенос строковых id документов в _id (бинарный UUID, 16 байт вместо 36 символов)
+- Документы со строковым полем id копируются с _id = UUID(id) без поля id,
+  после успешной вставки старый документ удаляется; повторный запуск
+  продолжает с места остановки
+- tagged_messages.tags переводятся в бинарные UUID
+- Из вложенных food_items и слотов шагов fitness_months убираются id,
+  id тренировок переводятся в бинарные UUID
+- Уникальные индексы по полю id удаляются до переноса: у копий без id
+  они совпали бы на id: null (тот же индекс есть в OBSOLETE_INDEXES)
+- Оригинал удаляется, только если копия с новым _id найдена в коллекции
+- Запись в документ между копированием и удалением оригинала теряется:
+  запускайте после деплоя в спокойное время
+
+    python scripts/migrate_document_ids.py [--collection movies] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.append('/app')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config.database import db_manager
+from config.constants import (
+    COLLECTION_FOOD_ANALYSIS, COLLECTION_MOVIES, COLLECTION_TOPIC_SETTINGS, COLLECTION_FITNESS_MONTHS
+)
+from config.indexes import (
+    COLLECTION_SCHEDULED_MESSAGES, COLLECTION_MESSAGE_TAGS, COLLECTION_TAGGED_MESSAGES, COLLECTION_MESSAGE_FILTERS
+)
+
+BATCH_SIZE = 500
+DUPLICATE_KEY = 11000
+
+def to_uuid(value):
+    """Как core.utils.id_to_bson: не-UUID строки остаются как есть"""
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return value
+
+def compact_food_analysis(doc: dict) -> dict:
+    for item in doc.get("food_items") or []:
+        item.pop("id", None)
+    return doc
+
+def compact_tagged_message(doc: dict) -> dict:
+    doc["tags"] = [to_uuid(tag_id) for tag_id in doc.get("tags") or []]
+    return doc
+
+# Коллекции с id документа -> дополнительное сжатие документа
+ID_COLLECTIONS = {
+    COLLECTION_TOPIC_SETTINGS: None,
+    COLLECTION_SCHEDULED_MESSAGES: None,
+    COLLECTION_MESSAGE_TAGS: None,
+    COLLECTION_TAGGED_MESSAGES: compact_tagged_message,
+    COLLECTION_MESSAGE_FILTERS: None,
+    COLLECTION_FOOD_ANALYSIS: compact_food_analysis,
+    COLLECTION_MOVIES: None,
+}
+
+async def drop_id_indexes(collection, dry_run: bool) -> None:
+    """Удаляет уникальные индексы, в ключ которых входит поле id"""
+    indexes = await collection.index_information()
+    for name, info in indexes.items():
+        if not info.get("unique") or "id" not in dict(info["key"]):
+            continue
+        if dry_run:
+            print(f"⚠️ {collection.name}: index {name} would be dropped")
+        else:
+            await collection.drop_index(name)
+            print(f"🗑️ {collection.name}: index {name} dropped")
+
+async def move_batch(collection, batch: list) -> int:
+    """Вставляет копии с новым _id и удаляет оригиналы тех, чьи копии есть в коллекции"""
+    try:
+        await collection.bulk_write([InsertOne(new) for _, new in batch], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != DUPLICATE_KEY or error.get("keyPattern") != {"_id": 1}:
+                # Оригинал остается на месте, его можно перенести повторным запуском
+                print(f"❌ {collection.name}: {error.get('errmsg')}")
+
+    # Дубликат _id значит, что копия уже есть с прошлого запуска; все остальное
+    # проверяется чтением, а не по кодам ошибок
+    new_ids = [new["_id"] for _, new in batch]
+    stored = set()
+    async for doc in collection.find({"_id": {"$in": new_ids}}, {"_id": 1}):
+        stored.add(doc["_id"])
+
+    old_ids = [old_id for old_id, new in batch if new["_id"] in stored]
+    if old_ids:
+        await collection.delete_many({"_id": {"$in": old_ids}})
+    return len(old_ids)
+
+async def migrate_ids(name: str, compact, dry_run: bool) -> int:
+    collection = await db_manager.get_collection_async(name)
+    moved = 0
+    batch = []
+
+    await drop_id_indexes(collection, dry_run)
+
+    async for doc in collection.find({"id": {"$type": "string"}}):
+        old_id = doc["_id"]
+        new = dict(doc)
+        new["_id"] = to_uuid(new.pop("id"))
+        if compact:
+            new = compact(new)
+        batch.append((old_id, new))
+
+        if len(batch) >= BATCH_SIZE:
+            moved += len(batch) if dry_run else await move_batch(collection, batch)
+            batch = []
+            print(f"📦 {name}: {moved} documents moved")
+
+    if batch:
+        moved += len(batch) if dry_run else await move_batch(collection, batch)
+    return moved
+
+async def compact_fitness_buckets(dry_run: bool) -> int:
+    collection = await db_manager.get_collection_async(COLLECTION_FITNESS_MONTHS)
+    updated = 0
+    batch = []
+
+    async for doc in collection.find({}, {"workouts.id": 1, "steps": 1}):
+        changes = {}
+        for index, workout in enumerate(doc.get("workouts") or []):
+            if isinstance(workout.get("id"), str):
+                changes[f"workouts.{index}.id"] = to_uuid(workout["id"])
+        removals = {f"steps.{day}.id": "" for day, entry in (doc.get("steps") or {}).items() if "id" in entry}
+        if not changes and not removals:
+            continue
+
+        update = {}
+        if changes:
+            update["$set"] = changes
+        if removals:
+            update["$unset"] = removals
+        batch.append(UpdateOne({"_id": doc["_id"]}, update))
+        updated += 1
+
+        if len(batch) >= BATCH_SIZE:
+            if not dry_run:
+                await collection.bulk_write(batch, ordered=False)
+            batch = []
+
+    if batch and not dry_run:
+        await collection.bulk_write(batch, ordered=False)
+    return updated
+
+async def main():
+    names = list(ID_COLLECTIONS) + [COLLECTION_FITNESS_MONTHS]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=names, help="only this collection")
+    parser.add_argument("--dry-run", action="store_true", help="count without writing")
+    args = parser.parse_args()
+
+    print("🔄 ПЕРЕНОС ID В _ID")
+    print("=" * 50)
+
+    try:
+        await db_manager.connect_async()
+        for name in names:
+            if args.collection and name != args.collection:
+                continue
+            if name == COLLECTION_FITNESS_MONTHS:
+                count = await compact_fitness_buckets(args.dry_run)
+            else:
+                count = await migrate_ids(name, ID_COLLECTIONS[name], args.dry_run)
+            print(f"✅ {name}: {count} documents {'to migrate' if args.dry_run else 'migrated'}")
+    finally:
+        db_manager.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))